@@ -0,0 +1,76 @@
+"""
+Evaluations per second of `Graph.compute` on a ~5k block graph, with and
+without the cached execution plan, and when nothing has changed since the
+last evaluation (so every block's previous result is reused).
+
+Run from the repository root with `python -m benchmarks.graph_compute`.
+"""
+
+from time import perf_counter
+
+from station.node.graph import Graph, Block, Connection, IntValue, IntBlock
+from station.node.blocks import AddBlock
+
+
+def _output(block: Block) -> str:
+    return "value" if block.type is IntBlock else "result"
+
+
+def build_graph(leaves: int = 2500) -> tuple[Graph, Block]:
+    # A balanced tree of Add blocks, so every block is touched by each evaluation.
+    graph = Graph("benchmark")
+    layer: list[Block] = []
+    for idx in range(leaves):
+        block = Block(IntBlock, value=IntValue(idx))
+        graph.add_block(block)
+        layer.append(block)
+
+    while len(layer) > 1:
+        next_layer: list[Block] = []
+        for idx in range(0, len(layer) - 1, 2):
+            block = Block(AddBlock)
+            graph.add_block(block)
+            a, b = layer[idx], layer[idx + 1]
+            graph.add_connection(Connection(a.uid, _output(a), block.uid, "a"))
+            graph.add_connection(Connection(b.uid, _output(b), block.uid, "b"))
+            next_layer.append(block)
+        if len(layer) % 2:
+            next_layer.append(layer[-1])
+        layer = next_layer
+
+    return graph, layer[0]
+
+
+def measure(
+    graph: Graph,
+    target: Block,
+    cached_plan: bool,
+    cached_results: bool = False,
+    duration: float = 2.0,
+) -> float:
+    count = 0
+    start = perf_counter()
+    while (elapsed := perf_counter() - start) < duration:
+        if not cached_plan:
+            graph._plans.clear()
+        if not cached_results:
+            graph._results.clear()
+        graph.compute(target)
+        count += 1
+    return count / elapsed
+
+
+def main() -> None:
+    graph, target = build_graph()
+    print(f"blocks: {len(graph.blocks)}, connections: {len(graph.connections)}")
+
+    uncached = measure(graph, target, cached_plan=False)
+    cached = measure(graph, target, cached_plan=True)
+    unchanged = measure(graph, target, cached_plan=True, cached_results=True)
+    print(f"rebuilt plan: {uncached:8.1f} evals/s")
+    print(f"cached plan:  {cached:8.1f} evals/s ({cached / uncached:.2f}x)")
+    print(f"unchanged:    {unchanged:8.1f} evals/s ({unchanged / uncached:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
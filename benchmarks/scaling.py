@@ -0,0 +1,202 @@
+"""
+How building, evaluating, writing and reading a graph scale with its size.
+
+Synthetic graphs are generated from the real block registry in three shapes:
+deep chains, wide fan-in trees, and random DAGs, from 100 to 50k blocks. Only
+numeric block types which never fail (whatever finite, infinite or nan values
+they're given) are used, so every evaluation runs the whole graph.
+
+The results are written as JSON so runs from different commits can be diffed.
+
+Run from the repository root with `python -m benchmarks.scaling`, see
+`--help` for picking the sizes, shapes and where the results go.
+"""
+
+import json
+import platform
+import random
+from argparse import ArgumentParser
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any, Callable, Sequence
+
+from station.node.graph import (
+    Graph,
+    Block,
+    BlockType,
+    Connection,
+    FloatValue,
+    IntValue,
+    FloatBlock,
+    read_graph,
+    write_graph,
+)
+from station.node import blocks  # noqa: F401 -- importing sets up the blocks
+
+SIZES = (100, 1_000, 10_000, 50_000)
+PROBES = (0.0, 1.5, -2.5, float("inf"), float("-inf"), float("nan"))
+
+
+def _is_total(typ: BlockType) -> bool:
+    if typ.exclusive or typ.config or not typ.inputs:
+        return False
+    if any(value not in (FloatValue, IntValue) for value in typ.inputs.values()):
+        return False
+    for probe in PROBES:
+        try:
+            result = typ.operation(**{name: FloatValue(probe) for name in typ.inputs})
+        except Exception:  # noqa: BLE001 -- anything that can fail is left out
+            return False
+        if not all(isinstance(value, (FloatValue, IntValue)) for value in result.values()):
+            return False
+    return True
+
+
+def numeric_types() -> tuple[BlockType, ...]:
+    """Every registered block type which is safe to wire up at random."""
+    return tuple(
+        typ for typ in BlockType.__definitions__.values() if _is_total(typ)
+    )
+
+
+class Builder:
+    """Adds blocks to a graph, remembering which output of each to connect from."""
+
+    def __init__(self, seed: int) -> None:
+        self.graph = Graph("benchmark", sandbox=True)
+        self.random = random.Random(seed)
+        self.types = numeric_types()
+        self._outputs: dict[Block, str] = {}
+
+    def leaf(self) -> Block:
+        block = Block(FloatBlock, value=FloatValue(self.random.uniform(-1.0, 1.0)))
+        self.graph.add_block(block)
+        self._outputs[block] = "value"
+        return block
+
+    def block(self, typ: BlockType, sources: Sequence[Block]) -> Block:
+        block = Block(typ)
+        self.graph.add_block(block)
+        self._outputs[block] = next(iter(typ.outputs))
+        for name, source in zip(typ.inputs, sources):
+            self.graph.add_connection(
+                Connection(source.uid, self._outputs[source], block.uid, name)
+            )
+        return block
+
+
+def chain(size: int, seed: int) -> tuple[Graph, Block]:
+    """Every block feeds the next, with any extra inputs taken from one shared leaf."""
+    builder = Builder(seed)
+    leaf = previous = builder.leaf()
+    for _ in range(size - 1):
+        typ = builder.random.choice(builder.types)
+        previous = builder.block(typ, [previous] + [leaf] * (len(typ.inputs) - 1))
+    return builder.graph, previous
+
+
+def tree(size: int, seed: int) -> tuple[Graph, Block]:
+    """Half the blocks are leaves, merged level by level into a single root."""
+    builder = Builder(seed)
+    types = [typ for typ in builder.types if len(typ.inputs) > 1]
+    layer = [builder.leaf() for _ in range(size // 2 + 1)]
+    while len(layer) > 1:
+        next_layer: list[Block] = []
+        while layer:
+            typ = builder.random.choice(types)
+            arity = len(typ.inputs)
+            if len(layer) < arity:
+                next_layer.extend(layer)
+                break
+            next_layer.append(builder.block(typ, layer[:arity]))
+            layer = layer[arity:]
+        layer = next_layer
+    return builder.graph, layer[0]
+
+
+def dag(size: int, seed: int) -> tuple[Graph, Block]:
+    """Every block takes its inputs from random earlier blocks, favouring recent ones."""
+    builder = Builder(seed)
+    placed = [builder.leaf() for _ in range(max(2, size // 10))]
+    while len(placed) < size:
+        typ = builder.random.choice(builder.types)
+        sources = [
+            placed[-1 - min(int(builder.random.expovariate(0.05)), len(placed) - 1)]
+            for _ in typ.inputs
+        ]
+        placed.append(builder.block(typ, sources))
+    return builder.graph, placed[-1]
+
+
+SHAPES: dict[str, Callable[[int, int], tuple[Graph, Block]]] = {
+    "chain": chain,
+    "tree": tree,
+    "dag": dag,
+}
+
+
+def measure(shape: str, size: int, seed: int = 0) -> dict[str, Any]:
+    start = perf_counter()
+    graph, target = SHAPES[shape](size, seed)
+    build = perf_counter() - start
+
+    start = perf_counter()
+    computation = graph.compute(target)
+    evaluate = perf_counter() - start
+
+    start = perf_counter()
+    graph.compute(target)
+    unchanged = perf_counter() - start
+
+    with TemporaryDirectory() as directory:
+        path = Path(directory) / "benchmark.blk"
+        start = perf_counter()
+        write_graph(path, graph)
+        write = perf_counter() - start
+
+        start = perf_counter()
+        read_graph(path, sandbox=True)
+        read = perf_counter() - start
+
+    return {
+        "shape": shape,
+        "blocks": len(graph.blocks),
+        "connections": len(graph.connections),
+        "plan": len(graph.get_plan(target)),
+        "failed": computation.exception is not None,
+        "build": build,
+        "evaluate": evaluate,
+        "unchanged": unchanged,
+        "write": write,
+        "read": read,
+    }
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = ArgumentParser(prog="python -m benchmarks.scaling", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--shapes", nargs="+", choices=tuple(SHAPES), default=tuple(SHAPES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None, help="write the JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    results: list[dict[str, Any]] = []
+    for shape in args.shapes:
+        for size in args.sizes:
+            results.append(measure(shape, size, args.seed))
+
+    report = {
+        "python": platform.python_version(),
+        "types": [typ.name for typ in numeric_types()],
+        "results": results,
+    }
+    if args.output is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.output, "w", encoding="utf-8") as fp:
+            json.dump(report, fp, indent=2)
+
+
+if __name__ == "__main__":
+    main()
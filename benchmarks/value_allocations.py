@@ -0,0 +1,228 @@
+"""
+How many Values are constructed, and how many of those actually allocate a
+new object rather than returning an interned constant, for each evaluation of
+a solution to the shipped puzzles.
+
+The repository doesn't ship puzzle solutions, so a reference solution for
+each puzzle is built here using only the blocks the puzzle makes available.
+The test cases are read straight from the `.pzl` files (without going through
+`station.puzzle`, which needs a window).
+
+Run from the repository root with `python -m benchmarks.value_allocations`.
+"""
+
+from pathlib import Path
+from sys import getsizeof
+from time import perf_counter
+from tomllib import load
+from typing import Callable
+
+from station.node.graph import (
+    Graph,
+    Block,
+    BlockType,
+    Connection,
+    TestCase,
+    Value,
+    IntValue,
+    FloatValue,
+    StrValue,
+    BoolValue,
+    IntBlock,
+    FloatBlock,
+    STR_CAST,
+    INT_ZERO,
+    INT_ONE,
+    FLOAT_ZERO,
+    FLOAT_ONE,
+    STR_EMPTY,
+    TRUE,
+    FALSE,
+    _variable,
+)
+from station.node import blocks
+
+PUZZLES = Path(__file__).parent.parent / "resources" / "puzzles"
+INTERNED = {id(value) for value in (INT_ZERO, INT_ONE, FLOAT_ZERO, FLOAT_ONE, STR_EMPTY, TRUE, FALSE)}
+
+
+class Solution:
+    """A puzzle graph with its input and output blocks, and a few helpers to wire it up."""
+
+    def __init__(self, name: str) -> None:
+        with open(PUZZLES / f"{name}.pzl", "rb") as fp:
+            raw_data = load(fp)
+
+        inputs = {name: STR_CAST[typ] for name, typ in raw_data["Inputs"].items()}
+        outputs = {name: STR_CAST[typ] for name, typ in raw_data["Outputs"].items()}
+        self.cases: tuple[TestCase, ...] = tuple(
+            TestCase(
+                {name: inputs[name](value) for name, value in case["inputs"].items()},
+                {name: outputs[name](value) for name, value in case["outputs"].items()},
+            )
+            for case in raw_data.get("Tests", ())
+        )
+
+        self.graph = Graph(name)
+        self.input = self.block(
+            BlockType("Input", _variable, config=inputs.copy(), outputs=inputs.copy(), exclusive=True)
+        )
+        self.output = self.block(BlockType("Output", _variable, inputs=outputs.copy(), exclusive=True))
+
+    def block(self, typ: BlockType, **config: Value) -> Block:
+        block = Block(typ, **config)  # type: ignore -- reportArgumentType
+        self.graph.add_block(block)
+        return block
+
+    def connect(self, source: Block, output: str, target: Block, input: str) -> None:
+        self.graph.add_connection(Connection(source.uid, output, target.uid, input))
+
+    def op(self, typ: BlockType, **inputs: tuple[Block, str]) -> Block:
+        block = self.block(typ)
+        for name, (source, output) in inputs.items():
+            self.connect(source, output, block, name)
+        return block
+
+    def int(self, value: int) -> tuple[Block, str]:
+        return self.block(IntBlock, value=IntValue(value)), "value"
+
+    def float(self, value: float) -> tuple[Block, str]:
+        return self.block(FloatBlock, value=FloatValue(value)), "value"
+
+
+def connect_mainbus() -> Solution:
+    s = Solution("connect_mainbus")
+    for name in s.output.inputs:
+        s.connect(s.input, name, s.output, name)
+    return s
+
+
+def f_to_k() -> Solution:
+    s = Solution("f_to_k")
+    offset = s.op(blocks.SubBlock, a=(s.input, "fahrenheit"), b=s.float(32.0))
+    scaled = s.op(blocks.MulBlock, a=(offset, "result"), b=s.float(5.0))
+    celsius = s.op(blocks.DivBlock, a=(scaled, "result"), b=s.float(9.0))
+    kelvin = s.op(blocks.AddBlock, a=(celsius, "result"), b=s.float(273.15))
+    s.connect(celsius, "result", s.output, "celsius")
+    s.connect(kelvin, "result", s.output, "kelvin")
+    return s
+
+
+def ac() -> Solution:
+    s = Solution("ac")
+    above = s.op(blocks.SubBlock, a=(s.input, "temp"), b=s.float(22.0))
+    power = s.op(blocks.MulBlock, a=(above, "result"), b=s.float(12.5))
+    floor = s.op(blocks.MaxBlock, a=(power, "result"), b=s.float(0.0))
+    capped = s.op(blocks.MinBlock, a=(floor, "result"), b=s.float(100.0))
+    s.connect(capped, "result", s.output, "power")
+    return s
+
+
+def route_power() -> Solution:
+    s = Solution("route_power")
+    remainder = s.op(blocks.ModBlock, value=(s.input, "device_id"), mod=s.int(16))
+    terminal = s.op(blocks.AddBlock, a=(remainder, "result"), b=s.int(1))
+    scaled = s.op(blocks.MulBlock, a=(terminal, "result"), b=s.int(10))
+    s.connect(scaled, "result", s.output, "terminal_id")
+    return s
+
+
+def airlock() -> Solution:
+    # The doors repeat every eight stages: A at 1 and 7, B at 3 and 5.
+    s = Solution("airlock")
+    stage = s.op(blocks.ModBlock, value=(s.input, "stage"), mod=s.int(8))
+    for door, (first, second) in (("door_a", (1, 7)), ("door_b", (3, 5))):
+        a = s.op(blocks.EqBlock, a=(stage, "result"), b=s.int(first))
+        b = s.op(blocks.EqBlock, a=(stage, "result"), b=s.int(second))
+        s.connect(s.op(blocks.OrBlock, a=(a, "result"), b=(b, "result")), "result", s.output, door)
+    return s
+
+
+def signal_validation() -> Solution:
+    s = Solution("signal_validation")
+    flags = s.op(blocks.FlagBlock, value=(s.input, "input"))
+    total: tuple[Block, str] = s.int(0)
+    for bit in range(8):
+        count = s.op(blocks.CastIntBLock, value=(flags, f"bit_{bit}"))
+        total = s.op(blocks.AddBlock, a=total, b=(count, "result")), "result"
+    five = s.op(blocks.EqBlock, a=total, b=s.int(5))
+    byte = s.op(blocks.LtBlock, a=(s.input, "input"), b=s.int(256))
+    leading = s.op(blocks.AndBlock, a=(flags, "bit_7"), b=(five, "result"))
+    valid = s.op(blocks.AndBlock, a=(leading, "result"), b=(byte, "result"))
+    s.connect(valid, "result", s.output, "valid")
+    return s
+
+
+SOLUTIONS: tuple[Callable[[], Solution], ...] = (
+    connect_mainbus,
+    f_to_k,
+    ac,
+    route_power,
+    airlock,
+    signal_validation,
+)
+
+
+class Counter:
+    """Wraps each Value constructor to count constructions and real allocations."""
+
+    def __init__(self) -> None:
+        self.constructed: int = 0
+        self.allocated: int = 0
+        self._originals: dict[type[Value], Callable[..., Value]] = {}
+
+    def __enter__(self) -> "Counter":
+        for cls in (IntValue, FloatValue, StrValue, BoolValue):
+            original = self._originals[cls] = cls.__new__
+
+            def counted(cls: type[Value], *args: object, _original=original) -> Value:
+                value = _original(cls, *args)
+                self.constructed += 1
+                self.allocated += id(value) not in INTERNED
+                return value
+
+            cls.__new__ = staticmethod(counted)  # type: ignore -- reportAttributeAccessIssue
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        for cls, original in self._originals.items():
+            cls.__new__ = staticmethod(original)  # type: ignore -- reportAttributeAccessIssue
+        self._originals.clear()
+
+
+def evaluate(solution: Solution, case: TestCase) -> bool:
+    solution.input.config.update(case.inputs)
+    solution.graph._results.clear()  # Evaluate every block, not just the changed ones.
+    computation = solution.graph.compute(solution.output)
+    return TestCase(case.inputs, dict(computation.inputs)) == case
+
+
+def measure(solution: Solution, duration: float = 0.5) -> float:
+    count = 0
+    start = perf_counter()
+    while (elapsed := perf_counter() - start) < duration:
+        for case in solution.cases:
+            evaluate(solution, case)
+            count += 1
+    return elapsed / count
+
+
+def main() -> None:
+    print(f"bytes per value: {getsizeof(IntValue(12345))}")
+    print(f"{'puzzle':<20}{'passed':>8}{'values/eval':>13}{'allocs/eval':>13}{'us/eval':>10}")
+    for build in SOLUTIONS:
+        solution = build()
+        with Counter() as counter:
+            passed = sum(evaluate(solution, case) for case in solution.cases)
+        evaluations = len(solution.cases)
+        print(
+            f"{solution.graph.name:<20}"
+            f"{f'{passed}/{evaluations}':>8}"
+            f"{counter.constructed / evaluations:>13.1f}"
+            f"{counter.allocated / evaluations:>13.1f}"
+            f"{measure(solution) * 1e6:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -14,7 +14,11 @@
 #   nuitka-project: --windows-console-mode=disable
 #   nuitka-project: --windows-icon-from-ico=icon.ico
 
+from multiprocessing import freeze_support
+
 from station.main import main
 
 if __name__ == "__main__":
+    # Puzzle tests are graded in worker processes, which need this when frozen.
+    freeze_support()
     main()
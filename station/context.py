@@ -15,6 +15,7 @@ from tomlkit import dumps as dumps_toml
 
 from station.puzzle import Puzzle, puzzles
 from station.controller import GraphController, write_graph_from_level, write_graph
+from station.node.cache import ResultCache
 
 from resources import style
 
@@ -285,6 +286,9 @@ class Context:
             save_data = SaveInfo(save)
             self._saves[save_data.name] = save_data
 
+        # Test case results shared by every save, as they only depend on the graph.
+        self.results: ResultCache = ResultCache(self._save_path / "cache")
+
         self._current_save: SaveData | None = None
 
         self._frame_controller: FrameController | None = None
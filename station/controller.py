@@ -15,6 +15,8 @@ from station.node.graph import (
     BLOCK_CAST,
     STR_CAST,
     _variable,
+    _build_subgraphs,
+    _parse_subgraphs,
 )
 from station.node import blocks as block_impl
 from station.puzzle import Puzzle
@@ -121,6 +123,9 @@ class GraphController:
         self._block_elements.pop(block.uid)
 
     def add_connection(self, connection: ConnectionElement) -> None:
+        # Check before linking so a rejected connection never reaches the gui.
+        if self._graph.creates_cycle(connection.connection.source, connection.connection.target):
+            raise ValueError(f"Connection {connection.uid} would create a cycle")
         self._link_connection(connection)
         self._graph.add_connection(connection.connection)
 
@@ -207,8 +212,9 @@ def read_graph(path: Path, gui: Gui, sandbox: bool = False) -> GraphController:
         gui, config_table.get("name", "graph"), sandbox=sandbox
     )
 
-    variable_types: dict[str, BlockType] = {}
-    for variable in block_table.get("Variable", []):
+    variable_types: dict[str, BlockType] = _parse_subgraphs(block_table)
+    # Graphs have always been written with "Variables", but were read as "Variable".
+    for variable in block_table.get("Variables", block_table.get("Variable", [])):
         inputs = {name: STR_CAST[typ] for name, typ in variable["inputs"].items()}
         outputs = {name: STR_CAST[typ] for name, typ in variable["outputs"].items()}
         config = outputs.copy()
@@ -234,7 +240,7 @@ def read_graph(path: Path, gui: Gui, sandbox: bool = False) -> GraphController:
             for name, value in block.get("config", {}).items()
         }
 
-        graph_block = Block(block_type, uid, *config)
+        graph_block = Block(block_type, uid, **config)
         element = BlockElement(graph_block)
         element.update_position(block.get("position", (0.0, 0.0)))
         controller.add_block(element, add_temp=False)
@@ -371,7 +377,7 @@ def write_graph(controller: GraphController, path: Path) -> None:
 
         blocks.append(subtable)  # type: ignore -- unknownMemberType
 
-        if block.type.exclusive:
+        if block.type.exclusive and block.type.subgraph is None and block.type.loop is None:
             type_table = table()
             input_table = inline_table()
             input_table.update(  # type: ignore -- unknownMemberType
@@ -392,6 +398,9 @@ def write_graph(controller: GraphController, path: Path) -> None:
             type_table["outputs"] = output_table
             variables.append(type_table)  # type: ignore -- unknownMemberType
 
+    subgraphs = _build_subgraphs(graph.blocks)
+    if subgraphs:
+        block_table["SubGraphs"] = subgraphs
     block_table["Variables"] = variables
     block_table["Data"] = blocks
     toml["Block"] = block_table
@@ -453,7 +462,7 @@ def write_graph_from_level(
 
         blocks.append(subtable)  # type: ignore -- unknownMemberType
 
-        if block.type.exclusive:
+        if block.type.exclusive and block.type.subgraph is None and block.type.loop is None:
             type_table = table()
             input_table = inline_table()
             input_table.update(  # type: ignore -- unknownMemberType
@@ -474,6 +483,9 @@ def write_graph_from_level(
             type_table["outputs"] = output_table
             variables.append(type_table)  # type: ignore -- unknownMemberType
 
+    subgraphs = _build_subgraphs(graph.blocks)
+    if subgraphs:
+        block_table["SubGraphs"] = subgraphs
     block_table["Variables"] = variables
     block_table["Data"] = blocks
     toml["Block"] = block_table
@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 from uuid import UUID
 from typing import Callable, Any
 
@@ -120,9 +122,27 @@ class SelectionPopup(Popup):
         top: bool = False,
         right: bool = False,
         uid: UUID | None = None,
+        headings: dict[str, str] | None = None,
     ):
+        # Rows are laid out from the bottom up, each heading going directly
+        # above the action it's keyed by.
+        headings = headings or {}
 
         self.actions = {action.name: action for action in actions}
+        self._heading_text = {
+            name: Text(
+                heading,
+                0.0,
+                0.0,
+                style.colors.highlight,
+                style.text.sizes.normal,
+                anchor_y="bottom",
+                font_name=style.text.names.monospace,
+                group=OVERLAY_HIGHLIGHT,
+            )
+            for name, heading in headings.items()
+            if name in self.actions
+        }
         self._action_text = {
             name: Text(
                 name,
@@ -137,8 +157,9 @@ class SelectionPopup(Popup):
             for name in self.actions
         }
 
-        text_width = max(text.content_width for text in self._action_text.values())
-        text_height = max(text.content_height for text in self._action_text.values())
+        texts = (*self._action_text.values(), *self._heading_text.values())
+        text_width = max(text.content_width for text in texts)
+        text_height = max(text.content_height for text in texts)
 
         self._action_panels = {
             name: RoundedRectangle(
@@ -162,11 +183,14 @@ class SelectionPopup(Popup):
             sum(panel.height for panel in self._action_panels.values())
             + (len(actions) + 1) * style.format.padding
         )
+        # Each heading takes up a row of its own.
+        height += len(self._heading_text) * (3 * style.format.padding + text_height)
 
         bottom = position[1] - height if top else position[1]
         left = position[0] - width if right else position[0]
 
-        for idx, action in enumerate(actions):
+        idx = 0
+        for action in actions:
             y = (
                 bottom
                 + style.format.padding
@@ -177,8 +201,35 @@ class SelectionPopup(Popup):
                 left + 2 * style.format.padding,
                 y + style.format.padding,
             )
+            idx += 1
+
+            heading = self._heading_text.get(action.name)
+            if heading is not None:
+                y += 3 * style.format.padding + text_height
+                heading.position = left + style.format.padding, y + style.format.padding
+                idx += 1
         Popup.__init__(self, width, height, (left, bottom), uid)
 
+    @classmethod
+    def grouped(
+        cls,
+        groups: dict[str, tuple[PopupAction, ...]],
+        position: tuple[float, float],
+        top: bool = False,
+        right: bool = False,
+        uid: UUID | None = None,
+    ) -> SelectionPopup:
+        """A popup listing each group of actions under its heading, in order from the top."""
+        actions: list[PopupAction] = []
+        headings: dict[str, str] = {}
+        for heading, group in groups.items():
+            if not group:
+                continue
+            headings[group[0].name] = heading
+            actions.extend(group)
+        # Rows go from the bottom up, so everything is reversed to read downwards.
+        return cls(tuple(reversed(actions)), position, top, right, uid, headings)
+
     def connect_renderer(self, batch: Batch | None):
         Popup.connect_renderer(self, batch)
 
@@ -188,6 +239,9 @@ class SelectionPopup(Popup):
             t = self._action_text[action]
             t.batch = batch
 
+        for heading in self._heading_text.values():
+            heading.batch = batch
+
     def get_hovered_item(self, point: tuple[float, float]) -> str | None:
         for name, panel in self._action_panels.items():
             if (
@@ -0,0 +1,604 @@
+"""
+Evaluate a graph over many test cases at once.
+
+Rather than running `Graph.compute` once per TestCase, every port holds a
+NumPy column with one row per case. Arithmetic, trig, comparison and boolean
+blocks run as vectorised kernels over whole columns. Any block without a
+kernel (or with input types its kernel doesn't handle, like the string
+blocks `Format` and `Match`) falls back to calling its operation row by row.
+
+Rows which raise are marked as failed rather than stopping the batch,
+whatever they raise, since the errors the interpreter lets escape (like a
+ZeroDivisionError, or a Match with a bad pattern) still fail the case. Each block tracks its own failed rows, so a row only fails a lazy
+block (like Choice) when an input that row actually picked failed.
+
+This needs numpy, which is an optional dependency (`pip install .[batch]`).
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Callable, Mapping, Sequence
+from uuid import UUID
+
+import numpy as np
+
+from .graph import (
+    Graph,
+    Block,
+    BlockType,
+    TestCase,
+    OperationValue,
+    IntValue,
+    FloatValue,
+    BoolValue,
+    StrValue,
+    _variable,
+    _feeding,
+)
+from . import blocks
+
+__all__ = ("Column", "BatchResult", "cases_to_columns", "evaluate", "grade", "run_cases")
+
+_DTYPES: dict[type[OperationValue], type] = {
+    IntValue: np.int64,
+    FloatValue: np.float64,
+    BoolValue: np.bool_,
+    StrValue: np.object_,
+}
+_NUMERIC = (IntValue, FloatValue)
+
+# Int results this big might have wrapped around an int64, and floats this big
+# can't hold every int.
+_INT_LIMIT = 2.0**62
+_EXACT_LIMIT = 2**53
+
+# What the row by row fallback treats as a failed row.
+_CAUGHT = Exception
+
+
+@dataclass
+class Column:
+    """
+    One port's values for every row of the batch. `typ` is None when the rows
+    hold different value types, in which case `data` holds the Values themselves.
+    """
+
+    typ: type[OperationValue] | None
+    data: np.ndarray
+
+    @classmethod
+    def full(cls, value: OperationValue, size: int) -> Column:
+        typ = type(value)
+        return cls(typ, np.full(size, value.value, dtype=_dtype(typ, (value.value,))))
+
+    @classmethod
+    def from_values(cls, values: Sequence[OperationValue]) -> Column:
+        types = {type(value) for value in values}
+        if len(types) != 1:
+            data = np.empty(len(values), dtype=np.object_)
+            data[:] = values
+            return cls(None, data)
+
+        typ = types.pop()
+        raw = [value.value for value in values]
+        return cls(typ, np.array(raw, dtype=_dtype(typ, raw)))
+
+    def values(self) -> list[OperationValue]:
+        if self.typ is None:
+            return list(self.data)
+        return [self.typ(value) for value in self.data.tolist()]
+
+
+def _dtype(typ: type[OperationValue], raw: Sequence[object]) -> type:
+    """
+    The dtype to hold the raw values in. Python ints which don't fit in an
+    int64, or which a float64 would round (Floor gives FloatValues holding
+    ints), are kept as objects.
+    """
+    if typ is IntValue and any(not -(2**63) <= value < 2**63 for value in raw):  # type: ignore -- IntValues hold ints
+        return np.object_
+    if typ is FloatValue and any(type(value) is int and abs(value) > _EXACT_LIMIT for value in raw):
+        return np.object_
+    return _DTYPES[typ]
+
+
+def _wide(column: Column) -> bool:
+    """Whether a numeric column holds python ints as objects, see `_dtype`."""
+    return column.typ in _NUMERIC and column.data.dtype == np.object_
+
+
+def _int_op(op: Callable, *data: np.ndarray) -> np.ndarray:
+    """
+    Run an op on int columns. If any row might not fit in an int64 the op is
+    run on python ints instead, so nothing silently wraps around.
+    """
+    if all(column.dtype != np.object_ for column in data):
+        with np.errstate(all="ignore"):
+            estimate = op(*(column.astype(np.float64) for column in data))
+        if np.all(np.abs(estimate) < _INT_LIMIT):
+            return op(*data)
+    return op(*(column.astype(np.object_) for column in data))
+
+
+@dataclass
+class BatchResult:
+    outputs: dict[str, Column]
+    errors: np.ndarray
+    passed: np.ndarray | None = None
+
+
+Kernel = Callable[..., dict[str, Column] | None]
+
+
+# -- KERNELS --
+# Each kernel takes the block's error mask followed by the block's inputs as
+# columns. Rows that would have raised are added to the error mask. Returning
+# None means the kernel can't handle these column types, and the block will
+# be run row by row instead.
+
+
+def _float(column: Column) -> np.ndarray:
+    return column.data.astype(np.float64, copy=False)
+
+
+def _truthy(column: Column) -> np.ndarray:
+    if column.typ is BoolValue:
+        return column.data
+    return column.data != 0
+
+
+def _arithmetic(int_op: Callable, float_op: Callable, zero_check: bool = False) -> Kernel:
+    def __kernel(errors: np.ndarray, a: Column, b: Column) -> dict[str, Column] | None:
+        if a.typ not in _NUMERIC or b.typ not in _NUMERIC:
+            return None
+        both_int = a.typ is IntValue and b.typ is IntValue
+        if not both_int and (_wide(a) or _wide(b)):
+            return None
+        a_, b_ = (a.data, b.data) if both_int else (_float(a), _float(b))
+        if zero_check:
+            zero = np.asarray(b_ == 0, dtype=np.bool_)
+            errors |= zero
+            b_ = np.where(zero, 1, b_)
+        with np.errstate(all="ignore"):
+            if both_int:
+                return {"result": Column(IntValue, _int_op(int_op, a_, b_))}
+            return {"result": Column(FloatValue, float_op(a_, b_))}
+
+    return __kernel
+
+
+def _trig(op: Callable) -> Kernel:
+    def __kernel(errors: np.ndarray, value: Column) -> dict[str, Column] | None:
+        if value.typ not in _NUMERIC or _wide(value):
+            return None
+        value_ = _float(value)
+        infinite = np.isinf(value_)
+        errors |= infinite  # math.sin(inf) raises
+        return {"result": Column(FloatValue, op(np.where(infinite, 0.0, value_)))}
+
+    return __kernel
+
+
+def _rounding(op: Callable) -> Kernel:
+    def __kernel(errors: np.ndarray, value: Column) -> dict[str, Column] | None:
+        if value.typ not in _NUMERIC or _wide(value):
+            return None
+        value_ = _float(value)
+        finite = np.isfinite(value_)
+        if np.any(np.abs(value_[finite]) > _EXACT_LIMIT):
+            # math.floor gives an int, which is only exact row by row.
+            return None
+        errors |= ~finite  # math.floor(inf/nan) raises
+        return {"result": Column(FloatValue, op(value_))}
+
+    return __kernel
+
+
+def _step(amount: int) -> Kernel:
+    def __kernel(errors: np.ndarray, value: Column) -> dict[str, Column] | None:
+        if value.typ is IntValue:
+            return {"result": Column(IntValue, _int_op(lambda data: data + amount, value.data))}
+        if value.typ is not FloatValue or _wide(value):
+            return None
+        return {"result": Column(FloatValue, value.data + amount)}
+
+    return __kernel
+
+
+def _unary_numeric(int_op: Callable, float_op: Callable) -> Kernel:
+    def __kernel(errors: np.ndarray, value: Column) -> dict[str, Column] | None:
+        if value.typ is IntValue:
+            return {"result": Column(IntValue, _int_op(int_op, value.data))}
+        if value.typ is FloatValue and not _wide(value):
+            return {"result": Column(FloatValue, float_op(value.data))}
+        return None
+
+    return __kernel
+
+
+def _compare(op: Callable) -> Kernel:
+    def __kernel(errors: np.ndarray, a: Column, b: Column) -> dict[str, Column] | None:
+        if a.typ not in _NUMERIC or b.typ not in _NUMERIC or _wide(a) or _wide(b):
+            return None
+        return {"result": Column(BoolValue, op(_float(a), _float(b)))}
+
+    return __kernel
+
+
+def _equality(op: Callable) -> Kernel:
+    def __kernel(errors: np.ndarray, a: Column, b: Column) -> dict[str, Column] | None:
+        if a.typ is None or b.typ is None:
+            return None
+        if (a.typ is StrValue) != (b.typ is StrValue):
+            return None
+        return {"result": Column(BoolValue, np.asarray(op(a.data, b.data), dtype=np.bool_))}
+
+    return __kernel
+
+
+def _logic(op: Callable) -> Kernel:
+    def __kernel(errors: np.ndarray, a: Column, b: Column) -> dict[str, Column] | None:
+        if a.typ in (None, StrValue) or b.typ in (None, StrValue):
+            return None
+        return {"result": Column(BoolValue, op(_truthy(a), _truthy(b)))}
+
+    return __kernel
+
+
+def _not(errors: np.ndarray, value: Column) -> dict[str, Column] | None:
+    if value.typ in (None, StrValue):
+        return None
+    return {"result": Column(BoolValue, ~_truthy(value))}
+
+
+def _choice(
+    errors: np.ndarray, if_true: Column, if_false: Column, choice: Column
+) -> dict[str, Column] | None:
+    if if_true.typ is None or if_true.typ is not if_false.typ:
+        return None
+    if choice.typ in (None, StrValue):
+        return None
+    return {"result": Column(if_true.typ, np.where(_truthy(choice), if_true.data, if_false.data))}
+
+
+def _select(errors: np.ndarray, index: Column, **options: Column) -> dict[str, Column] | None:
+    if index.typ is not IntValue or index.data.dtype == np.object_:
+        return None
+    types = {column.typ for column in options.values()}
+    if len(options) != blocks.SELECT_OPTIONS or len(types) != 1 or None in types:
+        return None
+    errors |= (index.data < 0) | (index.data >= blocks.SELECT_OPTIONS)
+    picked = np.clip(index.data, 0, blocks.SELECT_OPTIONS - 1)
+    choices = [options[f"option_{i}"].data for i in range(blocks.SELECT_OPTIONS)]
+    return {"result": Column(types.pop(), np.choose(picked, choices))}
+
+
+def _renamed(kernel: Kernel, **names: str) -> Kernel:
+    """Pass a block's inputs to a kernel written for different port names."""
+
+    def __kernel(errors: np.ndarray, **inputs: Column) -> dict[str, Column] | None:
+        return kernel(errors, **{names.get(name, name): column for name, column in inputs.items()})
+
+    return __kernel
+
+
+def _maximum(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # Matches python's max(a, b), which keeps `a` unless `b` is strictly larger.
+    return np.where(b > a, b, a)
+
+
+def _minimum(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.where(b < a, b, a)
+
+
+KERNELS: dict[BlockType, Kernel] = {
+    blocks.AddBlock: _arithmetic(np.add, np.add),
+    blocks.SubBlock: _arithmetic(np.subtract, np.subtract),
+    blocks.MulBlock: _arithmetic(np.multiply, np.multiply),
+    blocks.DivBlock: _arithmetic(np.floor_divide, np.true_divide, zero_check=True),
+    blocks.ModBlock: _renamed(
+        _arithmetic(np.mod, np.mod, zero_check=True), value="a", mod="b"
+    ),
+    blocks.MaxBlock: _arithmetic(_maximum, _maximum),
+    blocks.MinBlock: _arithmetic(_minimum, _minimum),
+    # numpy's trig can be an ulp away from math's, far inside the two decimal
+    # places results are graded to.
+    blocks.SinBlock: _trig(np.sin),
+    blocks.CosBlock: _trig(np.cos),
+    blocks.TanBlock: _trig(np.tan),
+    blocks.FloorBlock: _rounding(np.floor),
+    blocks.CeilBlock: _rounding(np.ceil),
+    blocks.AbsBlock: _unary_numeric(np.abs, np.abs),
+    blocks.SignBLock: _unary_numeric(
+        # FloatValue has no negative zero (it's interned as zero), so neither can this.
+        lambda v: np.where(v < 0, -1, 1), lambda v: np.where(v == 0, 1.0, np.copysign(1.0, v))
+    ),
+    blocks.IncrBlock: _step(1),
+    blocks.DecrBlock: _step(-1),
+    blocks.LtBlock: _compare(np.less),
+    blocks.GtBlock: _compare(np.greater),
+    blocks.LeqBlock: _compare(np.less_equal),
+    blocks.GeqBlock: _compare(np.greater_equal),
+    blocks.EqBlock: _equality(np.equal),
+    blocks.NeqBlock: _equality(np.not_equal),
+    blocks.NotBlock: _not,
+    blocks.AndBlock: _logic(np.logical_and),
+    blocks.OrBlock: _logic(np.logical_or),
+    blocks.IfBlock: _choice,
+    blocks.SelectBlock: _select,
+}
+
+
+# -- LAZY INPUTS --
+# Which rows of a lazy block need each of its inputs, given the gate columns.
+# Lazy blocks without an entry call their `select` row by row.
+
+Needs = Callable[..., dict[str, np.ndarray] | None]
+
+
+def _needs_choice(choice: Column) -> dict[str, np.ndarray] | None:
+    if choice.typ in (None, StrValue):
+        return None
+    truthy = _truthy(choice)
+    return {"if_true": truthy, "if_false": ~truthy}
+
+
+def _needs_logic(when: bool) -> Needs:
+    def __needs(a: Column) -> dict[str, np.ndarray] | None:
+        if a.typ in (None, StrValue):
+            return None
+        truthy = _truthy(a)
+        return {"b": truthy if when else ~truthy}
+
+    return __needs
+
+
+def _needs_select(index: Column) -> dict[str, np.ndarray] | None:
+    if index.typ is not IntValue or index.data.dtype == np.object_:
+        return None
+    return {f"option_{i}": index.data == i for i in range(blocks.SELECT_OPTIONS)}
+
+
+NEEDS: dict[BlockType, Needs] = {
+    blocks.IfBlock: _needs_choice,
+    blocks.AndBlock: _needs_logic(True),
+    blocks.OrBlock: _needs_logic(False),
+    blocks.SelectBlock: _needs_select,
+}
+
+
+def _needed(block: Block, inputs: Mapping[str, Column], size: int) -> dict[str, np.ndarray]:
+    """Which rows need each of a lazy block's inputs. The gates are needed by every row."""
+    lazy = block.type.lazy
+    assert lazy is not None
+    gates = {name: inputs[name] for name in lazy.gates}
+    everything = np.ones(size, dtype=np.bool_)
+
+    needs = NEEDS.get(block.type)
+    selected = None if needs is None else needs(**gates)
+    if selected is None:
+        rows = {name: column.values() for name, column in gates.items()}
+        selected = {name: np.zeros(size, dtype=np.bool_) for name in inputs}
+        for idx in range(size):
+            try:
+                names = set(lazy.select(**{name: values[idx] for name, values in rows.items()}))
+            except _CAUGHT:
+                # Let the block itself fail with all of its inputs.
+                names = set(inputs)
+            for name in names.intersection(inputs):
+                selected[name][idx] = True
+
+    return {
+        name: everything if name in lazy.gates else selected.get(name, ~everything)
+        for name in inputs
+    }
+
+
+def _fallback(
+    block: Block,
+    inputs: Mapping[str, Column],
+    errors: np.ndarray,
+    size: int,
+    needed: Mapping[str, np.ndarray] | None = None,
+) -> dict[str, Column]:
+    columns = {name: column.values() for name, column in inputs.items()}
+    rows: list[Mapping[str, OperationValue] | None] = []
+    for idx in range(size):
+        if errors[idx]:
+            rows.append(None)
+            continue
+        try:
+            rows.append(
+                block.type.operation(
+                    **block.config,
+                    **{
+                        name: values[idx]
+                        for name, values in columns.items()
+                        if needed is None or needed[name][idx]
+                    },
+                )
+            )
+        except _CAUGHT:
+            errors[idx] = True
+            rows.append(None)
+
+    outputs: dict[str, Column] = {}
+    for name, typ in block.type.outputs.items():
+        # Failed rows still need a placeholder of the right type.
+        values = [typ() if row is None else row[name] for row in rows]
+        outputs[name] = Column.from_values(values)
+    return outputs
+
+
+def cases_to_columns(
+    cases: Sequence[TestCase],
+) -> tuple[dict[str, Column], dict[str, Column]]:
+    """Turn a sequence of test cases into input and expected output columns."""
+    if not cases:
+        return {}, {}
+    inputs = {
+        name: Column.from_values([case.inputs[name] for case in cases])
+        for name in cases[0].inputs
+    }
+    outputs = {
+        name: Column.from_values([case.outputs[name] for case in cases])
+        for name in cases[0].outputs
+    }
+    return inputs, outputs
+
+
+def evaluate(
+    graph: Graph,
+    target: Block,
+    input_block: Block | None,
+    inputs: Mapping[str, Column],
+    size: int,
+) -> BatchResult:
+    """
+    Run the target block's plan once over `size` rows. The input block's
+    outputs are taken from `inputs` rather than its config.
+
+    Every block is run over every row, but a row only fails a block if it
+    failed one of the block's inputs that row needed (see `NEEDS`).
+    """
+    computed: dict[UUID, dict[str, Column]] = {}
+    failed: dict[UUID, np.ndarray] = {}
+
+    plan = graph.get_plan(target)
+    eager = all(step.block.type.lazy is None for step in plan)
+    feeding = None if eager else _feeding(plan, target.uid)
+    for step in plan:
+        block = step.block
+        if feeding is not None and block.uid not in feeding:
+            # Run on demand the interpreter never gets to it.
+            continue
+        if block is input_block:
+            computed[block.uid] = dict(inputs)
+            failed[block.uid] = np.zeros(size, dtype=np.bool_)
+            continue
+
+        connected = {name: computed[source][output] for name, source, output in step.inputs}
+        if connected.keys() != block.inputs.keys():
+            # Missing inputs fail every row, just like the interpreter.
+            computed[block.uid] = _placeholders(block, size)
+            failed[block.uid] = np.ones(size, dtype=np.bool_)
+            continue
+
+        if not block.inputs:
+            # Constants only need computing once.
+            result = block.compute()
+            if result.exception is not None:
+                computed[block.uid] = _placeholders(block, size)
+                failed[block.uid] = np.ones(size, dtype=np.bool_)
+                continue
+            computed[block.uid] = {
+                name: Column.full(value, size) for name, value in result.outputs.items()
+            }
+            failed[block.uid] = np.zeros(size, dtype=np.bool_)
+            continue
+
+        needed = None
+        errors = np.zeros(size, dtype=np.bool_)
+        if block.type.lazy is None:
+            for _, source, _ in step.inputs:
+                errors |= failed[source]
+        else:
+            needed = _needed(block, connected, size)
+            for name, source, _ in step.inputs:
+                errors |= failed[source] & needed[name]
+        failed[block.uid] = errors
+
+        if block.type.operation is _variable:
+            # Variable blocks (like a puzzle's output) just pass values through.
+            computed[block.uid] = {
+                **{name: Column.full(value, size) for name, value in block.config.items()},
+                **connected,
+            }
+            continue
+
+        outputs = None
+        kernel = KERNELS.get(block.type)
+        if kernel is not None:
+            outputs = kernel(errors, **connected)
+        if outputs is None:
+            outputs = _fallback(block, connected, errors, size, needed)
+        computed[block.uid] = outputs
+
+    errors = failed[target.uid]
+    if eager:
+        # Without lazy blocks the interpreter runs the whole plan, failing on any
+        # step. Usually every step feeds the target anyway, but an inlined
+        # subgraph may ignore some of its inputs.
+        errors = np.logical_or.reduce([errors, *failed.values()])
+    return BatchResult(computed[target.uid], errors)
+
+
+def _placeholders(block: Block, size: int) -> dict[str, Column]:
+    """Columns for a block which failed every row, so the blocks after it can still run."""
+    return {name: Column.full(typ(), size) for name, typ in block.type.outputs.items()}
+
+
+def _matches(expected: Column, actual: Column) -> np.ndarray:
+    if expected.typ is FloatValue:
+        # TestCase compares floats to two decimal places using python's round.
+        if actual.typ not in _NUMERIC:
+            return np.zeros(len(expected.data), dtype=np.bool_)
+        return np.array(
+            [
+                round(a, 2) == round(b, 2)
+                for a, b in zip(actual.data.tolist(), expected.data.tolist())
+            ],
+            dtype=np.bool_,
+        )
+    if expected.typ is not None and actual.typ is not None and (
+        (expected.typ is StrValue) == (actual.typ is StrValue)
+    ):
+        return np.asarray(actual.data == expected.data, dtype=np.bool_)
+    return np.array(
+        [a.value == b.value for a, b in zip(actual.values(), expected.values())],
+        dtype=np.bool_,
+    )
+
+
+def grade(
+    graph: Graph,
+    inputs: Mapping[str, Column],
+    expected: Mapping[str, Column],
+    input_block: Block | None = None,
+    output_block: Block | None = None,
+) -> BatchResult:
+    """
+    Evaluate the graph for every row of the input columns and compare the
+    output block's values against the expected columns. `passed` holds
+    whether each row matched.
+    """
+    if input_block is None and graph.input_uid is not None:
+        input_block = graph.get_block(graph.input_uid)
+    if output_block is None:
+        if graph.output_uid is None:
+            raise ValueError(f"Graph {graph.name} has no output block to grade")
+        output_block = graph.get_block(graph.output_uid)
+
+    size = len(next(iter({**inputs, **expected}.values())).data)
+    result = evaluate(graph, output_block, input_block, inputs, size)
+
+    passed = ~result.errors
+    if result.outputs.keys() != expected.keys():
+        passed[:] = False
+    else:
+        for name, column in expected.items():
+            passed &= _matches(column, result.outputs[name])
+    result.passed = passed
+    return result
+
+
+def run_cases(
+    graph: Graph,
+    cases: Sequence[TestCase],
+    input_block: Block | None = None,
+    output_block: Block | None = None,
+) -> np.ndarray:
+    """Grade every test case in one batch, returning whether each passed."""
+    inputs, expected = cases_to_columns(cases)
+    return grade(graph, inputs, expected, input_block, output_block).passed  # type: ignore -- set by grade
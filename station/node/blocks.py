@@ -1,9 +1,60 @@
 import re
+from itertools import product
 from math import ceil, copysign, cos, floor, pi, sin, tan
-from .graph import BlockType, FloatValue, IntValue, StrValue, BoolValue, OperationValue
+from typing import Iterable
+from .graph import (
+    BlockType,
+    BlockOperation,
+    LazyInputs,
+    Variant,
+    FloatValue,
+    IntValue,
+    StrValue,
+    BoolValue,
+    OperationValue,
+)
 
 # -- BLOCK TYPES --
 
+# -- VARIANTS --
+# Once the graph knows the concrete type of every input it runs one of these
+# instead of the general operation, which has to check and cast at runtime.
+
+NUMERIC: tuple[type[OperationValue], ...] = (IntValue, FloatValue)
+ANY: tuple[type[OperationValue], ...] = (IntValue, FloatValue, StrValue, BoolValue)
+Variants = dict[tuple[type[OperationValue], ...], Variant]
+
+
+def _numeric(
+    int_op: BlockOperation, float_op: BlockOperation, mixed_op: BlockOperation | None = None
+) -> Variants:
+    """
+    The int operation when every input is an int, and the float one when every
+    input is a float. A mix of the two uses the mixed operation, which has to
+    turn the ints into floats first. Without one the operation has one input.
+    """
+    if mixed_op is None:
+        return {
+            (IntValue,): Variant(int_op, {"result": IntValue}),
+            (FloatValue,): Variant(float_op, {"result": FloatValue}),
+        }
+    return {
+        (IntValue, IntValue): Variant(int_op, {"result": IntValue}),
+        (IntValue, FloatValue): Variant(mixed_op, {"result": FloatValue}),
+        (FloatValue, IntValue): Variant(mixed_op, {"result": FloatValue}),
+        (FloatValue, FloatValue): Variant(float_op, {"result": FloatValue}),
+    }
+
+
+def _fixed(
+    operation: BlockOperation,
+    outputs: dict[str, type[OperationValue]],
+    *inputs: Iterable[type[OperationValue]],
+) -> Variants:
+    """The same operation and output types for every combination of the input types."""
+    return {types: Variant(operation, outputs) for types in product(*inputs)}
+
+
 # -- OPERATIONS --
 
 
@@ -19,11 +70,25 @@ def __add(
     return {"result": FloatValue(a_.value + b_.value)}
 
 
+def __add_int(a: IntValue, b: IntValue) -> dict[str, IntValue]:
+    return {"result": IntValue(a.value + b.value)}
+
+
+def __add_float(a: FloatValue, b: FloatValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(a.value + b.value)}
+
+
+def __add_mixed(a: IntValue | FloatValue, b: IntValue | FloatValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(float(a.value) + float(b.value))}
+
+
 AddBlock = BlockType(
     "Add",
     __add,
     {"a": FloatValue, "b": FloatValue},
     {"result": FloatValue},
+    variants=_numeric(__add_int, __add_float, __add_mixed),
+    category="Maths",
 )
 
 
@@ -39,11 +104,25 @@ def __sub(
     return {"result": FloatValue(a_.value - b_.value)}
 
 
+def __sub_int(a: IntValue, b: IntValue) -> dict[str, IntValue]:
+    return {"result": IntValue(a.value - b.value)}
+
+
+def __sub_float(a: FloatValue, b: FloatValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(a.value - b.value)}
+
+
+def __sub_mixed(a: IntValue | FloatValue, b: IntValue | FloatValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(float(a.value) - float(b.value))}
+
+
 SubBlock = BlockType(
     "Subtract",
     __sub,
     {"a": FloatValue, "b": FloatValue},
     {"result": FloatValue},
+    variants=_numeric(__sub_int, __sub_float, __sub_mixed),
+    category="Maths",
 )
 
 
@@ -59,11 +138,25 @@ def __mul(
     return {"result": FloatValue(a_.value * b_.value)}
 
 
+def __mul_int(a: IntValue, b: IntValue) -> dict[str, IntValue]:
+    return {"result": IntValue(a.value * b.value)}
+
+
+def __mul_float(a: FloatValue, b: FloatValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(a.value * b.value)}
+
+
+def __mul_mixed(a: IntValue | FloatValue, b: IntValue | FloatValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(float(a.value) * float(b.value))}
+
+
 MulBlock = BlockType(
     "Multiply",
     __mul,
     {"a": FloatValue, "b": FloatValue},
     {"result": FloatValue},
+    variants=_numeric(__mul_int, __mul_float, __mul_mixed),
+    category="Maths",
 )
 
 
@@ -79,11 +172,25 @@ def __div(
     return {"result": FloatValue(a_.value / b_.value)}
 
 
+def __div_int(a: IntValue, b: IntValue) -> dict[str, IntValue]:
+    return {"result": IntValue(a.value // b.value)}
+
+
+def __div_float(a: FloatValue, b: FloatValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(a.value / b.value)}
+
+
+def __div_mixed(a: IntValue | FloatValue, b: IntValue | FloatValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(float(a.value) / float(b.value))}
+
+
 DivBlock = BlockType(
     "Divide",
     __div,
     {"a": FloatValue, "b": FloatValue},
     {"result": FloatValue},
+    variants=_numeric(__div_int, __div_float, __div_mixed),
+    category="Maths",
 )
 
 def __sin(value: FloatValue | IntValue) -> dict[str, IntValue | FloatValue]:
@@ -92,7 +199,19 @@ def __sin(value: FloatValue | IntValue) -> dict[str, IntValue | FloatValue]:
     return {"result": FloatValue(sin(_value.value))}
 
 
-SinBlock = BlockType("Sin", __sin, {"value": FloatValue}, {"result": FloatValue})
+def __sin_number(value: IntValue | FloatValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(sin(value.value))}
+
+
+SinBlock = BlockType(
+    "Sin",
+    __sin,
+    {"value": FloatValue},
+    {"result": FloatValue},
+    cache_size=256,
+    variants=_fixed(__sin_number, {"result": FloatValue}, NUMERIC),
+    category="Maths",
+)
 
 def __cos(value: FloatValue | IntValue) -> dict[str, IntValue | FloatValue]:
     """Get the cosine of a number."""
@@ -100,7 +219,19 @@ def __cos(value: FloatValue | IntValue) -> dict[str, IntValue | FloatValue]:
     return {"result": FloatValue(cos(_value.value))}
 
 
-CosBlock = BlockType("Cos", __cos, {"value": FloatValue}, {"result": FloatValue})
+def __cos_number(value: IntValue | FloatValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(cos(value.value))}
+
+
+CosBlock = BlockType(
+    "Cos",
+    __cos,
+    {"value": FloatValue},
+    {"result": FloatValue},
+    cache_size=256,
+    variants=_fixed(__cos_number, {"result": FloatValue}, NUMERIC),
+    category="Maths",
+)
 
 def __tan(value: FloatValue | IntValue) -> dict[str, IntValue | FloatValue]:
     """Get the tangent of a number."""
@@ -108,14 +239,26 @@ def __tan(value: FloatValue | IntValue) -> dict[str, IntValue | FloatValue]:
     return {"result": FloatValue(tan(_value.value))}
 
 
-TanBlock = BlockType("Tan", __tan, {"value": FloatValue}, {"result": FloatValue})
+def __tan_number(value: IntValue | FloatValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(tan(value.value))}
+
+
+TanBlock = BlockType(
+    "Tan",
+    __tan,
+    {"value": FloatValue},
+    {"result": FloatValue},
+    cache_size=256,
+    variants=_fixed(__tan_number, {"result": FloatValue}, NUMERIC),
+    category="Maths",
+)
 
 def __pi() -> dict[str, FloatValue]:
     """Return the circle constant pi. (~3.14)"""
     return {"pi": FloatValue(pi)}
 
 
-PiBlock = BlockType("Pi", __pi, {}, {"pi": FloatValue})
+PiBlock = BlockType("Pi", __pi, {}, {"pi": FloatValue}, category="Maths")
 
 # -- Functions --
 
@@ -127,7 +270,12 @@ def __to_float(value: OperationValue) -> dict[str, FloatValue]:
 
 
 CastFloatBLock = BlockType(
-    "Float Cast", __to_float, {"value": FloatValue}, {"result": FloatValue}
+    "Float Cast",
+    __to_float,
+    {"value": FloatValue},
+    {"result": FloatValue},
+    variants=_fixed(__to_float, {"result": FloatValue}, ANY),
+    category="Functions",
 )
 
 
@@ -137,7 +285,12 @@ def __to_int(value: OperationValue) -> dict[str, IntValue]:
 
 
 CastIntBLock = BlockType(
-    "Int Cast", __to_int, {"value": IntValue}, {"result": IntValue}
+    "Int Cast",
+    __to_int,
+    {"value": IntValue},
+    {"result": IntValue},
+    variants=_fixed(__to_int, {"result": IntValue}, ANY),
+    category="Functions",
 )
 
 
@@ -147,7 +300,12 @@ def __to_bool(value: OperationValue) -> dict[str, BoolValue]:
 
 
 CastBoolBLock = BlockType(
-    "Boolean Cast", __to_bool, {"value": BoolValue}, {"result": BoolValue}
+    "Boolean Cast",
+    __to_bool,
+    {"value": BoolValue},
+    {"result": BoolValue},
+    variants=_fixed(__to_bool, {"result": BoolValue}, ANY),
+    category="Functions",
 )
 
 
@@ -157,7 +315,12 @@ def __to_str(value: OperationValue) -> dict[str, StrValue]:
 
 
 CastStrBLock = BlockType(
-    "String Cast", __to_str, {"value": StrValue}, {"result": StrValue}
+    "String Cast",
+    __to_str,
+    {"value": StrValue},
+    {"result": StrValue},
+    variants=_fixed(__to_str, {"result": StrValue}, ANY),
+    category="Functions",
 )
 
 
@@ -173,8 +336,25 @@ def __mod(
     return {"result": FloatValue(a_.value % b_.value)}
 
 
+def __mod_int(value: IntValue, mod: IntValue) -> dict[str, IntValue]:
+    return {"result": IntValue(value.value % mod.value)}
+
+
+def __mod_float(value: FloatValue, mod: FloatValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(value.value % mod.value)}
+
+
+def __mod_mixed(value: IntValue | FloatValue, mod: IntValue | FloatValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(float(value.value) % float(mod.value))}
+
+
 ModBlock = BlockType(
-    "Modulo", __mod, {"value": FloatValue, "mod": FloatValue}, {"result": FloatValue}
+    "Modulo",
+    __mod,
+    {"value": FloatValue, "mod": FloatValue},
+    {"result": FloatValue},
+    variants=_numeric(__mod_int, __mod_float, __mod_mixed),
+    category="Functions",
 )
 
 
@@ -186,7 +366,22 @@ def __abs(value: FloatValue | IntValue) -> dict[str, IntValue | FloatValue]:
     return {"result": FloatValue(abs(_a.value))}
 
 
-AbsBlock = BlockType("Absolute", __abs, {"value": FloatValue}, {"result": FloatValue})
+def __abs_int(value: IntValue) -> dict[str, IntValue]:
+    return {"result": IntValue(abs(value.value))}
+
+
+def __abs_float(value: FloatValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(abs(value.value))}
+
+
+AbsBlock = BlockType(
+    "Absolute",
+    __abs,
+    {"value": FloatValue},
+    {"result": FloatValue},
+    variants=_numeric(__abs_int, __abs_float),
+    category="Functions",
+)
 
 
 def __round(value: FloatValue | IntValue, precision: IntValue) -> dict[str, FloatValue]:
@@ -196,11 +391,25 @@ def __round(value: FloatValue | IntValue, precision: IntValue) -> dict[str, Floa
     return {"result": FloatValue(round(_value.value, _precision.value))}
 
 
+def __round_int(value: IntValue, precision: IntValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(round(float(value.value), precision.value))}
+
+
+def __round_float(value: FloatValue, precision: IntValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(round(value.value, precision.value))}
+
+
 RoundBlock = BlockType(
     "Round",
     __round,
     {"value": FloatValue, "precision": IntValue},
     {"result": FloatValue},
+    cache_size=256,
+    variants={
+        (IntValue, IntValue): Variant(__round_int, {"result": FloatValue}),
+        (FloatValue, IntValue): Variant(__round_float, {"result": FloatValue}),
+    },
+    category="Functions",
 )
 
 
@@ -210,7 +419,18 @@ def __floor(value: FloatValue | IntValue) -> dict[str, FloatValue]:
     return {"result": FloatValue(floor(_value.value))}
 
 
-FloorBlock = BlockType("Floor", __floor, {"value": FloatValue}, {"result": FloatValue})
+def __floor_number(value: FloatValue | IntValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(floor(value.value))}
+
+
+FloorBlock = BlockType(
+    "Floor",
+    __floor,
+    {"value": FloatValue},
+    {"result": FloatValue},
+    variants=_fixed(__floor_number, {"result": FloatValue}, NUMERIC),
+    category="Functions",
+)
 
 
 def __ceil(value: FloatValue | IntValue) -> dict[str, FloatValue]:
@@ -219,7 +439,18 @@ def __ceil(value: FloatValue | IntValue) -> dict[str, FloatValue]:
     return {"result": FloatValue(ceil(_value.value))}
 
 
-CeilBlock = BlockType("Ceiling", __ceil, {"value": FloatValue}, {"result": FloatValue})
+def __ceil_number(value: FloatValue | IntValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(ceil(value.value))}
+
+
+CeilBlock = BlockType(
+    "Ceiling",
+    __ceil,
+    {"value": FloatValue},
+    {"result": FloatValue},
+    variants=_fixed(__ceil_number, {"result": FloatValue}, NUMERIC),
+    category="Functions",
+)
 
 def __sign(value: FloatValue | IntValue) -> dict[str, FloatValue | IntValue]:
     """Get the sign of the input value."""
@@ -228,7 +459,22 @@ def __sign(value: FloatValue | IntValue) -> dict[str, FloatValue | IntValue]:
     _value = FloatValue.__acast__(value)
     return {"result": FloatValue(copysign(1.0, _value.value))}
 
-SignBLock = BlockType("Sign", __sign, {"value": FloatValue}, {'result': FloatValue})
+def __sign_int(value: IntValue) -> dict[str, IntValue]:
+    return {"result": IntValue(int(copysign(1, value.value)))}
+
+
+def __sign_float(value: FloatValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(copysign(1.0, value.value))}
+
+
+SignBLock = BlockType(
+    "Sign",
+    __sign,
+    {"value": FloatValue},
+    {"result": FloatValue},
+    variants=_numeric(__sign_int, __sign_float),
+    category="Functions",
+)
 
 
 def __max(
@@ -242,11 +488,34 @@ def __max(
     return {"result": FloatValue(max(_a.value, _b.value))}
 
 
+def __max_int(a: IntValue, b: IntValue) -> dict[str, IntValue]:
+    return {"result": IntValue(max(a.value, b.value))}
+
+
+def __max_float(a: FloatValue, b: FloatValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(max(a.value, b.value))}
+
+
+def __max_int_float(a: IntValue, b: FloatValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(max(float(a.value), b.value))}
+
+
+def __max_float_int(a: FloatValue, b: IntValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(max(a.value, float(b.value)))}
+
+
 MaxBlock = BlockType(
     "Maximum",
     __max,
     {"a": FloatValue, "b": FloatValue},
     {"result": FloatValue},
+    variants={
+        (IntValue, IntValue): Variant(__max_int, {"result": IntValue}),
+        (IntValue, FloatValue): Variant(__max_int_float, {"result": FloatValue}),
+        (FloatValue, IntValue): Variant(__max_float_int, {"result": FloatValue}),
+        (FloatValue, FloatValue): Variant(__max_float, {"result": FloatValue}),
+    },
+    category="Functions",
 )
 
 
@@ -261,11 +530,34 @@ def __min(
     return {"result": FloatValue(min(_a.value, _b.value))}
 
 
+def __min_int(a: IntValue, b: IntValue) -> dict[str, IntValue]:
+    return {"result": IntValue(min(a.value, b.value))}
+
+
+def __min_float(a: FloatValue, b: FloatValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(min(a.value, b.value))}
+
+
+def __min_int_float(a: IntValue, b: FloatValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(min(float(a.value), b.value))}
+
+
+def __min_float_int(a: FloatValue, b: IntValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(min(a.value, float(b.value)))}
+
+
 MinBlock = BlockType(
     "Minimum",
     __min,
     {"a": FloatValue, "b": FloatValue},
     {"result": FloatValue},
+    variants={
+        (IntValue, IntValue): Variant(__min_int, {"result": IntValue}),
+        (IntValue, FloatValue): Variant(__min_int_float, {"result": FloatValue}),
+        (FloatValue, IntValue): Variant(__min_float_int, {"result": FloatValue}),
+        (FloatValue, FloatValue): Variant(__min_float, {"result": FloatValue}),
+    },
+    category="Functions",
 )
 
 
@@ -277,7 +569,22 @@ def __incr(value: IntValue | FloatValue) -> dict[str, IntValue | FloatValue]:
     return {"result": IntValue(a_.value + 1)}
 
 
-IncrBlock = BlockType("Increment", __incr, {"value": IntValue}, {"result": IntValue})
+def __incr_int(value: IntValue) -> dict[str, IntValue]:
+    return {"result": IntValue(value.value + 1)}
+
+
+def __incr_float(value: FloatValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(value.value + 1)}
+
+
+IncrBlock = BlockType(
+    "Increment",
+    __incr,
+    {"value": IntValue},
+    {"result": IntValue},
+    variants=_numeric(__incr_int, __incr_float),
+    category="Functions",
+)
 
 
 def __decr(value: IntValue | FloatValue) -> dict[str, IntValue | FloatValue]:
@@ -288,7 +595,22 @@ def __decr(value: IntValue | FloatValue) -> dict[str, IntValue | FloatValue]:
     return {"result": IntValue(a_.value - 1)}
 
 
-DecrBlock = BlockType("Decrement", __decr, {"value": IntValue}, {"result": IntValue})
+def __decr_int(value: IntValue) -> dict[str, IntValue]:
+    return {"result": IntValue(value.value - 1)}
+
+
+def __decr_float(value: FloatValue) -> dict[str, FloatValue]:
+    return {"result": FloatValue(value.value - 1)}
+
+
+DecrBlock = BlockType(
+    "Decrement",
+    __decr,
+    {"value": IntValue},
+    {"result": IntValue},
+    variants=_numeric(__decr_int, __decr_float),
+    category="Functions",
+)
 
 # -- String Manipulation --
 
@@ -299,7 +621,18 @@ def __len(string: StrValue) -> dict[str, IntValue]:
     return {"result": IntValue(len(a_.value))}
 
 
-LenBlock = BlockType("Length", __len, {"string": StrValue}, {"result": IntValue})
+def __len_str(string: StrValue) -> dict[str, IntValue]:
+    return {"result": IntValue(len(string.value))}
+
+
+LenBlock = BlockType(
+    "Length",
+    __len,
+    {"string": StrValue},
+    {"result": IntValue},
+    variants={(StrValue,): Variant(__len_str, {"result": IntValue})},
+    category="Strings",
+)
 
 
 def __concat(a: StrValue, b: StrValue) -> dict[str, StrValue]:
@@ -309,8 +642,17 @@ def __concat(a: StrValue, b: StrValue) -> dict[str, StrValue]:
     return {"result": StrValue(a_.value + b_.value)}
 
 
+def __concat_str(a: StrValue, b: StrValue) -> dict[str, StrValue]:
+    return {"result": StrValue(a.value + b.value)}
+
+
 ConcatBlock = BlockType(
-    "Concat", __concat, {"a": StrValue, "b": StrValue}, {"result": StrValue}
+    "Concat",
+    __concat,
+    {"a": StrValue, "b": StrValue},
+    {"result": StrValue},
+    variants={(StrValue, StrValue): Variant(__concat_str, {"result": StrValue})},
+    category="Strings",
 )
 
 
@@ -327,6 +669,7 @@ RepBlock = BlockType(
     __replace,
     {"string": StrValue, "old": StrValue, "new": StrValue},
     {"result": StrValue},
+    category="Strings",
 )
 
 def __getchar(string: StrValue, idx: IntValue) -> dict[str, StrValue]:
@@ -340,7 +683,8 @@ GetCharBlock = BlockType(
     "Get Char",
     __getchar,
     {"string": StrValue, "index": IntValue},
-    {"result": StrValue}
+    {"result": StrValue},
+    category="Strings",
 )
 
 def __ord(char: StrValue) -> dict[str, IntValue]:
@@ -353,7 +697,8 @@ OrdBlock = BlockType(
     "Ord",
     __ord,
     {"char": StrValue},
-    {"code": IntValue}
+    {"code": IntValue},
+    category="Strings",
 )
 
 def __char(code: IntValue) -> dict[str, StrValue]:
@@ -366,7 +711,8 @@ CharBlock = BlockType(
     "Char",
     __char,
     {"code": IntValue},
-    {"char": StrValue}
+    {"char": StrValue},
+    category="Strings",
 )
 
 
@@ -384,6 +730,7 @@ SubstringBlock = BlockType(
     {"string": StrValue, "start": IntValue, "end": IntValue},
     {"result": StrValue},
     defaults={"start": IntValue(0), "end": IntValue(-1)},
+    category="Strings",
 )
 
 
@@ -396,7 +743,12 @@ def _match(string: StrValue, pattern: StrValue) -> dict[str, BoolValue]:
 
 
 MatchBlock = BlockType(
-    "Match", _match, {"string": StrValue, "pattern": StrValue}, {"result": BoolValue}
+    "Match",
+    _match,
+    {"string": StrValue, "pattern": StrValue},
+    {"result": BoolValue},
+    cache_size=256,
+    category="Strings",
 )
 
 
@@ -413,6 +765,8 @@ FormatBlock = BlockType(
     _format,
     {"value": StrValue, "format": StrValue},
     {"result": StrValue},
+    cache_size=256,
+    category="Strings",
 )
 
 # -- Boolean Logic
@@ -424,7 +778,12 @@ def __eq(a: OperationValue, b: OperationValue) -> dict[str, BoolValue]:
 
 
 EqBlock = BlockType(
-    "Equal", __eq, {"a": BoolValue, "b": BoolValue}, {"result": BoolValue}
+    "Equal",
+    __eq,
+    {"a": BoolValue, "b": BoolValue},
+    {"result": BoolValue},
+    variants=_fixed(__eq, {"result": BoolValue}, ANY, ANY),
+    category="Logic",
 )
 
 
@@ -434,7 +793,12 @@ def __neq(a: OperationValue, b: OperationValue) -> dict[str, BoolValue]:
 
 
 NeqBlock = BlockType(
-    "Not Equal", __neq, {"a": BoolValue, "b": BoolValue}, {"result": BoolValue}
+    "Not Equal",
+    __neq,
+    {"a": BoolValue, "b": BoolValue},
+    {"result": BoolValue},
+    variants=_fixed(__neq, {"result": BoolValue}, ANY, ANY),
+    category="Logic",
 )
 
 
@@ -445,8 +809,17 @@ def __lt(a: FloatValue, b: FloatValue) -> dict[str, BoolValue]:
     return {"result": BoolValue(a_.value < b_.value)}
 
 
+def __lt_number(a: FloatValue | IntValue, b: FloatValue | IntValue) -> dict[str, BoolValue]:
+    return {"result": BoolValue(a.value < b.value)}
+
+
 LtBlock = BlockType(
-    "Less", __lt, {"a": FloatValue, "b": FloatValue}, {"result": BoolValue}
+    "Less",
+    __lt,
+    {"a": FloatValue, "b": FloatValue},
+    {"result": BoolValue},
+    variants=_fixed(__lt_number, {"result": BoolValue}, NUMERIC, NUMERIC),
+    category="Logic",
 )
 
 
@@ -457,8 +830,17 @@ def __gt(a: FloatValue, b: FloatValue) -> dict[str, BoolValue]:
     return {"result": BoolValue(a_.value > b_.value)}
 
 
+def __gt_number(a: FloatValue | IntValue, b: FloatValue | IntValue) -> dict[str, BoolValue]:
+    return {"result": BoolValue(a.value > b.value)}
+
+
 GtBlock = BlockType(
-    "Greater", __gt, {"a": FloatValue, "b": FloatValue}, {"result": BoolValue}
+    "Greater",
+    __gt,
+    {"a": FloatValue, "b": FloatValue},
+    {"result": BoolValue},
+    variants=_fixed(__gt_number, {"result": BoolValue}, NUMERIC, NUMERIC),
+    category="Logic",
 )
 
 
@@ -469,8 +851,17 @@ def __leq(a: FloatValue, b: FloatValue) -> dict[str, BoolValue]:
     return {"result": BoolValue(a_.value <= b_.value)}
 
 
+def __leq_number(a: FloatValue | IntValue, b: FloatValue | IntValue) -> dict[str, BoolValue]:
+    return {"result": BoolValue(a.value <= b.value)}
+
+
 LeqBlock = BlockType(
-    "Less Or Equal", __leq, {"a": FloatValue, "b": FloatValue}, {"result": BoolValue}
+    "Less Or Equal",
+    __leq,
+    {"a": FloatValue, "b": FloatValue},
+    {"result": BoolValue},
+    variants=_fixed(__leq_number, {"result": BoolValue}, NUMERIC, NUMERIC),
+    category="Logic",
 )
 
 
@@ -481,8 +872,17 @@ def __geq(a: FloatValue, b: FloatValue) -> dict[str, BoolValue]:
     return {"result": BoolValue(a_.value >= b_.value)}
 
 
+def __geq_number(a: FloatValue | IntValue, b: FloatValue | IntValue) -> dict[str, BoolValue]:
+    return {"result": BoolValue(a.value >= b.value)}
+
+
 GeqBlock = BlockType(
-    "Greater Or Equal", __geq, {"a": FloatValue, "b": FloatValue}, {"result": BoolValue}
+    "Greater Or Equal",
+    __geq,
+    {"a": FloatValue, "b": FloatValue},
+    {"result": BoolValue},
+    variants=_fixed(__geq_number, {"result": BoolValue}, NUMERIC, NUMERIC),
+    category="Logic",
 )
 
 
@@ -492,36 +892,111 @@ def __not(value: OperationValue) -> dict[str, BoolValue]:
     return {"result": BoolValue(not a_.value)}
 
 
-NotBlock = BlockType("Not", __not, {"value": BoolValue}, {"result": BoolValue})
+def __not_any(value: OperationValue) -> dict[str, BoolValue]:
+    return {"result": BoolValue(not value.value)}
+
+
+NotBlock = BlockType(
+    "Not",
+    __not,
+    {"value": BoolValue},
+    {"result": BoolValue},
+    variants=_fixed(__not_any, {"result": BoolValue}, ANY),
+    category="Logic",
+)
 
 
-def __and(a: BoolValue, b: BoolValue) -> dict[str, BoolValue]:
-    """Return `a` logically anded with `b`."""
+def __and(a: BoolValue, b: BoolValue | None = None) -> dict[str, BoolValue]:
+    """Return `a` logically anded with `b`. `b` is only computed if `a` is true."""
     a_ = BoolValue.__acast__(a)
+    if b is None:
+        return {"result": BoolValue(a_.value)}
     b_ = BoolValue.__acast__(b)
     return {"result": BoolValue(a_.value and b_.value)}
 
 
 AndBlock = BlockType(
-    "And", __and, {"a": BoolValue, "b": BoolValue}, {"result": BoolValue}
+    "And",
+    __and,
+    {"a": BoolValue, "b": BoolValue},
+    {"result": BoolValue},
+    lazy=LazyInputs(("a",), lambda a: ("b",) if BoolValue.__acast__(a).value else ()),
+    variants=_fixed(__and, {"result": BoolValue}, ANY, ANY),
+    category="Logic",
 )
 
 
-def __or(a: BoolValue, b: BoolValue) -> dict[str, BoolValue]:
-    """Return `a` logically ored with `b`."""
+def __or(a: BoolValue, b: BoolValue | None = None) -> dict[str, BoolValue]:
+    """Return `a` logically ored with `b`. `b` is only computed if `a` is false."""
     a_ = BoolValue.__acast__(a)
+    if b is None:
+        return {"result": BoolValue(a_.value)}
     b_ = BoolValue.__acast__(b)
     return {"result": BoolValue(a_.value or b_.value)}
 
 
-OrBlock = BlockType("Or", __or, {"a": BoolValue, "b": BoolValue}, {"result": BoolValue})
+OrBlock = BlockType(
+    "Or",
+    __or,
+    {"a": BoolValue, "b": BoolValue},
+    {"result": BoolValue},
+    lazy=LazyInputs(("a",), lambda a: () if BoolValue.__acast__(a).value else ("b",)),
+    variants=_fixed(__or, {"result": BoolValue}, ANY, ANY),
+    category="Logic",
+)
+
+
+def __if(
+    choice: BoolValue,
+    if_true: OperationValue | None = None,
+    if_false: OperationValue | None = None,
+) -> dict[str, OperationValue]:
+    """Choose between two values based on a boolean choice. Only the chosen value is computed."""
+    result = if_true if choice.value else if_false
+    if result is None:
+        raise ValueError("the chosen value was not computed")
+    return {"result": result}
+
+
+IfBlock = BlockType(
+    "Choice",
+    __if,
+    {"if_true": FloatValue, "if_false": FloatValue, "choice": BoolValue},
+    {"result": FloatValue},
+    lazy=LazyInputs(("choice",), lambda choice: ("if_true",) if choice.value else ("if_false",)),
+    # Only the type of the chosen value is known, and only when both agree.
+    variants={
+        (typ, typ, choice): Variant(__if, {"result": typ}) for typ in ANY for choice in ANY
+    },
+    category="Logic",
+)
+
+SELECT_OPTIONS = 4
+
 
+def __select(index: IntValue, **options: OperationValue) -> dict[str, OperationValue]:
+    """Pick one of the options by its index. Only the picked option is computed."""
+    i = IntValue.__acast__(index).value
+    if not 0 <= i < SELECT_OPTIONS:
+        raise ValueError(f"select index {i} is out of range")
+    option = options.get(f"option_{i}", None)
+    if option is None:
+        raise ValueError(f"option_{i} was not computed")
+    return {"result": option}
 
-def __if(if_true: OperationValue, if_false: OperationValue, choice: BoolValue) -> dict[str, OperationValue]:
-    """Choose between two values based on a boolean choice."""
-    return {"result": if_true if choice.value else if_false}
 
-IfBlock = BlockType("Choice", __if, {'if_true': FloatValue, 'if_false': FloatValue, 'choice': BoolValue}, {'result': FloatValue})
+SelectBlock = BlockType(
+    "Select",
+    __select,
+    {"index": IntValue, **{f"option_{i}": FloatValue for i in range(SELECT_OPTIONS)}},
+    {"result": FloatValue},
+    lazy=LazyInputs(("index",), lambda index: (f"option_{IntValue.__acast__(index).value}",)),
+    variants={
+        (IntValue, *(typ,) * SELECT_OPTIONS): Variant(__select, {"result": typ}) for typ in ANY
+    },
+    category="Logic",
+)
+
 
 def __flag(value: IntValue) -> dict[str, BoolValue]:
     a_ = IntValue.__acast__(value)
@@ -549,7 +1024,8 @@ FlagBlock = BlockType(
         'bit_2': BoolValue,
         'bit_1': BoolValue,
         'bit_0': BoolValue, 
-    }
+    },
+    category="Logic",
 )
 
 def __combine(bit_7: BoolValue, bit_6: BoolValue, bit_5: BoolValue, bit_4: BoolValue, bit_3: BoolValue, bit_2: BoolValue, bit_1: BoolValue, bit_0: BoolValue) -> dict[str, IntValue]:
@@ -578,5 +1054,6 @@ CombineBlock = BlockType(
         'bit_1': BoolValue,
         'bit_0': BoolValue, 
     },
-    {'result': IntValue}
+    {'result': IntValue},
+    category="Logic",
 )
\ No newline at end of file
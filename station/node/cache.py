@@ -0,0 +1,217 @@
+"""
+Remember how a graph did on each test case between runs.
+
+A graph's fingerprint hashes what it computes rather than how it's stored:
+the block types, their config, and how they're connected, but never the
+uuids (which are new every time a block is placed). Each block is hashed from
+its type, its config, and the hashes of the blocks feeding it, so the
+fingerprint of a target block covers exactly the blocks it depends on. Moving
+blocks around or adding ones which aren't connected doesn't change it.
+
+The ResultCache keeps the outputs of each test case on disk keyed by the
+fingerprint and a hash of the case's inputs. Whether the outputs pass is
+worked out again on every lookup, so editing a puzzle's expected outputs
+never returns a stale pass. Once the cache grows past its size the least
+recently used graphs are dropped.
+
+This module is imported by the grading workers, so it must not import
+anything which needs a window.
+"""
+
+from __future__ import annotations
+
+import builtins
+import json
+from dataclasses import dataclass
+from hashlib import blake2b
+from pathlib import Path
+from typing import Collection, Mapping
+from uuid import UUID
+
+from .graph import Graph, Block, BlockType, OperationValue, STR_CAST
+
+__all__ = ("CACHE_SIZE", "Outcome", "ResultCache", "fingerprint", "case_key")
+
+# The most bytes the result cache keeps on disk.
+CACHE_SIZE = 8 * 1024 * 1024
+
+
+def _value(value: OperationValue) -> str:
+    # Float values can hold ints, which must hash the same as the float.
+    return f"{value._typ.__name__}:{value._typ(value.value)!r}"
+
+
+def _type_digest(typ: BlockType) -> str:
+    parts = [
+        typ.name,
+        *(f"{name}<{value._typ.__name__}" for name, value in typ.inputs.items()),
+        *(f"{name}>{value._typ.__name__}" for name, value in typ.outputs.items()),
+    ]
+    # Subgraph and loop types are only named in a save, so their bodies are
+    # hashed in too or two different bodies with the same name would collide.
+    if typ.subgraph is not None:
+        subgraph = typ.subgraph
+        parts.append(fingerprint(subgraph.graph, subgraph.output, (subgraph.input,)))
+    if typ.loop is not None:
+        loop = typ.loop
+        parts.append(fingerprint(loop.graph, loop.output, (loop.input,)))
+        parts.append(f"{loop.condition}:{loop.budget}")
+    return blake2b("\n".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def fingerprint(
+    graph: Graph, target: Block | None = None, variable: Collection[Block] = ()
+) -> str:
+    """
+    A stable hash of everything the target block depends on, or of the whole
+    graph when there is no target. The config of the variable blocks (like the
+    input block, which every test case overwrites) is left out.
+    """
+    ignored = {block.uid for block in variable}
+    types: dict[str, str] = {}
+    digests: dict[UUID, str] = {}
+
+    roots = graph.blocks if target is None else (target,)
+    for root in roots:
+        # Depth first without recursing, so long chains are fine.
+        stack: list[tuple[Block, bool]] = [(root, False)]
+        while stack:
+            block, expanded = stack.pop()
+            if block.uid in digests:
+                continue
+            sources = {
+                name: graph.get_connection(uid)
+                for name, uid in block.inputs.items()
+                if uid is not None
+            }
+            if not expanded:
+                stack.append((block, True))
+                stack.extend(
+                    (graph.get_block(connection.source), False)
+                    for connection in sources.values()
+                    if connection.source not in digests
+                )
+                continue
+
+            typ = types.get(block.type.name)
+            if typ is None:
+                typ = types[block.type.name] = _type_digest(block.type)
+            parts = [typ]
+            if block.uid not in ignored:
+                parts.extend(f"{name}={_value(value)}" for name, value in sorted(block.config.items()))
+            parts.extend(
+                f"{name}<{digests[connection.source]}.{connection.output}"
+                for name, connection in sorted(sources.items())
+            )
+            digests[block.uid] = blake2b("\n".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+    if target is not None:
+        return digests[target.uid]
+    # Every block's hash is already unique to what feeds it, so sorting them
+    # gives the same answer whatever order the blocks were added in.
+    return blake2b("\n".join(sorted(digests.values())).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def case_key(inputs: Mapping[str, OperationValue]) -> str:
+    """A stable hash of a test case's inputs."""
+    parts = (f"{name}={_value(value)}" for name, value in sorted(inputs.items()))
+    return blake2b("\n".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+
+@dataclass
+class Outcome:
+    """What a graph gave back for one test case, either its outputs or why it failed."""
+
+    outputs: dict[str, OperationValue]
+    error: Exception | None = None
+
+    def dump(self) -> dict[str, object]:
+        return {
+            "outputs": {
+                name: [value._typ.__name__, value.value] for name, value in self.outputs.items()
+            },
+            "error": None if self.error is None else [type(self.error).__name__, str(self.error)],
+        }
+
+    @classmethod
+    def load(cls, data: dict[str, object]) -> Outcome:
+        outputs = {
+            name: STR_CAST[typ](value)
+            for name, (typ, value) in data["outputs"].items()  # type: ignore -- checked by the caller
+        }
+        error = None
+        if data["error"] is not None:
+            name, message = data["error"]  # type: ignore -- checked by the caller
+            # Errors come back as the same builtin type when there is one.
+            kind = getattr(builtins, name, None)
+            if not (isinstance(kind, type) and issubclass(kind, Exception)):
+                kind = RuntimeError
+            error = kind(message)
+        return cls(outputs, error)
+
+
+class ResultCache:
+    """
+    Test case outcomes stored on disk, one file per graph fingerprint. The
+    files are written whole and swapped into place, so several processes can
+    share a cache without reading half written results.
+    """
+
+    def __init__(self, root: Path, size: int = CACHE_SIZE) -> None:
+        self.root: Path = root
+        self.size: int = size
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.json"
+
+    def get(self, key: str) -> dict[str, Outcome]:
+        """Every outcome stored for the graph, by case key."""
+        path = self._path(key)
+        try:
+            with path.open("r", encoding="utf-8") as fp:
+                data = json.load(fp)
+            outcomes = {case: Outcome.load(item) for case, item in data.items()}
+        except (OSError, ValueError, TypeError, KeyError):
+            # Missing, or written by something else entirely.
+            return {}
+        # Reading counts as a use, so this graph is evicted last.
+        try:
+            path.touch()
+        except OSError:
+            pass
+        return outcomes
+
+    def put(self, key: str, outcomes: Mapping[str, Outcome]) -> None:
+        """Store the outcomes alongside any already stored for the graph."""
+        if not outcomes:
+            return
+        stored = self.get(key)
+        stored.update(outcomes)
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        temporary = path.with_suffix(".tmp")
+        with temporary.open("w", encoding="utf-8") as fp:
+            json.dump({case: outcome.dump() for case, outcome in stored.items()}, fp)
+        temporary.replace(path)
+        self.evict()
+
+    def evict(self) -> None:
+        """Drop the least recently used graphs until the cache fits its size."""
+        entries: list[tuple[float, int, Path]] = []
+        for path in self.root.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.size:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self) -> None:
+        for path in self.root.glob("*.json"):
+            path.unlink(missing_ok=True)
@@ -0,0 +1,197 @@
+"""
+Compile a graph into a single generated python function.
+
+Running a graph through `Graph.compute` builds a BlockComputation, copies the
+config and packs the inputs into a dict for every block. When the same graph
+is run many times (like when grading every test case of a puzzle) that
+overhead dominates. The compiler instead writes out one straight-line
+function which calls each `BlockType.operation` directly, holding every
+result in a local.
+
+Compiled functions are cached on the graph's structure. If the graph has
+changed since it was compiled the function quietly falls back to
+`Graph.evaluate` and `compile_graph` will build a fresh one.
+
+Given the graph's input blocks the compiler will also fold everything which
+doesn't depend on them into constants first (see `optimize`).
+
+Plans with lazy blocks (like Choice) aren't compiled, as a straight-line
+function would run the inputs they skip. Those always use `Graph.evaluate`,
+as does any call given a Budget since the generated function never stops to
+check it.
+"""
+
+from __future__ import annotations
+
+from keyword import iskeyword
+from uuid import UUID
+from weakref import WeakKeyDictionary, ref
+from typing import Any, Callable, Sequence
+
+from .graph import Graph, Block, BlockComputation, Budget, PlanStep
+from .optimize import OptimizedPlan, optimize
+
+__all__ = ("CompiledGraph", "compile_graph", "compute")
+
+# The same exceptions Block.compute catches.
+_CAUGHT = "(TypeError, AttributeError, ValueError, KeyError)"
+
+
+def _keyword(name: str, expr: str) -> str:
+    if name.isidentifier() and not iskeyword(name):
+        return f"{name}={expr}"
+    return f"**{{{name!r}: {expr}}}"
+
+
+def _dict(items: dict[str, str]) -> str:
+    return "{" + ", ".join(f"{name!r}: {expr}" for name, expr in items.items()) + "}"
+
+
+def _generate(
+    plan: tuple[PlanStep, ...],
+    target: Block,
+    constants: dict[UUID, BlockComputation] | None = None,
+) -> tuple[str, dict[str, Any]]:
+    namespace: dict[str, Any] = {
+        "_Computation": BlockComputation,
+        "_cfg": target.config,
+    }
+    folded = constants is not None and target.uid in constants
+    if folded:
+        namespace["_folded"] = constants[target.uid]  # type: ignore -- folded means there are constants
+        if not plan:
+            return "def _compiled():\n    return _folded\n", namespace
+
+    results: dict[UUID, str] = {}
+    for idx, (uid, computation) in enumerate((constants or {}).items()):
+        namespace[f"_k{idx}"] = computation.outputs
+        results[uid] = f"_k{idx}"
+    lines: list[str] = []
+
+    for idx, step in enumerate(plan):
+        block = step.block
+        op, cfg, rslt = f"_op{idx}", f"_cfg{idx}", f"_r{idx}"
+        namespace[op] = block.operation
+        namespace[cfg] = block.config
+        results[block.uid] = rslt
+
+        connected = {name for name, _, _ in step.inputs}
+        if connected != block.inputs.keys():
+            # Mirror the interpreter, which refuses to run a block with
+            # unconnected inputs. Nothing after this can run so stop here.
+            namespace[f"_err{idx}"] = (
+                f"{block.type.name} Block <{block.uid}> missing inputs: "
+                f"{set(block.inputs.keys()).difference(connected)}"
+            )
+            lines.append(f"raise TypeError(_err{idx})")
+            break
+
+        inputs = {
+            name: f"{results[source]}[{output!r}]"
+            for name, source, output in step.inputs
+        }
+        if block.uid == target.uid:
+            # The target's inputs are reported back so they get a real dict.
+            lines.append(f"_inputs = {_dict(inputs)}")
+            inputs = {name: f"_inputs[{name!r}]" for name in inputs}
+
+        if connected.intersection(block.config):
+            # Config and input names collide, let the call fail the same
+            # way the interpreter does.
+            args = f"**{cfg}, **{_dict(inputs)}"
+        else:
+            args = ", ".join(
+                [_keyword(name, f"{cfg}[{name!r}]") for name in block.config]
+                + [_keyword(name, expr) for name, expr in inputs.items()]
+            )
+        lines.append(f"{rslt} = {op}({args})")
+
+    # An inlined subgraph can ignore some of its inputs, leaving steps beside
+    # a folded target. They still run first as any of them could fail.
+    returned = (
+        "_folded"
+        if folded
+        else f"_Computation(_inputs, _cfg.copy(), {results.get(target.uid, '{}')})"
+    )
+    body = "\n        ".join(lines)
+    source = (
+        "def _compiled():\n"
+        "    try:\n"
+        f"        {body}\n"
+        f"    except {_CAUGHT} as e:\n"
+        "        return _Computation({}, _cfg.copy(), {}, e)\n"
+        f"    return {returned}\n"
+    )
+    return source, namespace
+
+
+class CompiledGraph:
+    """
+    A graph and target block compiled into a single python function.
+    Calling it returns the same BlockComputation `Graph.compute` would.
+    """
+
+    def __init__(
+        self, graph: Graph, target: Block, inputs: Sequence[Block] | None = None
+    ) -> None:
+        self._graph = ref(graph)
+        self._target: Block = target
+        self._version: int = graph.version
+
+        self.optimized: OptimizedPlan | None = None
+        self.lazy: bool = any(
+            step.block.type.lazy is not None for step in graph.get_plan(target)
+        )
+        if self.lazy:
+            self.source, namespace = "", {}
+        elif inputs is None:
+            self.source, namespace = _generate(graph.get_plan(target), target)
+        else:
+            self.optimized = optimize(graph, target, inputs)
+            self.source, namespace = _generate(
+                self.optimized.steps, target, self.optimized.constants
+            )
+        if self.lazy:
+            return
+        exec(compile(self.source, f"<compiled {graph.name}>", "exec"), namespace)
+        self._function: Callable[[], BlockComputation] = namespace["_compiled"]
+
+    @property
+    def stale(self) -> bool:
+        graph = self._graph()
+        return graph is None or graph.version != self._version
+
+    def __call__(self, budget: Budget | None = None) -> BlockComputation:
+        graph = self._graph()
+        if graph is None:
+            raise ReferenceError("The compiled graph no longer exists")
+        if self.lazy or budget is not None or graph.version != self._version:
+            return graph.evaluate(self._target, budget)
+        return self._function()
+
+
+_compiled: WeakKeyDictionary[
+    Graph, dict[tuple[UUID, tuple[UUID, ...] | None], CompiledGraph]
+] = WeakKeyDictionary()
+
+
+def compile_graph(
+    graph: Graph, target: Block, inputs: Sequence[Block] | None = None
+) -> CompiledGraph:
+    """
+    Get the compiled function for the target block, only recompiling if the
+    graph has changed since the last time it was compiled.
+
+    When the input blocks are given every other block is treated as constant
+    and folded ahead of time, so only edit the inputs' config between calls.
+    """
+    cache = _compiled.setdefault(graph, {})
+    key = (target.uid, None if inputs is None else tuple(block.uid for block in inputs))
+    compiled = cache.get(key)
+    if compiled is None or compiled.stale:
+        compiled = cache[key] = CompiledGraph(graph, target, inputs)
+    return compiled
+
+
+def compute(graph: Graph, target: Block) -> BlockComputation:
+    return compile_graph(graph, target)()
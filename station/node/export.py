@@ -0,0 +1,403 @@
+"""
+Lower a graph into a python module.
+
+Each output of the graph's output block becomes its own function, which takes
+the input block's values as plain python arguments and returns the output as
+a plain python value. A `run` function computes every output at once. Each
+function runs the same steps `Graph.compute` would for the whole output block,
+so it fails wherever the interpreter would, even on a block the output it
+returns doesn't read (like one feeding an input an inlined subgraph ignores).
+The generated source is meant to be read:
+every block is one line, named after its type, calling the operation the
+graph picked for it (see `BlockType.infer`).
+
+Lazy blocks (like Choice) only run the inputs they pick, the same as
+`Graph.compute`. Blocks which are only ever read through one of those inputs
+are written as nested functions, only called when they're picked.
+
+Unlike `compile_graph` nothing is caught, so an exported function raises
+wherever the interpreter would have failed.
+
+Loop blocks aren't lowered, their bodies are whole graphs run under a budget
+(see `Loop`), so exporting a graph which uses one raises a ValueError.
+
+Modules are cached on disk by the graph's fingerprint (see `cache`), so an
+unchanged graph is only ever lowered and compiled once. To read the code for
+a saved graph:
+
+    python -m station.node.export solution.blk
+"""
+
+from __future__ import annotations
+
+import builtins
+import re
+from argparse import ArgumentParser
+from importlib.util import module_from_spec, spec_from_file_location
+from keyword import iskeyword
+from pathlib import Path
+from types import ModuleType
+from typing import Callable, Sequence
+from uuid import UUID
+
+from .graph import (
+    Graph,
+    Block,
+    BlockOperation,
+    LazyInputs,
+    OperationValue,
+    PlanStep,
+    _variable,
+    _feeding,
+    read_graph,
+)
+from .cache import fingerprint
+from .compiler import _keyword
+from . import blocks  # noqa: F401 -- importing sets up the blocks
+
+__all__ = ("export", "load", "pick")
+
+# The same exceptions `Graph.compute` treats as a lazy block's select failing.
+_CAUGHT = (TypeError, AttributeError, ValueError, KeyError)
+
+
+def pick(
+    lazy: LazyInputs,
+    inputs: dict[str, OperationValue],
+    options: dict[str, Callable[[], OperationValue]],
+) -> dict[str, OperationValue]:
+    """
+    The inputs for a lazy block: its gate inputs, and only the options its
+    select picks given them (every option if select itself fails).
+    """
+    try:
+        selected = [name for name in lazy.select(**inputs) if name in options]
+    except _CAUGHT:
+        selected = list(options)
+    return {**inputs, **{name: options[name]() for name in selected}}
+
+
+def _identifier(name: str, taken: set[str]) -> str:
+    base = re.sub(r"\W+", "_", name.strip()).strip("_").lower() or "value"
+    if base[0].isdigit() or iskeyword(base):
+        base = f"_{base}"
+    identifier, count = base, 1
+    while identifier in taken:
+        count += 1
+        identifier = f"{base}_{count}"
+    taken.add(identifier)
+    return identifier
+
+
+def _literal(value: OperationValue) -> str:
+    raw = value.value
+    if isinstance(raw, float) and (raw != raw or raw in (float("inf"), float("-inf"))):
+        return f"{type(value).__name__}(float({str(raw)!r}))"
+    return f"{type(value).__name__}({raw!r})"
+
+
+class _Module:
+    """The source of an exported module, built up one output at a time."""
+
+    def __init__(self, graph: Graph) -> None:
+        if graph.output_uid is None:
+            raise ValueError(f"Graph {graph.name} has no output block to export")
+        self.graph: Graph = graph
+        self.input: Block | None = (
+            None if graph.input_uid is None else graph.get_block(graph.input_uid)
+        )
+        self.output: Block = graph.get_block(graph.output_uid)
+        self.plan: tuple[PlanStep, ...] = graph.get_plan(self.output)
+
+        # Every module level name, so no local can shadow one.
+        self.names: set[str] = set(dir(builtins)) | {
+            "run", "pick", "cache", "INPUTS", "OUTPUTS", "BlockType",
+            "IntValue", "FloatValue", "StrValue", "BoolValue", "blocks", "_types", "_missing",
+        }
+        self.operations: dict[int, str] = {}
+        self.lazies: dict[str, str] = {}
+        self.header: list[str] = []
+        self.functions: list[str] = []
+
+        # Blocks without inputs (like Int) are constant, so they're written as their outputs.
+        self.constants: dict[UUID, dict[str, OperationValue]] = {}
+        for step in self.plan:
+            block = step.block
+            if block is self.input or block.type.operation is _variable:
+                continue
+            if not block.inputs:
+                try:
+                    result = block.compute()
+                except Exception:  # noqa: BLE001 -- anything which escapes is raised by the exported call instead
+                    result = None
+                if result is not None and result.exception is None:
+                    self.constants[block.uid] = dict(result.outputs)
+                    continue
+            if len(step.inputs) != len(block.inputs):
+                # Never run, just failed (see `_missing`). Subgraphs like this aren't inlined.
+                continue
+            self.operation(block)
+            if block.type.lazy is not None:
+                self.lazy(block)
+
+        self.parameters: dict[str, str] = {
+            port: _identifier(port, self.names)
+            for port in (() if self.input is None else self.input.type.outputs)
+        }
+
+    def operation(self, block: Block) -> str:
+        """The module level name of the block's operation, defined the first time it's used."""
+        operation: BlockOperation = block.operation
+        name = self.operations.get(id(operation))
+        if name is not None:
+            return name
+
+        typ = block.type
+        if typ.loop is not None:
+            raise ValueError(f"{typ.name} blocks can't be exported, loops aren't supported")
+        if typ.subgraph is not None or typ.exclusive:
+            raise ValueError(f"{typ.name} blocks can't be exported, they only exist in this graph")
+        lookup = f"_types[{typ.name!r}].operation"
+        suffix = ""
+        for key, variant in typ.variants.items():
+            if variant.operation is operation:
+                types = ", ".join(value.__name__ for value in key)
+                lookup = f"_types[{typ.name!r}].variants[({types}{',' if len(key) == 1 else ''})].operation"
+                # Variants share functions across keys, so they're named after the
+                # function (`__add_mixed` is add_mixed) rather than the key.
+                parts = operation.__name__.strip("_").split("_", 1)
+                suffix = f"_{parts[1]}" if len(parts) > 1 else ""
+                break
+
+        name = self.operations[id(operation)] = _identifier(typ.name + suffix, self.names)
+        self.header.append(f"{name} = {lookup}")
+        return name
+
+    def lazy(self, block: Block) -> str:
+        """The module level name of the block type's lazy inputs."""
+        name = self.lazies.get(block.type.name)
+        if name is None:
+            name = self.lazies[block.type.name] = _identifier(f"{block.type.name}_lazy", self.names)
+            self.header.append(f"{name} = _types[{block.type.name!r}].lazy")
+        return name
+
+    def function(self, name: str, ports: Sequence[str], doc: str, many: bool = False) -> None:
+        """
+        Write a function computing the ports, returning a dict of them if `many`.
+        Every function runs the steps for the whole output block, not just the ports.
+        """
+        steps = self.plan[:-1]
+        output_inputs = {
+            port: (source, output)
+            for port, source, output in self.plan[-1].inputs
+            if port in ports
+        }
+
+        lazy_steps = {step.block.uid: step for step in steps}
+        eager: set[UUID] = {step.block.uid for step in steps}
+        if any(step.block.type.lazy is not None for step in steps):
+            # The interpreter runs a plan with lazy blocks on demand, so steps the
+            # output never reads are skipped, and blocks only read through inputs
+            # a lazy block might skip are run when they're picked.
+            feeding = _feeding(self.plan, self.output.uid)
+            steps = tuple(step for step in steps if step.block.uid in feeding)
+            eager = {source for _, source, _ in self.plan[-1].inputs}
+            for step in reversed(steps):
+                if step.block.uid not in eager:
+                    continue
+                lazy = step.block.type.lazy
+                eager.update(
+                    source for port, source, _ in step.inputs
+                    if lazy is None or port in lazy.gates
+                )
+
+        taken = set(self.names)
+        counts: dict[str, int] = {}
+        local: dict[UUID, str] = {}
+        for step in steps:
+            base = "inputs" if step.block is self.input else step.block.type.name
+            counts[base] = counts.get(base, 0) + 1
+            local[step.block.uid] = _identifier(
+                base if step.block is self.input else f"{base}_{counts[base]}", taken
+            )
+
+        def read(source: UUID, output: str) -> str:
+            if source in eager:
+                return f"{local[source]}[{output!r}]"
+            return f"{local[source]}()[{output!r}]"
+
+        def call(step: PlanStep) -> str:
+            block = step.block
+            if block is self.input:
+                return "{" + ", ".join(
+                    f"{port!r}: {type(block.config[port]).__name__}({self.parameters[port]})"
+                    for port in block.type.outputs
+                ) + "}"
+
+            constant = self.constants.get(block.uid)
+            if constant is not None:
+                return "{" + ", ".join(f"{port!r}: {_literal(value)}" for port, value in constant.items()) + "}"
+
+            connected = {port for port, _, _ in step.inputs}
+            if connected != block.inputs.keys():
+                missing = set(block.inputs).difference(connected)
+                return f"_missing({block.type.name!r}, {sorted(missing)!r})"
+
+            inputs = {port: read(source, output) for port, source, output in step.inputs}
+            if block.type.operation is _variable:
+                items = {**{port: _literal(value) for port, value in block.config.items()}, **inputs}
+                return "{" + ", ".join(f"{port!r}: {expr}" for port, expr in items.items()) + "}"
+
+            operation = self.operation(block)
+            config = {port: _literal(value) for port, value in block.config.items()}
+            lazy = block.type.lazy
+            if lazy is not None:
+                gates = {port: expr for port, expr in inputs.items() if port in lazy.gates}
+                options = {port: expr for port, expr in inputs.items() if port not in lazy.gates}
+                args = (
+                    f"{self.lazy(block)}, "
+                    "{" + ", ".join(f"{port!r}: {expr}" for port, expr in gates.items()) + "}, "
+                    "{" + ", ".join(f"{port!r}: lambda: {expr}" for port, expr in options.items()) + "}"
+                )
+                if config:
+                    return f"{operation}(**{{{', '.join(f'{p!r}: {e}' for p, e in config.items())}}}, **pick({args}))"
+                return f"{operation}(**pick({args}))"
+            if connected.intersection(config):
+                # Config and input names collide, let the call fail like the interpreter.
+                return (
+                    f"{operation}(**{{{', '.join(f'{p!r}: {e}' for p, e in config.items())}}}, "
+                    f"**{{{', '.join(f'{p!r}: {e}' for p, e in inputs.items())}}})"
+                )
+            args = [_keyword(port, expr) for port, expr in {**config, **inputs}.items()]
+            return f"{operation}({', '.join(args)})"
+
+        # Every function takes every input, even ones it doesn't read, so they can all be called the same way.
+        parameters = [
+            f"{self.parameters[port]}: {value._typ.__name__}"
+            for port, value in ({} if self.input is None else self.input.type.outputs).items()
+        ]
+        lines = [f"def {name}({', '.join(parameters)}):", f'    """{doc}"""']
+        for step in steps:
+            if step.block.uid in eager:
+                continue
+            lines.extend(
+                (
+                    "    @cache",
+                    f"    def {local[step.block.uid]}():",
+                    f"        return {call(lazy_steps[step.block.uid])}",
+                    "",
+                )
+            )
+        for step in steps:
+            if step.block.uid in eager:
+                lines.append(f"    {local[step.block.uid]} = {call(step)}")
+
+        results = {port: f"{read(source, output)}.value" for port, (source, output) in output_inputs.items()}
+        if not many:
+            lines.append(f"    return {results[ports[0]]}")
+        else:
+            lines.append(
+                "    return {" + ", ".join(f"{port!r}: {expr}" for port, expr in results.items()) + "}"
+            )
+        self.functions.append("\n".join(lines))
+
+    def source(self) -> str:
+        ports = tuple(self.output.type.inputs)
+        connected = {port for port, _, _ in self.plan[-1].inputs}
+        if connected != set(ports):
+            raise ValueError(
+                f"The output block of {self.graph.name} is missing inputs: {set(ports) - connected}"
+            )
+        for port in ports:
+            self.function(_identifier(port, self.names), (port,), f"The {port} output of {self.graph.name}.")
+        self.function("run", ports, f"Every output of {self.graph.name}, by name.", many=True)
+
+        parameters = tuple(self.parameters)
+        return "\n".join(
+            (
+                '"""',
+                f"The {self.graph.name} graph, exported by station.node.export.",
+                "",
+                "Generated from the graph, so any edits will be lost when it is exported again.",
+                '"""',
+                "",
+                "from functools import cache",
+                "",
+                "from station.node.graph import BlockType, IntValue, FloatValue, StrValue, BoolValue",
+                "from station.node.export import pick",
+                "from station.node import blocks  # noqa: F401 -- importing sets up the blocks",
+                "",
+                f"INPUTS = {parameters!r}",
+                f"OUTPUTS = {ports!r}",
+                "",
+                "_types = BlockType.__definitions__",
+                *self.header,
+                "",
+                "",
+                "def _missing(name, inputs):",
+                '    raise TypeError(f"{name} Block missing inputs: {set(inputs)}")',
+                "",
+                "",
+                "\n\n\n".join(self.functions),
+                "",
+            )
+        )
+
+
+def export(graph: Graph) -> str:
+    """The python source of the graph, from its input block to its output block."""
+    return _Module(graph).source()
+
+
+_loaded: dict[Path, ModuleType] = {}
+
+
+def load(graph: Graph, directory: Path) -> ModuleType:
+    """
+    Import the exported graph, only writing a new module if no graph with the
+    same fingerprint has been exported to the directory before.
+    """
+    if graph.output_uid is None:
+        raise ValueError(f"Graph {graph.name} has no output block to export")
+    output = graph.get_block(graph.output_uid)
+    key = fingerprint(graph, output)
+    if graph.input_uid is not None:
+        # The functions take every input, even ones no output reads.
+        block = graph.get_block(graph.input_uid)
+        key = fingerprint(graph, output, (block,)) + fingerprint(graph, block, (block,))[:8]
+
+    path = directory / f"graph_{key}.py"
+    module = _loaded.get(path)
+    if module is not None:
+        return module
+    if not path.exists():
+        directory.mkdir(parents=True, exist_ok=True)
+        path.write_text(export(graph), encoding="utf-8")
+
+    spec = spec_from_file_location(f"station_export_{key}", path)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"Could not import the exported graph at {path}")
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    _loaded[path] = module
+    return module
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = ArgumentParser(prog="python -m station.node.export", description=__doc__.split("\n\n")[0])
+    parser.add_argument("graph", type=Path, help="the .blk file to export")
+    parser.add_argument("--input", default="Input", help="the type name of the input block")
+    parser.add_argument("--output", default="Output", help="the type name of the output block")
+    args = parser.parse_args(argv)
+
+    graph = read_graph(args.graph, sandbox=True)
+    for block in graph.blocks:
+        if graph.input_uid is None and block.type.name == args.input:
+            graph.input_uid = block.uid
+        if graph.output_uid is None and block.type.name == args.output:
+            graph.output_uid = block.uid
+    print(export(graph))
+
+
+if __name__ == "__main__":
+    main()
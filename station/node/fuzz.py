@@ -0,0 +1,581 @@
+"""
+Check every evaluator against `Graph.compute` on random graphs.
+
+Random well-typed graphs are built from the registered block types, along
+with a few random subgraph and loop types so inlined plans get checked too: every
+input is wired to an earlier output of the same declared type, constants and
+config get random values (zeros, infinities and nan included), and an input
+block feeds random values in. Each graph is run through every evaluator and
+compared to the interpreter. A result only has to match in whether it failed
+and, if it didn't, in the type and value of every output.
+
+When an evaluator disagrees the graph is shrunk: blocks are dropped or
+bypassed, output ports removed, and values zeroed while the mismatch still
+reproduces. The smallest graph is written as a `.blk`, with the input block's
+config holding the failing inputs, so it opens in the sandbox editor.
+
+The batch evaluator runs a few more rows of random inputs at once, each
+compared to the interpreter on its own, so a row failing or changing type
+in the middle of a column is checked too. Shrinking tries each row alone
+first, but when a mismatch needs several rows only the first is written.
+
+    python -m station.node.fuzz --iterations 500 --output fuzz/
+
+The batch evaluator is only checked when numpy is installed. Exported
+modules give back plain python values, so only those are compared, and graphs
+with loops are skipped since they can't be exported.
+"""
+
+from __future__ import annotations
+
+import math
+import random
+from argparse import ArgumentParser
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Callable, Sequence
+
+from .graph import (
+    Graph,
+    Block,
+    BlockType,
+    Connection,
+    OperationValue,
+    IntValue,
+    FloatValue,
+    StrValue,
+    BoolValue,
+    _variable,
+    define_loop,
+    define_subgraph,
+    write_graph,
+)
+from .compiler import compile_graph
+from .export import export
+from .optimize import optimize, evaluate as evaluate_optimized
+from . import blocks  # noqa: F401 -- importing sets up the blocks
+
+try:
+    from . import batch
+except ImportError:
+    batch = None
+
+__all__ = ("Spec", "EVALUATORS", "BATCHED", "Unsupported", "random_compound", "random_spec", "check", "shrink", "fuzz", "main")
+
+# Rows of inputs given to batched evaluators, on top of the spec's own.
+ROWS = 7
+
+VALUE_TYPES: tuple[type[OperationValue], ...] = (IntValue, FloatValue, StrValue, BoolValue)
+
+# Values worth trying on top of random ones, the edges most likely to disagree.
+EDGES: dict[type[OperationValue], tuple[object, ...]] = {
+    IntValue: (0, 1, -1, 2, 7, -8, 255, 2**31 - 1, -(2**31)),
+    FloatValue: (0.0, -0.0, 0.5, -1.5, 1e-9, 1e300, float("inf"), float("-inf"), float("nan")),
+    StrValue: ("", "0", "12", "-3.5", "abc", "Hello World", "1e3", " 7 "),
+    BoolValue: (True, False),
+}
+
+
+def random_value(rng: random.Random, typ: type[OperationValue]) -> OperationValue:
+    if rng.random() < 0.5:
+        return typ(rng.choice(EDGES[typ]))  # type: ignore -- edges match their type
+    if typ is IntValue:
+        return IntValue(rng.randint(-100, 100))
+    if typ is FloatValue:
+        return FloatValue(round(rng.uniform(-100.0, 100.0), rng.randint(0, 4)))
+    if typ is StrValue:
+        return StrValue("".join(rng.choice("ab1 .-") for _ in range(rng.randint(0, 4))))
+    return BoolValue(rng.random() < 0.5)
+
+
+# -- GRAPHS --
+# Graphs are generated and shrunk as a Spec, and only built into a Graph to
+# run them. Ports are (block index, port name), with index -1 the input block.
+
+Port = tuple[int, str]
+
+
+@dataclass
+class Spec:
+    inputs: dict[str, OperationValue]
+    blocks: list[tuple[BlockType, dict[str, OperationValue]]]
+    wires: dict[Port, Port]
+    outputs: dict[str, Port]
+    name: str = "fuzz"
+    # More inputs after the first, only run by batched evaluators (see `BATCHED`).
+    rows: list[dict[str, OperationValue]] = field(default_factory=list)
+
+    def build(self) -> tuple[Graph, Block, Block]:
+        input_type = BlockType(
+            "Input",
+            _variable,
+            outputs={name: type(value) for name, value in self.inputs.items()},
+            config={name: type(value) for name, value in self.inputs.items()},
+            exclusive=True,
+        )
+        output_type = BlockType(
+            "Output",
+            _variable,
+            inputs={name: self._type(port) for name, port in self.outputs.items()},
+            exclusive=True,
+        )
+        input_block = Block(input_type, **self.inputs)
+        output_block = Block(output_type)
+        graph = Graph(self.name, sandbox=True, input_block=input_block.uid, output_block=output_block.uid)
+        graph.add_block(input_block)
+
+        placed = [Block(typ, **config) for typ, config in self.blocks]
+        for block in placed:
+            graph.add_block(block)
+        graph.add_block(output_block)
+
+        def block(index: int) -> Block:
+            return input_block if index < 0 else placed[index]
+
+        for (target, name), (source, output) in self.wires.items():
+            graph.add_connection(Connection(block(source).uid, output, placed[target].uid, name))
+        for name, (source, output) in self.outputs.items():
+            graph.add_connection(Connection(block(source).uid, output, output_block.uid, name))
+        return graph, input_block, output_block
+
+    def _type(self, port: Port) -> type[OperationValue]:
+        index, name = port
+        if index < 0:
+            return type(self.inputs[name])
+        return self.blocks[index][0].outputs[name]
+
+    def each_row(self) -> list[Spec]:
+        """The spec once for each row of inputs, starting with its own."""
+        return [
+            self,
+            *(replace(self, inputs={name: row[name] for name in self.inputs}, rows=[]) for row in self.rows),
+        ]
+
+    def used(self) -> set[int]:
+        """The blocks the output block depends on."""
+        found: set[int] = set()
+        stack = [index for index, _ in self.outputs.values()]
+        while stack:
+            index = stack.pop()
+            if index < 0 or index in found:
+                continue
+            found.add(index)
+            stack.extend(
+                source for (target, _), (source, _) in self.wires.items() if target == index
+            )
+        return found
+
+    def without(self, removed: set[int]) -> Spec:
+        """Drop the blocks, along with every wire in or out of them."""
+        remap = {-1: -1}
+        kept = []
+        for index, item in enumerate(self.blocks):
+            if index not in removed:
+                remap[index] = len(kept)
+                kept.append(item)
+        wires = {
+            (remap[target], name): (remap[source], output)
+            for (target, name), (source, output) in self.wires.items()
+            if target in remap and source in remap
+        }
+        outputs = {
+            name: (remap[source], output)
+            for name, (source, output) in self.outputs.items()
+            if source in remap
+        }
+        return replace(self, blocks=kept, wires=wires, outputs=outputs)
+
+
+def fuzzable_types(rng: random.Random | None = None) -> tuple[BlockType, ...]:
+    """
+    Every registered block type the fuzzer can place. Given a rng, a few random
+    subgraph and loop types are made from them too (see `random_compound`),
+    each able to use the ones before it. They're repeated so they get placed
+    about as often as a third of the registered types put together.
+    """
+    types = tuple(
+        typ
+        for typ in BlockType.__definitions__.values()
+        if not typ.exclusive and typ.subgraph is None and typ.loop is None
+        and all(value in VALUE_TYPES for value in (*typ.inputs.values(), *typ.outputs.values()))
+    )
+    if rng is None:
+        return types
+    compounds: list[BlockType] = []
+    for index in range(rng.randint(1, 3)):
+        compounds.append(random_compound(rng, (*types, *compounds), f"compound_{index}"))
+    return (*types, *compounds * max(1, len(types) // (3 * len(compounds))))
+
+
+def random_compound(
+    rng: random.Random, types: Sequence[BlockType], name: str = "compound"
+) -> BlockType:
+    """
+    A subgraph or loop block type whose graph is a small random spec of the
+    types. A loop's body gives back a random port of the same type for each
+    value it carries, and a While loop's condition is a random boolean port.
+    """
+    spec = random_spec(rng, rng.randint(1, 4), types)
+    spec.name = name
+    if rng.random() < 0.5:
+        return define_subgraph(name, *spec.build())
+
+    ports = [(-1, port) for port in spec.inputs]
+    ports.extend((index, port) for index, (typ, _) in enumerate(spec.blocks) for port in typ.outputs)
+    spec.outputs = {
+        carried: rng.choice([port for port in ports if spec._type(port) is type(value)])
+        for carried, value in spec.inputs.items()
+    }
+    conditions = [port for port in ports if spec._type(port) is BoolValue]
+    condition = None
+    if conditions and rng.random() < 0.5:
+        condition = "again"
+        spec.outputs[condition] = rng.choice(conditions)
+    # Keep the budget small, random counts are often huge.
+    return define_loop(name, *spec.build(), condition=condition, budget=16)
+
+
+def random_spec(
+    rng: random.Random, size: int = 12, types: Sequence[BlockType] | None = None
+) -> Spec:
+    """
+    A random graph of about `size` blocks. Inputs are wired to earlier outputs
+    of the same type, preferring recent ones, and very occasionally left
+    unconnected so missing inputs are checked too.
+    """
+    types = fuzzable_types() if types is None else types
+    inputs = {
+        f"in_{index}": random_value(rng, rng.choice(VALUE_TYPES))
+        for index in range(rng.randint(1, 3))
+    }
+    available: dict[type[OperationValue], list[Port]] = {typ: [] for typ in VALUE_TYPES}
+    for name, value in inputs.items():
+        available[type(value)].append((-1, name))
+
+    placed: list[tuple[BlockType, dict[str, OperationValue]]] = []
+    wires: dict[Port, Port] = {}
+    while len(placed) < size:
+        typ = rng.choice(types)
+        if any(not available[value] for value in typ.inputs.values()) and rng.random() < 0.9:
+            continue
+        index = len(placed)
+        config = {name: random_value(rng, value) for name, value in typ.config.items()}
+        placed.append((typ, config))
+        for name, value in typ.inputs.items():
+            sources = available[value]
+            if sources and rng.random() < 0.98:
+                wires[(index, name)] = sources[-1 - min(int(rng.expovariate(0.5)), len(sources) - 1)]
+        for name, value in typ.outputs.items():
+            available[value].append((index, name))
+
+    # Read the output off the last few ports, which reach most of the graph.
+    ports = [(-1, name) for name in inputs]
+    ports.extend((index, name) for index, (typ, _) in enumerate(placed) for name in typ.outputs)
+    outputs = {
+        f"out_{count}": port for count, port in enumerate(ports[-rng.randint(1, 3):])
+    }
+    return Spec(inputs, placed, wires, outputs)
+
+
+# -- EVALUATORS --
+# Each runs the output block once with the input block's config as it is,
+# giving its outputs or None if the graph failed.
+
+Outputs = dict[str, OperationValue] | None
+
+
+def _outputs(graph: Graph, input_block: Block, output_block: Block) -> Outputs:
+    graph.mark_dirty(input_block)
+    result = graph.compute(output_block)
+    return None if result.exception is not None else dict(result.outputs)
+
+
+def _evaluate(graph: Graph, input_block: Block, output_block: Block) -> Outputs:
+    result = graph.evaluate(output_block)
+    return None if result.exception is not None else dict(result.outputs)
+
+
+def _compiled(graph: Graph, input_block: Block, output_block: Block) -> Outputs:
+    result = compile_graph(graph, output_block)()
+    return None if result.exception is not None else dict(result.outputs)
+
+
+def _folded(graph: Graph, input_block: Block, output_block: Block) -> Outputs:
+    result = compile_graph(graph, output_block, (input_block,))()
+    return None if result.exception is not None else dict(result.outputs)
+
+
+def _optimized(graph: Graph, input_block: Block, output_block: Block) -> Outputs:
+    result = evaluate_optimized(optimize(graph, output_block, (input_block,)))
+    return None if result.exception is not None else dict(result.outputs)
+
+
+def _batch(
+    graph: Graph, input_block: Block, output_block: Block, rows: Sequence[dict[str, OperationValue]]
+) -> list[Outputs]:
+    columns = {
+        name: batch.Column.from_values([row[name] for row in rows])  # type: ignore -- only used with numpy
+        for name in input_block.type.outputs
+    }
+    result = batch.evaluate(graph, output_block, input_block, columns, len(rows))  # type: ignore -- only used with numpy
+    values = {name: column.values() for name, column in result.outputs.items()}
+    return [
+        None if result.errors[idx] else {name: column[idx] for name, column in values.items()}
+        for idx in range(len(rows))
+    ]
+
+
+# Exported functions give back plain python values, wrapped back up by their type.
+_PLAIN: dict[type, type[OperationValue]] = {bool: BoolValue, int: IntValue, float: FloatValue, str: StrValue}
+
+
+def _plain(outputs: Outputs) -> Outputs:
+    if outputs is None:
+        return None
+    return {name: _PLAIN[type(value.value)](value.value) for name, value in outputs.items()}
+
+
+class Unsupported(Exception):
+    """Raised by an evaluator given a graph it can't run at all, so it isn't checked on it."""
+
+
+def _exported(graph: Graph, input_block: Block, output_block: Block) -> Outputs:
+    if any(step.block.type.loop is not None for step in graph.get_plan(output_block)):
+        raise Unsupported("graphs with loops can't be exported")
+    namespace: dict[str, object] = {}
+    exec(compile(export(graph), f"<export {graph.name}>", "exec"), namespace)
+    values = namespace["run"](*(input_block.config[port].value for port in input_block.type.outputs))  # type: ignore -- defined by the exported source
+    return {name: _PLAIN[type(value)](value) for name, value in values.items()}
+
+
+Evaluator = Callable[[Graph, Block, Block], Outputs]
+# Given every row of inputs at once, giving the outputs of each.
+BatchEvaluator = Callable[[Graph, Block, Block, Sequence[dict[str, OperationValue]]], list[Outputs]]
+
+# The reference interpreter comes first, everything else is compared to it.
+EVALUATORS: dict[str, Evaluator] = {
+    "compute": _outputs,
+    "evaluate": _evaluate,
+    "compiled": _compiled,
+    "folded": _folded,
+    "optimized": _optimized,
+    "export": _exported,
+}
+BATCHED: dict[str, BatchEvaluator] = {}
+if batch is not None:
+    BATCHED["batch"] = _batch
+
+# Evaluators compared to the interpreter's plain python values (see `_plain`).
+PLAIN = {"export"}
+# Evaluators whose floats only have to match to the two decimal places TestCase grades them to.
+ROUNDED = {"batch"}
+
+
+def _run(evaluator: Evaluator, spec: Spec) -> Outputs:
+    graph, input_block, output_block = spec.build()
+    try:
+        return evaluator(graph, input_block, output_block)
+    except Unsupported:
+        raise
+    except Exception:  # noqa: BLE001 -- the interpreter lets some errors escape (like dividing by zero), they still count as failing
+        return None
+
+
+def _run_rows(evaluator: BatchEvaluator, spec: Spec) -> list[Outputs]:
+    graph, input_block, output_block = spec.build()
+    rows = [spec.inputs, *spec.rows]
+    try:
+        return evaluator(graph, input_block, output_block, rows)
+    except Exception:  # noqa: BLE001 -- like `_run`, raising fails every row
+        return [None] * len(rows)
+
+
+def _same_value(a: OperationValue, b: OperationValue, rounded: bool = False) -> bool:
+    # A FloatValue can hold an int (Floor does), which only matters if it
+    # shows up somewhere else, like in a String cast further on.
+    if type(a) is not type(b):
+        return False
+    if isinstance(a.value, float) and math.isnan(a.value):
+        return math.isnan(b.value)  # type: ignore -- both are floats
+    if rounded and isinstance(a.value, float):
+        return round(a.value, 2) == round(b.value, 2)  # type: ignore -- both are floats
+    return a.value == b.value
+
+
+def same(a: Outputs, b: Outputs, rounded: bool = False) -> bool:
+    """Whether both failed or gave the same outputs, `rounded` floats to two decimal places."""
+    if a is None or b is None:
+        return a is b
+    return a.keys() == b.keys() and all(_same_value(a[name], b[name], rounded) for name in a)
+
+
+def check(spec: Spec, evaluators: Sequence[str] | None = None) -> list[str]:
+    """The evaluators which don't match the interpreter on this graph."""
+    names = [name for name in (evaluators or (*EVALUATORS, *BATCHED)) if name != "compute"]
+    expected = _run(EVALUATORS["compute"], spec)
+    every: list[Outputs] | None = None
+    found = []
+    for name in names:
+        if name in BATCHED:
+            if every is None:
+                every = [expected, *(_run(EVALUATORS["compute"], row) for row in spec.each_row()[1:])]
+            results = _run_rows(BATCHED[name], spec)
+            if not all(same(actual, wanted, name in ROUNDED) for actual, wanted in zip(results, every)):
+                found.append(name)
+            continue
+        try:
+            actual = _run(EVALUATORS[name], spec)
+        except Unsupported:
+            continue
+        if not same(actual, _plain(expected) if name in PLAIN else expected):
+            found.append(name)
+    return found
+
+
+# -- SHRINKING --
+
+
+def _candidates(spec: Spec) -> list[Spec]:
+    """Every one step simplification of the graph, smallest first."""
+    found: list[Spec] = []
+
+    if spec.rows:
+        found.extend(spec.each_row()[1:])
+        found.append(replace(spec, rows=[]))
+        if len(spec.rows) > 1:
+            found.extend(
+                replace(spec, rows=spec.rows[:index] + spec.rows[index + 1:])
+                for index in range(len(spec.rows))
+            )
+
+    used = spec.used()
+    if len(used) < len(spec.blocks):
+        found.append(spec.without(set(range(len(spec.blocks))) - used))
+
+    read = {name for index, name in (*spec.wires.values(), *spec.outputs.values()) if index < 0}
+    if len(read) < len(spec.inputs):
+        found.append(replace(spec, inputs={name: spec.inputs[name] for name in read}))
+
+    if len(spec.outputs) > 1:
+        for name in spec.outputs:
+            outputs = {other: port for other, port in spec.outputs.items() if other != name}
+            found.append(replace(spec, outputs=outputs))
+
+    for index in reversed(range(len(spec.blocks))):
+        typ, _ = spec.blocks[index]
+        # Bypass the block: whatever read one of its outputs reads one of its
+        # inputs' sources of the same type instead.
+        for name, value in typ.inputs.items():
+            source = spec.wires.get((index, name))
+            if source is None:
+                continue
+            wires = dict(spec.wires)
+            outputs = dict(spec.outputs)
+            for port, (reading, output) in spec.wires.items():
+                if reading == index and typ.outputs[output] is value:
+                    wires[port] = source
+            for port, (reading, output) in spec.outputs.items():
+                if reading == index and typ.outputs[output] is value:
+                    outputs[port] = source
+            if wires != spec.wires or outputs != spec.outputs:
+                found.append(replace(spec, wires=wires, outputs=outputs).without({index}))
+
+    for name, value in spec.inputs.items():
+        if value != type(value)():
+            found.append(replace(spec, inputs={**spec.inputs, name: type(value)()}))
+    for index, (typ, config) in enumerate(spec.blocks):
+        for name, value in config.items():
+            if value != type(value)():
+                changed = list(spec.blocks)
+                changed[index] = (typ, {**config, name: type(value)()})
+                found.append(replace(spec, blocks=changed))
+    return found
+
+
+def shrink(spec: Spec, evaluator: str, budget: int = 2000) -> Spec:
+    """
+    Greedily simplify the graph while the evaluator still disagrees with the
+    interpreter, trying at most `budget` candidates.
+    """
+    tried = 0
+    progress = True
+    while progress and tried < budget:
+        progress = False
+        for candidate in _candidates(spec):
+            tried += 1
+            if evaluator in check(candidate, (evaluator,)):
+                spec = candidate
+                progress = True
+                break
+            if tried >= budget:
+                break
+    return spec
+
+
+# -- RUNNING --
+
+
+@dataclass
+class Mismatch:
+    seed: int
+    evaluator: str
+    spec: Spec
+    path: Path | None = None
+    size: int = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.size = len(self.spec.blocks)
+
+
+def fuzz(
+    iterations: int,
+    seed: int = 0,
+    size: int = 12,
+    output: Path | None = None,
+    evaluators: Sequence[str] | None = None,
+) -> list[Mismatch]:
+    """
+    Check `iterations` random graphs, shrinking each mismatch found. When
+    given an output directory the shrunk graphs are written there.
+    """
+    found: list[Mismatch] = []
+    for iteration in range(seed, seed + iterations):
+        rng = random.Random(iteration)
+        spec = random_spec(rng, size, fuzzable_types(rng))
+        spec.rows = [
+            {name: random_value(rng, type(value)) for name, value in spec.inputs.items()}
+            for _ in range(ROWS)
+        ]
+        for evaluator in check(spec, evaluators):
+            small = shrink(spec, evaluator)
+            small.name = f"fuzz_{iteration}_{evaluator}"
+            mismatch = Mismatch(iteration, evaluator, small)
+            if output is not None:
+                output.mkdir(parents=True, exist_ok=True)
+                mismatch.path = output / f"{small.name}.blk"
+                write_graph(mismatch.path, small.build()[0])
+            found.append(mismatch)
+    return found
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = ArgumentParser(prog="python -m station.node.fuzz", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--size", type=int, default=12, help="blocks in each random graph")
+    parser.add_argument("--evaluators", nargs="+", choices=(*EVALUATORS, *BATCHED), default=None)
+    parser.add_argument("--output", type=Path, default=Path("fuzz"), help="where to write the shrunk graphs")
+    args = parser.parse_args(argv)
+
+    found = fuzz(args.iterations, args.seed, args.size, args.output, args.evaluators)
+    for mismatch in found:
+        print(
+            f"seed {mismatch.seed}: {mismatch.evaluator} disagrees with compute, "
+            f"shrunk to {mismatch.size} blocks in {mismatch.path}"
+        )
+    print(f"{len(found)} mismatches in {args.iterations} graphs ({', '.join((*EVALUATORS, *BATCHED))})")
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,12 +1,22 @@
 from __future__ import annotations
 
 from pathlib import Path
-from tomllib import load
-from uuid import UUID, uuid4
+from collections import ChainMap, OrderedDict
+from contextvars import ContextVar
+from csv import DictWriter
+from json import dumps as dumps_json
+from time import perf_counter
+from tomllib import load, loads
+from heapq import heappush, heappop
+from sys import getsizeof
+from threading import Event, Lock
+from uuid import UUID, uuid4, uuid5
 from dataclasses import dataclass
-from typing import Self, TypeVar, Any, Generic, Protocol, Mapping, Callable
+from typing import Self, TypeVar, Any, Generic, Mapping, Callable, Iterable, Collection, Sequence
 
-from tomlkit import document, table, aot, inline_table, dump  # type: ignore -- unknownMemberType
+from tomlkit import document, table, aot, inline_table, dump, dumps  # type: ignore -- unknownMemberType
+from tomlkit.items import AoT
+from tomlkit.toml_document import TOMLDocument
 
 
 _value_type = int | float | str | bool
@@ -16,11 +26,28 @@ O_co = TypeVar("O_co", int, float, str, bool, covariant=True)
 
 
 class Value(Generic[T_co]):
+    """
+    An immutable typed value passed between blocks.
+
+    Values are built through `__new__` rather than `__init__` so the common
+    constants (zero, one, true, false, and the empty string) can be handed out
+    as shared singletons instead of allocating a new object every time.
+    """
+
+    __slots__ = ("_value",)
     __auto_castable__: set[type[_value_type]] = set()
     _typ: type[T_co]
+    _value: T_co
 
-    def __init__(self, value: T_co) -> None:
-        self._value: T_co = value
+    def __new__(cls, value: T_co) -> Self:
+        self = object.__new__(cls)
+        self._value = value
+        return self
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        # Go back through the subclass' constructor so unpickling (and copying)
+        # hands out the interned singletons rather than new duplicates.
+        return (self.__class__, (self._value,))
 
     @property
     def type(self) -> type[T_co]:
@@ -34,10 +61,10 @@ class Value(Generic[T_co]):
         return f"{self._typ}<{self._value}>"
 
     def __hash__(self) -> int:
-        return hash((self._typ, self.value))
+        return hash((self._typ, self._value))
 
     def __eq__(self, value: Value[Any]) -> bool:  # type: ignore --
-        return value.type == self.type and value.value == self.value
+        return value.type == self._typ and value.value == self._value
 
     @classmethod
     def __cast__(cls, other: Value[O_co]) -> Self:
@@ -55,11 +82,18 @@ class Value(Generic[T_co]):
 
 
 class IntValue(Value[int]):
+    __slots__ = ()
     __auto_castable__ = set()
     _typ = int
 
-    def __init__(self, value: int | None = None) -> None:
-        super().__init__(value or 0)
+    def __new__(cls, value: int | None = None) -> IntValue:
+        if not value:
+            return INT_ZERO
+        if value == 1 and value.__class__ is int:
+            return INT_ONE
+        self = object.__new__(cls)
+        self._value = value
+        return self
 
     def __add__(self, other: Value[int] | Value[float]):
         try:
@@ -81,30 +115,60 @@ class IntValue(Value[int]):
 
 
 class FloatValue(Value[float]):
+    __slots__ = ()
     __auto_castable__ = {int}
     _typ = float
 
-    def __init__(self, value: float | None = None) -> None:
-        super().__init__(value or 0.0)
+    def __new__(cls, value: float | None = None) -> FloatValue:
+        if not value:
+            return FLOAT_ZERO
+        if value == 1.0 and value.__class__ is float:
+            return FLOAT_ONE
+        self = object.__new__(cls)
+        self._value = value
+        return self
 
 
 class StrValue(Value[str]):
+    __slots__ = ()
     __auto_castable__ = set()
     _typ = str
 
-    def __init__(self, value: str | None = None) -> None:
-        super().__init__(value or "")
+    def __new__(cls, value: str | None = None) -> StrValue:
+        if not value:
+            return STR_EMPTY
+        self = object.__new__(cls)
+        self._value = value
+        return self
 
 
 class BoolValue(Value[bool]):
+    __slots__ = ()
     __auto_castable__ = {str, float, int}
     _typ = bool
 
-    def __init__(self, value: bool | None = None) -> None:
-        super().__init__(value or False)
+    def __new__(cls, value: bool | None = None) -> BoolValue:
+        if not value:
+            return FALSE
+        if value is True:
+            return TRUE
+        self = object.__new__(cls)
+        self._value = value
+        return self
 
     def invert(self) -> BoolValue:
-        return BoolValue(not self.value)
+        return FALSE if self._value else TRUE
+
+
+# The interned constants. Built with `Value.__new__` directly since the
+# subclass constructors are what hand them out.
+INT_ZERO: IntValue = Value.__new__(IntValue, 0)
+INT_ONE: IntValue = Value.__new__(IntValue, 1)
+FLOAT_ZERO: FloatValue = Value.__new__(FloatValue, 0.0)
+FLOAT_ONE: FloatValue = Value.__new__(FloatValue, 1.0)
+STR_EMPTY: StrValue = Value.__new__(StrValue, "")
+TRUE: BoolValue = Value.__new__(BoolValue, True)
+FALSE: BoolValue = Value.__new__(BoolValue, False)
 
 
 OperationValue = IntValue | FloatValue | StrValue | BoolValue
@@ -186,6 +250,554 @@ class BlockComputation:
     config: Mapping[str, OperationValue]
     outputs: Mapping[str, OperationValue]
     exception: Exception | None = None
+    # Seconds spent computing the block, only measured when profiling.
+    duration: float | None = None
+
+
+@dataclass
+class PlanStep:
+    """
+    A single block in a compiled execution plan. The inputs are pre-resolved
+    to (input name, source block uid, source output name) so running the plan
+    never has to look at the graph's connections.
+    """
+
+    block: Block
+    inputs: tuple[tuple[str, UUID, str], ...]
+    # Copied out of a subgraph, so the block isn't part of the graph itself.
+    inlined: bool = False
+
+
+def _feeding(plan: Sequence[PlanStep], target: UUID) -> set[UUID]:
+    """
+    The uids of the steps the target reads from, directly or not, itself
+    included. That's every step unless a subgraph inlined into the plan
+    ignores some of its inputs, and then the plan only runs the others when
+    it is run on demand (see `Graph._compute_lazy`).
+    """
+    feeding = {target}
+    for step in reversed(plan):
+        if step.block.uid in feeding:
+            feeding.update(source for _, source, _ in step.inputs)
+    return feeding
+
+
+@dataclass
+class LazyInputs:
+    """
+    Inputs of a block which are only computed when they're needed. The gate
+    inputs are always computed first, then `select` is called with their values
+    and returns the names of the other inputs the block actually needs.
+    """
+
+    gates: tuple[str, ...]
+    select: Callable[..., Iterable[str]]
+
+
+@dataclass
+class Variant:
+    """
+    A version of a block's operation specialised for concrete input types,
+    so it can skip the type checks and casts the general operation makes.
+    `outputs` are the concrete types it returns.
+    """
+
+    operation: BlockOperation
+    outputs: dict[str, type[OperationValue]]
+
+
+# Concrete port types, None where they can't be known until the graph runs.
+PortTypes = dict[str, "type[OperationValue] | None"]
+
+
+@dataclass
+class LeanPlan:
+    """
+    A plan scheduled for `Graph.evaluate`. `free` lists the slots each step is
+    the last reader of, and `uses` how many inputs read each slot (which lazy
+    plans count down instead, as which steps run isn't known ahead of time).
+    """
+
+    steps: tuple[SlotStep, ...]
+    free: tuple[tuple[int, ...], ...]
+    uses: tuple[int, ...]
+    missing: tuple[str | None, ...]
+    lazy: bool
+
+
+class OperationCache:
+    """
+    A bounded LRU cache of a pure operation's results, keyed on the values
+    (and config) it was called with.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size: int = size
+        self.hits: int = 0
+        self.misses: int = 0
+        self._results: OrderedDict[tuple[Any, ...], OperationReturn] = OrderedDict()
+        # Block types are shared by every graph, including snapshots computed on other threads.
+        self._lock: Lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    @staticmethod
+    def key(values: Mapping[str, OperationValue]) -> tuple[Any, ...]:
+        # FloatValue(1) and FloatValue(1.0) are equal Values but can give
+        # different results (e.g. when formatted) so the raw type is included.
+        return tuple(
+            (name, value, type(value.value)) for name, value in sorted(values.items())
+        )
+
+    def get(self, key: tuple[Any, ...]) -> OperationReturn | None:
+        with self._lock:
+            result = self._results.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._results.move_to_end(key)
+            return result
+
+    def put(self, key: tuple[Any, ...], result: OperationReturn) -> None:
+        with self._lock:
+            self._results[key] = result
+            if len(self._results) > self.size:
+                self._results.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._results.clear()
+            self.hits = self.misses = 0
+
+
+@dataclass
+class ProfileStats:
+    calls: int = 0
+    errors: int = 0
+    total: float = 0.0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.calls if self.calls else 0.0
+
+
+class Profiler:
+    """
+    Records how long each block takes to compute, how often it was run, and
+    how often it failed, both per block and per block type. Pass one to
+    `Graph.compute` or `Graph.compute_many` to turn profiling on.
+
+    Only blocks which actually run are recorded, a block reusing its previous
+    result costs nothing. Mark the graph's input blocks dirty first to time a
+    full evaluation.
+    """
+
+    def __init__(self) -> None:
+        self.blocks: dict[UUID, ProfileStats] = {}
+        self.types: dict[str, ProfileStats] = {}
+        self._names: dict[UUID, str] = {}
+
+    def compute(self, block: Block, inputs: dict[str, OperationValue]) -> BlockComputation:
+        block_stats = self.blocks.get(block.uid)
+        if block_stats is None:
+            block_stats = self.blocks[block.uid] = ProfileStats()
+            self._names[block.uid] = block.type.name
+        type_stats = self.types.setdefault(block.type.name, ProfileStats())
+
+        start = perf_counter()
+        failed = True
+        try:
+            result = block.compute(**inputs)
+            failed = result.exception is not None
+        finally:
+            # Exceptions compute doesn't catch still count before going on up.
+            duration = perf_counter() - start
+            for stats in (block_stats, type_stats):
+                stats.calls += 1
+                stats.errors += failed
+                stats.total += duration
+
+        result.duration = duration
+        return result
+
+    def clear(self) -> None:
+        self.blocks.clear()
+        self.types.clear()
+        self._names.clear()
+
+    def rows(self) -> list[dict[str, Any]]:
+        """Every block then every block type, slowest first."""
+        entries = [
+            ("block", uid.hex, self._names[uid], stats) for uid, stats in self.blocks.items()
+        ] + [("type", name, name, stats) for name, stats in self.types.items()]
+        entries.sort(key=lambda entry: (entry[0], -entry[3].total))
+        return [
+            {
+                "scope": scope,
+                "key": key,
+                "type": name,
+                "calls": stats.calls,
+                "errors": stats.errors,
+                "total": stats.total,
+                "mean": stats.mean,
+            }
+            for scope, key, name, stats in entries
+        ]
+
+    def dumps(self) -> str:
+        return dumps_json(self.rows(), indent=2)
+
+    def write_json(self, path: Path) -> None:
+        with open(path, "w", encoding="utf-8") as fp:
+            fp.write(self.dumps())
+
+    def write_csv(self, path: Path) -> None:
+        rows = self.rows()
+        with open(path, "w", encoding="utf-8", newline="") as fp:
+            writer = DictWriter(
+                fp, ("scope", "key", "type", "calls", "errors", "total", "mean")
+            )
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+class Interrupted(Exception):
+    """An evaluation which was stopped before it finished, see `Budget`."""
+
+
+class BudgetExceeded(Interrupted):
+    """An evaluation which ran past one of the limits of its Budget."""
+
+
+class Cancelled(Interrupted):
+    """An evaluation which was stopped by its CancelToken."""
+
+
+class CancelToken:
+    """
+    Stops an evaluation running on another thread. It's only checked between
+    blocks (and between loop iterations), so the block running when the token
+    is cancelled still finishes first.
+    """
+
+    def __init__(self) -> None:
+        self._event: Event = Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+
+@dataclass
+class Budget:
+    """
+    Limits on a single evaluation, each of which is ignored when None. Steps
+    counts the blocks run (and every block run by each loop iteration), and
+    memory counts the bytes of every value the blocks produce, which is where
+    long strings blow up. Give one to `Graph.compute` or `Graph.evaluate`.
+
+    A Budget only holds the limits so the same one can be used for every
+    evaluation. What each evaluation has used is kept by the Meter it starts.
+    """
+
+    steps: int | None = None
+    seconds: float | None = None
+    memory: int | None = None
+    token: CancelToken | None = None
+
+    def start(self) -> Meter:
+        return Meter(self)
+
+
+class Meter:
+    """How much of its Budget one evaluation has used so far."""
+
+    def __init__(self, budget: Budget) -> None:
+        self.budget: Budget = budget
+        self.steps: int = 0
+        self.memory: int = 0
+        self._deadline: float | None = (
+            None if budget.seconds is None else perf_counter() + budget.seconds
+        )
+
+    def check(self, steps: int = 1) -> None:
+        """Called before running more blocks, raising once any limit is passed."""
+        budget = self.budget
+        if budget.token is not None and budget.token.cancelled:
+            raise Cancelled("The evaluation was cancelled")
+        self.steps += steps
+        if budget.steps is not None and self.steps > budget.steps:
+            raise BudgetExceeded(f"Ran more than the budget of {budget.steps} blocks")
+        if self._deadline is not None and perf_counter() > self._deadline:
+            raise BudgetExceeded(f"Took longer than the budget of {budget.seconds} seconds")
+
+    def spend(self, outputs: Mapping[str, OperationValue]) -> None:
+        """Count the size of the values a block produced."""
+        budget = self.budget
+        if budget.memory is None:
+            return
+        self.memory += sum(getsizeof(value.value) for value in outputs.values())
+        if self.memory > budget.memory:
+            raise BudgetExceeded(f"Produced more than the budget of {budget.memory} bytes")
+
+
+# The meter of the evaluation running in this context, so subgraphs and loops
+# run as the operation of a block count against the same budget.
+_meter: ContextVar[Meter | None] = ContextVar("meter", default=None)
+
+
+class SubGraph:
+    """
+    A graph used as the operation of a block. The graph's input block takes
+    the block's inputs, and the block's outputs are read off its output block.
+
+    Graphs inline subgraph blocks into their own plans (see `Graph.get_plan`),
+    so calling the operation directly is only a fallback for blocks which
+    can't be inlined, like those with unconnected inputs. The graph shouldn't
+    be edited once it is in use as any plans it was inlined into won't notice.
+    """
+
+    def __init__(self, graph: Graph, input_block: Block, output_block: Block) -> None:
+        self.graph: Graph = graph
+        self.input: Block = input_block
+        self.output: Block = output_block
+        # The body is shared by every graph using it, including snapshots on other threads.
+        self._lock: Lock = Lock()
+
+    def __call__(self, **kwds: OperationValue) -> dict[str, OperationValue]:
+        # The graph picked its operation variants for the input block's types.
+        types = self.input.type.outputs
+        with self._lock:
+            self.input.config.update({name: types[name].__acast__(value) for name, value in kwds.items()})  # type: ignore -- point of a cast
+            result = self.graph.compute(self.output)
+        if result.exception is not None:
+            raise result.exception
+        return dict(result.outputs)
+
+
+# The most iterations a single evaluation of a loop block may run.
+LOOP_BUDGET = 100_000
+
+# Where one input of a scheduled block is read from, as (name, index of the
+# source block in the plan, output). Schedules keep every block's outputs in a
+# list of slots in plan order rather than a dict keyed by uid.
+SlotPort = tuple[str, int, str]
+SlotStep = tuple["Block", tuple[SlotPort, ...]]
+
+
+def _run_lazy(
+    steps: tuple[SlotStep, ...],
+    slots: list[Mapping[str, OperationValue] | None],
+    uses: list[int] | None = None,
+    meter: Meter | None = None,
+) -> dict[str, OperationValue]:
+    """
+    Run the last step on demand, running only the inputs each lazy block asks
+    for (the same way `Graph.compute` does) and skipping slots which are already
+    filled. Given how many inputs read each slot, a slot is emptied again once
+    they've all run. Returns the inputs the last step was run with.
+    """
+    last = len(steps) - 1
+    values: dict[str, OperationValue] = {}
+    stack = [last]
+    while stack:
+        idx = stack[-1]
+        if slots[idx] is not None:
+            stack.pop()
+            continue
+
+        block, inputs = steps[idx]
+        if len(inputs) != len(block.inputs):
+            raise TypeError(
+                f"{block.type.name} Block <{block.uid}> missing inputs: "
+                f"{set(block.inputs).difference(name for name, _, _ in inputs)}"
+            )
+        ports = {name: (source, output) for name, source, output in inputs}
+        needed: Collection[str] = ports.keys()
+        lazy = block.type.lazy
+        if lazy is not None:
+            pending = [ports[name][0] for name in lazy.gates if slots[ports[name][0]] is None]
+            if pending:
+                stack.extend(pending)
+                continue
+            try:
+                selected = lazy.select(
+                    **{name: slots[ports[name][0]][ports[name][1]] for name in lazy.gates}  # type: ignore -- computed above
+                )
+                needed = set(lazy.gates).union(name for name in selected if name in ports)
+            except (TypeError, AttributeError, ValueError, KeyError):
+                pass
+
+        pending = [ports[name][0] for name in needed if slots[ports[name][0]] is None]
+        if pending:
+            stack.extend(pending)
+            continue
+        stack.pop()
+        values = {name: slots[ports[name][0]][ports[name][1]] for name in needed}  # type: ignore -- computed above
+        if meter is not None:
+            meter.check()
+        slots[idx] = block.operation(**block.config, **values)
+        if meter is not None:
+            meter.spend(slots[idx])  # type: ignore -- just filled
+
+        if uses is not None:
+            for source, _ in ports.values():
+                uses[source] -= 1
+                if not uses[source] and source != last:
+                    slots[source] = None
+    return values
+
+
+class Loop:
+    """
+    A graph run over and over as the operation of a block. Every iteration the
+    values on the body's output block are fed back into its input block. A
+    Repeat loop runs `count` times, while a While loop runs until its condition
+    output is false. Either fails rather than run past its iteration budget.
+
+    The body's plan is flattened into a schedule once and replayed for every
+    iteration, without any of the bookkeeping `Graph.compute` does. Blocks which
+    don't depend on the loop's values are only run in the first iteration.
+    """
+
+    def __init__(
+        self,
+        graph: Graph,
+        input_block: Block,
+        output_block: Block,
+        condition: str | None = None,
+        budget: int = LOOP_BUDGET,
+    ) -> None:
+        self.graph: Graph = graph
+        self.input: Block = input_block
+        self.output: Block = output_block
+        self.condition: str | None = condition
+        self.budget: int = budget
+        self.carried: tuple[str, ...] = tuple(input_block.type.outputs)
+
+        self._version: int = -1
+        self._steps: tuple[SlotStep, ...] = ()
+        self._start: int | None = None
+        # Body blocks which depend on the input block, in order.
+        self._varying: tuple[int, ...] = ()
+        # When the body has no lazy blocks the first iteration runs every block
+        # but the input, and every one after only the varying blocks.
+        self._first: tuple[tuple[int, BlockOperation, dict[str, OperationValue], tuple[SlotPort, ...]], ...] = ()
+        self._replay: tuple[tuple[int, BlockOperation, dict[str, OperationValue], tuple[SlotPort, ...]], ...] = ()
+        self._lazy: bool = False
+        # Iterations only touch their own slots, but scheduling is shared between threads.
+        self._lock: Lock = Lock()
+
+    def _schedule(self) -> None:
+        with self._lock:
+            if self._version != self.graph.version:
+                self._build_schedule()
+
+    def _build_schedule(self) -> None:
+        plan = self.graph.get_plan(self.output)
+        index = {step.block.uid: idx for idx, step in enumerate(plan)}
+
+        steps: list[SlotStep] = []
+        varying: set[int] = set()
+        for idx, step in enumerate(plan):
+            block = step.block
+            connected = {name for name, _, _ in step.inputs}
+            if block is not self.input and connected != block.inputs.keys():
+                raise TypeError(
+                    f"{block.type.name} Block <{block.uid}> missing inputs: "
+                    f"{set(block.inputs.keys()).difference(connected)}"
+                )
+            inputs = tuple((name, index[source], output) for name, source, output in step.inputs)
+            steps.append((block, inputs))
+            # Plans are in order so every source has already been checked.
+            if block is self.input or any(source in varying for _, source, _ in inputs):
+                varying.add(idx)
+
+        self._steps = tuple(steps)
+        self._start = index.get(self.input.uid, None)
+        self._varying = tuple(sorted(varying.difference((self._start,))))
+        self._first = tuple(
+            (idx, block.operation, block.config, inputs)
+            for idx, (block, inputs) in enumerate(steps)
+            if idx != self._start
+        )
+        self._replay = tuple(
+            (idx, steps[idx][0].operation, steps[idx][0].config, steps[idx][1])
+            for idx in self._varying
+        )
+        self._lazy = any(block.type.lazy is not None for block, _ in steps)
+        self._version = self.graph.version
+
+    def _iterate(
+        self,
+        slots: list[Mapping[str, OperationValue] | None],
+        values: dict[str, OperationValue],
+        first: bool,
+        meter: Meter | None = None,
+    ) -> Mapping[str, OperationValue]:
+        """
+        Run the body once, keeping the outputs of blocks which don't depend on
+        the values. Only the blocks which actually run count against the meter.
+        """
+        if self._start is not None:
+            slots[self._start] = values
+
+        if not self._lazy:
+            replay = self._first if first else self._replay
+            if meter is not None:
+                meter.check(len(replay))
+            for idx, operation, config, inputs in replay:
+                slots[idx] = operation(
+                    **config,
+                    **{name: slots[source][output] for name, source, output in inputs},  # type: ignore -- sources come first
+                )
+            if meter is not None:
+                meter.spend(slots[-1])  # type: ignore -- the output block is always last
+            return slots[-1]  # type: ignore -- the output block is always last
+
+        # Only run what the lazy blocks ask for, the same way Graph.compute does.
+        for idx in self._varying:
+            slots[idx] = None
+        _run_lazy(self._steps, slots, meter=meter)
+        return slots[-1]  # type: ignore -- the output block is always last
+
+    def __call__(self, **kwds: OperationValue) -> dict[str, OperationValue]:
+        self._schedule()
+
+        count = None
+        if self.condition is None:
+            count = IntValue.__acast__(kwds.pop("count")).value
+            if count < 0:
+                raise ValueError(f"Can't repeat a loop {count} times")
+            if count > self.budget:
+                raise ValueError(
+                    f"Repeating {count} times is over the budget of {self.budget} iterations"
+                )
+
+        # The body picked its operation variants for the input block's types, so
+        # the carried values are cast to them going into every iteration.
+        types = self.input.type.outputs
+        values = {name: types[name].__acast__(kwds[name]) for name in self.carried}  # type: ignore -- point of a cast
+        slots: list[Mapping[str, OperationValue] | None] = [None] * len(self._steps)
+        iterations = 0
+        # The evaluation running this loop only gets a look in between iterations.
+        meter = _meter.get()
+        while count is None or iterations < count:
+            if iterations >= self.budget:
+                raise ValueError(
+                    f"Loop didn't finish within the budget of {self.budget} iterations"
+                )
+            outputs = self._iterate(slots, values, iterations == 0, meter)
+            iterations += 1
+            values = {name: types[name].__acast__(outputs[name]) for name in self.carried}  # type: ignore -- point of a cast
+            if self.condition is not None and not BoolValue.__acast__(outputs[self.condition]).value:  # type: ignore -- point of a cast
+                break
+        return values
 
 
 class BlockType:
@@ -201,24 +813,63 @@ class BlockType:
         defaults: dict[str, OperationValue] | None = None,
         *,
         exclusive: bool = False,
+        cache_size: int = 0,
+        lazy: LazyInputs | None = None,
+        variants: dict[tuple[type[OperationValue], ...], Variant] | None = None,
+        category: str = "Other",
     ) -> None:
         if name in self.__definitions__ and not exclusive:
             raise TypeError(
                 f"A non-exclusive block of type {name} has already been defined"
             )
-        if not exclusive:
-            self.__definitions__[name] = self
         self.exclusive = exclusive
 
         self.name: str = name
+        self.category: str = category
         self.operation: BlockOperation = operation
         self.documentation = self.operation.__doc__
+        self.subgraph: SubGraph | None = (
+            operation if isinstance(operation, SubGraph) else None
+        )
+        self.loop: Loop | None = operation if isinstance(operation, Loop) else None
 
         self.inputs: dict[str, type[OperationValue]] = inputs or {}
         self.outputs: dict[str, type[OperationValue]] = outputs or {}
         self.config: dict[str, type[OperationValue]] = config or {}
         self.defaults: dict[str, OperationValue] = defaults or {}
 
+        # Inputs which are skipped unless needed, the operation must give them defaults.
+        self.lazy: LazyInputs | None = lazy
+
+        # Specialised operations keyed on the concrete type of each input (in order).
+        self.variants: dict[tuple[type[OperationValue], ...], Variant] = variants or {}
+
+        # Only pure operations should opt in to caching their results.
+        self.cache: OperationCache | None = (
+            OperationCache(cache_size) if cache_size > 0 else None
+        )
+
+        if not exclusive:
+            self.__definitions__[name] = self
+
+    def infer(self, inputs: PortTypes) -> tuple[BlockOperation, PortTypes]:
+        """
+        Pick the operation to run given the concrete types of the inputs, and
+        work out the concrete types of the outputs. Without a matching variant
+        this is the general operation and the outputs are unknown.
+        """
+        if self.operation is _variable:
+            return self.operation, {**self.config, **inputs}
+        if not self.inputs:
+            if self.subgraph is not None or self.loop is not None:
+                return self.operation, dict.fromkeys(self.outputs)
+            return self.operation, dict(self.outputs)
+        if self.variants:
+            variant = self.variants.get(tuple(inputs.get(name) for name in self.inputs))  # type: ignore -- None never matches
+            if variant is not None:
+                return variant.operation, dict(variant.outputs)
+        return self.operation, dict.fromkeys(self.outputs)
+
     def __str__(self):
         return self.name
 
@@ -226,6 +877,17 @@ class BlockType:
         return self.name
 
 
+def categorise(types: Iterable[BlockType]) -> dict[str, tuple[BlockType, ...]]:
+    """
+    Group some block types (like a graph's available blocks) by category, in
+    the order each category and type first appears.
+    """
+    groups: dict[str, list[BlockType]] = {}
+    for typ in types:
+        groups.setdefault(typ.category, []).append(typ)
+    return {category: tuple(group) for category, group in groups.items()}
+
+
 class Block:
 
     def __init__(
@@ -245,20 +907,50 @@ class Block:
         self.inputs: dict[str, UUID | None] = {name: None for name in typ.inputs}
         self.outputs: dict[str, list[UUID]] = {name: [] for name in typ.outputs}
 
+        # The variant picked by the graph for its inputs' types, see `Graph.get_types`.
+        self.operation: BlockOperation = typ.operation
+
     def __str__(self):
         return f"{self.type}<{self.uid}>"
 
     def __repr__(self):
         return self.__str__()
 
+    def copy(self) -> Block:
+        """The same block with its own config and connection lists."""
+        # Skips __init__, which would build every default config value just to replace it.
+        block = Block.__new__(Block)
+        block.__dict__.update(self.__dict__)
+        block.config = dict(self.config)
+        block.inputs = dict(self.inputs)
+        block.outputs = {name: list(uids) for name, uids in self.outputs.items()}
+        return block
+
     def compute(self, **kwds: OperationValue) -> BlockComputation:
         exception = None
         try:
             if self.inputs.keys() != kwds.keys():
-                raise TypeError(
-                    f"{self.type.name} Block <{self.uid}> missing inputs: {set(self.inputs.keys()).difference(kwds.keys())}"
-                )
-            result = self.type.operation(**self.config, **kwds)
+                missing = set(self.inputs.keys()).difference(kwds.keys())
+                lazy = self.type.lazy
+                if lazy is not None:
+                    # Lazy inputs can be skipped, but still have to be connected.
+                    missing = {
+                        name for name in missing
+                        if name in lazy.gates or self.inputs[name] is None
+                    }
+                if missing:
+                    raise TypeError(
+                        f"{self.type.name} Block <{self.uid}> missing inputs: {missing}"
+                    )
+            cache = self.type.cache
+            if cache is None:
+                result = self.operation(**self.config, **kwds)
+            else:
+                key = cache.key({**self.config, **kwds})
+                result = cache.get(key)
+                if result is None:
+                    result = self.operation(**self.config, **kwds)
+                    cache.put(key, result)
         except (TypeError, AttributeError, ValueError, KeyError) as e:
             print(f"{self} failed due to: {e}")
             exception = e
@@ -311,12 +1003,22 @@ def value_func(cast: type[OperationValue]) -> BlockOperation:
 
 
 IntBlock = BlockType(
-    "Int", value_func(IntValue), None, {"value": IntValue}, {"value": IntValue}
+    "Int",
+    value_func(IntValue),
+    None,
+    {"value": IntValue},
+    {"value": IntValue},
+    category="Values",
 )
 
 
 FloatBlock = BlockType(
-    "Float", value_func(FloatValue), None, {"value": FloatValue}, {"value": FloatValue}
+    "Float",
+    value_func(FloatValue),
+    None,
+    {"value": FloatValue},
+    {"value": FloatValue},
+    category="Values",
 )
 
 
@@ -326,11 +1028,17 @@ BoolBlock = BlockType(
     None,
     {"value": BoolValue},
     {"value": BoolValue},
+    category="Values",
 )
 
 
 StrBlock = BlockType(
-    "String", value_func(StrValue), None, {"value": StrValue}, {"value": StrValue}
+    "String",
+    value_func(StrValue),
+    None,
+    {"value": StrValue},
+    {"value": StrValue},
+    category="Values",
 )
 
 BLOCK_CAST: dict[type, BlockType] = {
@@ -343,14 +1051,102 @@ BLOCK_CAST: dict[type, BlockType] = {
 
 # -- Logic and Looping --
 
-# if, elif, else
-# for loop
-# while loop
+# Conditional blocks (Choice, Select, And, Or) live with the other blocks and
+# use lazy inputs so only the branch they pick is computed.
+
+
+def define_loop(
+    name: str,
+    graph: Graph,
+    input_block: Block | None = None,
+    output_block: Block | None = None,
+    *,
+    condition: str | None = None,
+    budget: int = LOOP_BUDGET,
+) -> BlockType:
+    """
+    Create a block type which runs the graph as the body of a loop. The body's
+    input block holds the values carried between iterations, and its output
+    block must give back a value for each of them.
+
+    Without a condition the block is a Repeat loop, with an extra `count`
+    input for how many times to run the body. With one it's a While loop,
+    which runs the body until the named boolean output of the body is false
+    (always running at least once).
+    """
+    if input_block is None:
+        if graph.input_uid is None:
+            raise ValueError(f"Graph {graph.name} has no input block")
+        input_block = graph.get_block(graph.input_uid)
+    if output_block is None:
+        if graph.output_uid is None:
+            raise ValueError(f"Graph {graph.name} has no output block")
+        output_block = graph.get_block(graph.output_uid)
+
+    if input_block.type.operation is not _variable or input_block.type.config.keys() != input_block.type.outputs.keys():
+        raise ValueError(f"{input_block} can't be used as the input of a loop")
+    if budget < 1:
+        raise ValueError(f"A loop's budget must be at least one iteration, not {budget}")
+
+    carried = dict(input_block.type.outputs)
+    returned = dict(output_block.type.inputs)
+    if condition is not None:
+        if returned.pop(condition, None) is not BoolValue:
+            raise ValueError(f"{output_block} has no boolean {condition} input to use as the condition")
+    elif "count" in carried:
+        raise ValueError("A Repeat loop can't carry a value called count")
+    if returned != carried:
+        raise ValueError(
+            f"{output_block} has to give back exactly the values {input_block} takes"
+        )
+
+    inputs = carried.copy()
+    if condition is None:
+        inputs["count"] = IntValue
+    return BlockType(
+        name,
+        Loop(graph, input_block, output_block, condition, budget),
+        inputs,
+        carried,
+        exclusive=True,
+        category="Loops",
+    )
+
 
 # -- SubGraph --
 
 
-# TODO: ???
+def define_subgraph(
+    name: str,
+    graph: Graph,
+    input_block: Block | None = None,
+    output_block: Block | None = None,
+) -> BlockType:
+    """
+    Create a block type which runs the graph. The input and output blocks
+    default to the graph's own, and the input block must be a variable block
+    whose config holds each input (like a puzzle's Input block).
+    """
+    if input_block is None:
+        if graph.input_uid is None:
+            raise ValueError(f"Graph {graph.name} has no input block")
+        input_block = graph.get_block(graph.input_uid)
+    if output_block is None:
+        if graph.output_uid is None:
+            raise ValueError(f"Graph {graph.name} has no output block")
+        output_block = graph.get_block(graph.output_uid)
+
+    if input_block.type.operation is not _variable or input_block.type.config.keys() != input_block.type.outputs.keys():
+        raise ValueError(f"{input_block} can't be used as the input of a subgraph")
+
+    return BlockType(
+        name,
+        SubGraph(graph, input_block, output_block),
+        dict(input_block.type.outputs),
+        dict(output_block.type.inputs),
+        exclusive=True,
+        category="Subgraphs",
+    )
 
 
 class Graph:
@@ -381,6 +1177,38 @@ class Graph:
         self.input_uid: UUID | None = input_block
         self.output_uid: UUID | None = output_block
 
+        # Execution plans are cached per set of target blocks and thrown away
+        # whenever the structure of the graph changes.
+        self._plans: dict[tuple[UUID, ...], tuple[PlanStep, ...]] = {}
+        # Plans with lazy blocks are run on demand, which needs their steps by uid.
+        self._lazy: dict[tuple[UUID, ...], dict[UUID, PlanStep] | None] = {}
+        self._lean: dict[UUID, LeanPlan] = {}
+        self._version: int = 0
+
+        # The last computation of every block, and which of those are out of
+        # date. Only dirty blocks are re-run by `compute`.
+        self._results: dict[UUID, BlockComputation] = {}
+        self._dirty: set[UUID] = set()
+        # For a snapshot, which blocks of the original were dirty when it was taken.
+        self._taken: frozenset[UUID] = frozenset()
+
+        # A topological order of every block, kept up to date as connections
+        # are added so cycles are caught before they ever reach the graph.
+        self._order: dict[UUID, int] = {}
+        self._next_order: int = 0
+
+        # The concrete type of every block's outputs, kept up to date as
+        # connections change so each block can run its specialised variant.
+        self._types: dict[UUID, PortTypes] = {}
+
+        # The blocks feeding each block and the blocks it feeds, each with how
+        # many connections join the two, so neighbours never go through the
+        # connections. The upstream (False) and downstream (True) cones which
+        # have been asked for are cached, and patched as connections change.
+        self._sources: dict[UUID, dict[UUID, int]] = {}
+        self._targets: dict[UUID, dict[UUID, int]] = {}
+        self._cones: dict[tuple[UUID, bool], frozenset[UUID]] = {}
+
         # TODO: allow for running through select and every test case.
         # TODO: allow setting input and output block
 
@@ -406,11 +1234,178 @@ class Graph:
     def connections(self) -> tuple[Connection, ...]:
         return tuple(self._connections.values())
 
+    @property
+    def version(self) -> int:
+        """Incremented every time a block or connection is added or removed."""
+        return self._version
+
+    def _invalidate(self) -> None:
+        self._version += 1
+        self._plans.clear()
+        self._lazy.clear()
+        self._lean.clear()
+
+    def snapshot(self) -> Graph:
+        """
+        A copy of the graph which can be computed on another thread while this
+        one keeps being edited. Blocks are copied, but share their types and
+        values (which are never changed in place). The last results come along
+        too, so the snapshot only recomputes what this graph would have.
+        """
+        copy = Graph(
+            self._name,
+            self.available,
+            self.sandbox,
+            self.cases,
+            self.input_uid,
+            self.output_uid,
+        )
+        copy._blocks = {uid: block.copy() for uid, block in self._blocks.items()}
+        copy._connections = dict(self._connections)
+        copy._order = dict(self._order)
+        copy._next_order = self._next_order
+        copy._types = dict(self._types)
+        copy._sources = {uid: dict(sources) for uid, sources in self._sources.items()}
+        copy._targets = {uid: dict(targets) for uid, targets in self._targets.items()}
+        copy._cones = dict(self._cones)
+        copy._results = dict(self._results)
+        copy._dirty = set(self._dirty)
+        copy._taken = frozenset(self._dirty)
+        copy._version = self._version
+        return copy
+
+    def adopt(self, snapshot: Graph) -> bool:
+        """
+        Take the results a snapshot of this graph computed, so they aren't
+        computed again. Only possible while the graph's structure hasn't
+        changed since the snapshot was taken, config edits are still spotted
+        when the results are next used.
+        """
+        if snapshot._version != self._version:
+            return False
+        # Anything marked since the snapshot was taken stays dirty.
+        marked = self._dirty.difference(snapshot._taken)
+        self._results.update(
+            (uid, result) for uid, result in snapshot._results.items() if uid not in marked
+        )
+        self._dirty = marked.union(snapshot._dirty)
+        return True
+
+    def mark_dirty(self, block: Block) -> None:
+        """
+        Mark a block and everything downstream of it as needing to be
+        recomputed. Blocks are marked automatically when their connections
+        change, or when `compute` notices their config has changed.
+        """
+        if block.uid in self._dirty:
+            return
+        cone = self._cones.get((block.uid, True))
+        if cone is not None:
+            self._dirty.update(cone)
+            return
+        stack = [block.uid]
+        while stack:
+            uid = stack.pop()
+            # A dirty block's downstream blocks are always dirty too,
+            # so there is no need to walk any further.
+            if uid in self._dirty:
+                continue
+            self._dirty.add(uid)
+            stack.extend(self._targets[uid])
+
+    def get_sources(self, block: Block) -> tuple[Block, ...]:
+        """Every block connected to one of the block's inputs."""
+        return tuple(self._blocks[uid] for uid in self._sources[block.uid])
+
+    def get_consumers(self, block: Block) -> tuple[Block, ...]:
+        """Every block one of the block's outputs is connected to."""
+        return tuple(self._blocks[uid] for uid in self._targets[block.uid])
+
+    def get_upstream(self, block: Block) -> frozenset[UUID]:
+        """The uid of the block and of every block it depends on."""
+        return self._cone(block.uid, False)
+
+    def get_downstream(self, block: Block) -> frozenset[UUID]:
+        """The uid of the block and of every block which depends on it."""
+        return self._cone(block.uid, True)
+
+    def _cone(self, start: UUID, downstream: bool) -> frozenset[UUID]:
+        cone = self._cones.get((start, downstream))
+        if cone is not None:
+            return cone
+        neighbours = self._targets if downstream else self._sources
+        found = {start}
+        stack = [start]
+        while stack:
+            uid = stack.pop()
+            for other in neighbours[uid]:
+                if other in found:
+                    continue
+                # Reuse the cones already worked out rather than walking them again.
+                known = self._cones.get((other, downstream))
+                if known is not None:
+                    found.update(known)
+                    continue
+                found.add(other)
+                stack.append(other)
+        cone = self._cones[(start, downstream)] = frozenset(found)
+        return cone
+
+    def _link(self, source: UUID, target: UUID) -> None:
+        """Record a new connection from the source to the target in the indexes."""
+        targets = self._targets[source]
+        sources = self._sources[target]
+        new = target not in targets
+        targets[target] = targets.get(target, 0) + 1
+        sources[source] = sources.get(source, 0) + 1
+        if not new:
+            return
+
+        # Every cached cone which reaches the source now reaches everything
+        # the target does too, and the other way round. Neither side can be
+        # part of the other's cone as the graph has no cycles.
+        cones = self._cones
+        below = above = None
+        for (uid, downstream), cone in tuple(cones.items()):
+            if downstream and source in cone:
+                below = below or self._cone(target, True)
+                cones[(uid, downstream)] = cone | below
+            elif not downstream and target in cone:
+                above = above or self._cone(source, False)
+                cones[(uid, downstream)] = cone | above
+
+    def _unlink(self, source: UUID, target: UUID) -> None:
+        """Forget a connection from the source to the target in the indexes."""
+        targets = self._targets[source]
+        sources = self._sources[target]
+        targets[target] -= 1
+        sources[source] -= 1
+        if targets[target]:
+            return
+        del targets[target]
+        del sources[source]
+
+        # Whatever else still joins the two is unknown, so every cached cone
+        # which went through this link is worked out again when next asked for.
+        self._cones = {
+            key: cone
+            for key, cone in self._cones.items()
+            if not (source in cone and target in cone)
+        }
+
     def add_block(self, block: Block) -> None:
         if block.uid in self._blocks:
             return
 
         self._blocks[block.uid] = block
+        self._dirty.add(block.uid)
+        self._sources[block.uid] = {}
+        self._targets[block.uid] = {}
+        # A new block has no connections so it can go anywhere in the order.
+        self._order[block.uid] = self._next_order
+        self._next_order += 1
+        self._retype(block.uid)
+        self._invalidate()
 
     def remove_block(self, block: Block) -> None:
         if block.uid not in self._blocks:
@@ -422,10 +1417,28 @@ class Graph:
             self.remove_connection(self._connections[uid])
 
         for output in block.outputs.values():
-            for uid in output:
+            # Removing a connection takes it out of this list.
+            for uid in tuple(output):
                 self.remove_connection(self._connections[uid])
 
         self._blocks.pop(block.uid)
+        self._order.pop(block.uid)
+        self._types.pop(block.uid, None)
+        # Only its own cones can still hold it, as all of its connections are gone.
+        self._sources.pop(block.uid)
+        self._targets.pop(block.uid)
+        self._cones.pop((block.uid, False), None)
+        self._cones.pop((block.uid, True), None)
+        block.operation = block.type.operation
+        self._results.pop(block.uid, None)
+        self._dirty.discard(block.uid)
+        subgraph = block.type.subgraph
+        if subgraph is not None:
+            # The copies inlined into this graph kept results of their own under
+            # uids made from the block's (see `_inline`).
+            for step in subgraph.graph.get_plan(subgraph.output):
+                self._results.pop(uuid5(block.uid, step.block.uid.hex), None)
+        self._invalidate()
 
     def add_connection(self, connection: Connection) -> None:
         if (
@@ -440,6 +1453,9 @@ class Graph:
         source = self._blocks[connection.source]
         target = self._blocks[connection.target]
 
+        # Raises before anything is changed if the connection makes a cycle.
+        self._reorder(connection.source, connection.target)
+
         target_input = target.inputs[connection.input]
         if target_input is not None:
             self.remove_connection(self._connections[target_input])
@@ -448,6 +1464,71 @@ class Graph:
         source.outputs[connection.output].append(connection.uid)
 
         self._connections[connection.uid] = connection
+        self._link(connection.source, connection.target)
+        self.mark_dirty(target)
+        self._retype(target.uid)
+        self._invalidate()
+
+    def creates_cycle(self, source: UUID, target: UUID) -> bool:
+        """
+        Would connecting an output of the source block to an input of the
+        target block create a cycle?
+        """
+        if source == target:
+            return True
+        upper = self._order[source]
+        if upper < self._order[target]:
+            # The source already comes first so nothing downstream of the
+            # target can reach back to it.
+            return False
+        return source in self._reach(target, self._order[target], upper, True)
+
+    def _reach(
+        self, start: UUID, lower: int, upper: int, downstream: bool
+    ) -> set[UUID]:
+        """
+        Find every block reachable from the start block (following outputs when
+        going downstream, and inputs otherwise) whose place in the topological
+        order lies between lower and upper.
+        """
+        order = self._order
+        neighbours = self._targets if downstream else self._sources
+        found = {start}
+        stack = [start]
+        while stack:
+            for uid in neighbours[stack.pop()]:
+                if uid not in found and lower <= order[uid] <= upper:
+                    found.add(uid)
+                    stack.append(uid)
+        return found
+
+    def _reorder(self, source: UUID, target: UUID) -> None:
+        """
+        Keep the topological order valid when connecting the source to the target.
+
+        Only the blocks between the two in the current order can be affected,
+        so just those are shuffled (Pearce and Kelly's dynamic topological sort)
+        rather than sorting the whole graph again.
+        """
+        order = self._order
+        lower, upper = order[target], order[source]
+        if upper < lower:
+            return
+
+        downstream = self._reach(target, lower, upper, True)
+        if source == target or source in downstream:
+            raise ValueError(
+                f"Connecting {self._blocks[source]} to {self._blocks[target]} would create a cycle"
+            )
+        upstream = self._reach(source, lower, upper, False)
+
+        # Everything upstream of the source moves ahead of everything downstream
+        # of the target, reusing the same slots in the order.
+        moved = sorted(upstream, key=order.__getitem__) + sorted(
+            downstream, key=order.__getitem__
+        )
+        for uid, slot in zip(moved, sorted(order[uid] for uid in moved)):
+            order[uid] = slot
 
     def remove_connection(self, connection: Connection) -> None:
         if connection.uid not in self._connections:
@@ -456,84 +1537,498 @@ class Graph:
         self._blocks[connection.source].outputs[connection.output].remove(
             connection.uid
         )
-        self._blocks[connection.target].inputs[connection.input] = None
+        target = self._blocks[connection.target]
+        target.inputs[connection.input] = None
 
         self._connections.pop(connection.uid)
+        self._unlink(connection.source, connection.target)
+        self.mark_dirty(target)
+        self._retype(target.uid)
+        self._invalidate()
+
+    def get_types(self, block: Block) -> PortTypes:
+        """The concrete type of each of the block's outputs, or None if it isn't known."""
+        return self._types[block.uid]
+
+    def _input_types(self, block: Block, types: Mapping[UUID, PortTypes]) -> PortTypes:
+        inputs: PortTypes = {}
+        for name, uid in block.inputs.items():
+            if uid is None:
+                inputs[name] = None
+                continue
+            connection = self._connections[uid]
+            inputs[name] = types[connection.source].get(connection.output, None)
+        return inputs
 
-    def compute(self, target: Block) -> BlockComputation:
+    def _retype(self, start: UUID) -> None:
+        """
+        Infer the output types of the start block, and of every block downstream
+        whose inputs' types change because of it, picking each one's variant.
+        Blocks are visited in topological order so each is only inferred once.
         """
-        Starting from the target block we walk backwards through the connections
-        building a directed connection graph which we then run through forwards.
-        This has the benefit of skipping blocks that aren't connected to the output
-        even if they're in the graph.
+        order = self._order
+        queue = [(order[start], start)]
+        queued = {start}
+        while queue:
+            _, uid = heappop(queue)
+            queued.discard(uid)
+            block = self._blocks[uid]
+            block.operation, types = block.type.infer(self._input_types(block, self._types))
+            if self._types.get(uid) == types:
+                continue
+            self._types[uid] = types
+            for target in self._targets[uid]:
+                if target not in queued:
+                    queued.add(target)
+                    heappush(queue, (order[target], target))
 
-        This can take any block in the graph so for debugging you can query
-        any block.
+    def get_plan(self, target: Block) -> tuple[PlanStep, ...]:
+        """
+        Get the execution plan for the target block. The plan is only rebuilt
+        after a block or connection has been added or removed, so repeated
+        evaluations skip walking the graph entirely.
+        """
+        return self.get_union_plan((target,))
+
+    def get_union_plan(self, targets: Iterable[Block]) -> tuple[PlanStep, ...]:
         """
-        depths: dict[UUID, int] = {}
+        Get a single execution plan which computes every target block. Blocks
+        shared between the targets only appear once. Cached the same way as
+        `get_plan`.
+        """
+        targets = tuple({target.uid: target for target in targets}.values())
+        key = tuple(target.uid for target in targets)
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = self._plans[key] = self._build_plan(targets)
+        return plan
+
+    def _get_lazy_steps(self, targets: tuple[Block, ...]) -> dict[UUID, PlanStep] | None:
+        """The union plan's steps by uid if it has any lazy blocks, otherwise None."""
+        key = tuple({target.uid: None for target in targets})
+        if key not in self._lazy:
+            plan = self.get_union_plan(targets)
+            self._lazy[key] = (
+                {step.block.uid: step for step in plan}
+                if any(step.block.type.lazy is not None for step in plan)
+                else None
+            )
+        return self._lazy[key]
+
+    def _get_lean_plan(self, target: Block) -> LeanPlan:
+        """Schedule the target's plan into slots, working out when each slot is last read."""
+        lean = self._lean.get(target.uid)
+        if lean is not None:
+            return lean
+
+        plan = self.get_plan(target)
+        index = {step.block.uid: idx for idx, step in enumerate(plan)}
+        steps: list[SlotStep] = []
+        last: dict[int, int] = {}
+        uses = [0] * len(plan)
+        missing: list[str | None] = []
+        for idx, step in enumerate(plan):
+            inputs = tuple((name, index[source], output) for name, source, output in step.inputs)
+            steps.append((step.block, inputs))
+            for _, source, _ in inputs:
+                last[source] = idx
+                uses[source] += 1
+            # Formatted once here so failing runs don't pay for it.
+            connected = {name for name, _, _ in inputs}
+            missing.append(
+                None
+                if connected == step.block.inputs.keys()
+                else f"{step.block.type.name} Block <{step.block.uid}> missing inputs: "
+                f"{set(step.block.inputs).difference(connected)}"
+            )
+
+        free: list[list[int]] = [[] for _ in plan]
+        for source, idx in last.items():
+            free[idx].append(source)
+        lean = self._lean[target.uid] = LeanPlan(
+            tuple(steps),
+            tuple(tuple(slots) for slots in free),
+            tuple(uses),
+            tuple(missing),
+            any(step.block.type.lazy is not None for step in plan),
+        )
+        return lean
+
+    def _build_plan(self, targets: tuple[Block, ...]) -> tuple[PlanStep, ...]:
+        """
+        Starting from the target blocks we walk backwards through the connections
+        to find every block they depend on, then schedule them forwards layer by
+        layer (Kahn's algorithm). This has the benefit of skipping blocks that
+        aren't connected to the output even if they're in the graph, and neither
+        step recurses so very long chains of blocks are fine.
+        """
+        # Every block the targets depend on, and how many of its inputs are connected.
+        waiting: dict[UUID, int] = {}
+        stack = list(targets)
+        while stack:
+            block = stack.pop()
+            if block.uid in waiting:
+                continue
+            sources = [
+                self._connections[uid].source
+                for uid in block.inputs.values()
+                if uid is not None
+            ]
+            waiting[block.uid] = len(sources)
+            stack.extend(self._blocks[uid] for uid in sources if uid not in waiting)
+
         layers: list[list[Block]] = []
+        layer = [self._blocks[uid] for uid, count in waiting.items() if count == 0]
+        while layer:
+            layers.append(layer)
+            next_layer: list[Block] = []
+            for block in layer:
+                for output in block.outputs.values():
+                    for uid in output:
+                        successor = self._connections[uid].target
+                        if successor not in waiting:
+                            continue
+                        waiting[successor] -= 1
+                        if not waiting[successor]:
+                            next_layer.append(self._blocks[successor])
+            layer = next_layer
+
+        plan: list[PlanStep] = []
+        for layer in layers:
+            for block in layer:
+                inputs: list[tuple[str, UUID, str]] = []
+                for name, uid in block.inputs.items():
+                    if uid is None:
+                        continue
+                    connection = self._connections[uid]
+                    inputs.append((name, connection.source, connection.output))
+                if block.type.subgraph is not None and len(inputs) == len(block.inputs):
+                    plan.extend(self._inline(block, inputs))
+                else:
+                    plan.append(PlanStep(block, tuple(inputs)))
 
-        def _find_predicessors(block: Block, seen: set[UUID]) -> int:
-            if block.uid in depths:
-                return depths[block.uid] + 1
+        return tuple(plan)
 
-            if block.uid in seen:
-                raise RecursionError(f"Block {block} refers to itself")
+    def _inline(
+        self, instance: Block, inputs: list[tuple[str, UUID, str]]
+    ) -> list[PlanStep]:
+        """
+        Copy the plan of a subgraph block's graph into this one. Each block is
+        given a uid unique to this instance so every instance keeps its own
+        results, and the copy of the output block takes the instance's uid so
+        blocks downstream read from it like any other block.
+        """
+        subgraph = instance.type.subgraph
+        assert subgraph is not None
+        sources = {name: (source, output) for name, source, output in inputs}
+
+        uids: dict[UUID, UUID] = {}
+        steps: list[PlanStep] = []
+        # The copies pick their variants from the types actually flowing in.
+        types = ChainMap[UUID, PortTypes]({}, self._types)
+        for step in subgraph.graph.get_plan(subgraph.output):
+            inner = step.block
+            if inner.uid == subgraph.input.uid:
+                continue
 
-            seen = seen.union([block.uid])
-            depth = 0
+            step_inputs = tuple(
+                (name, *sources[output])
+                if source == subgraph.input.uid
+                else (name, uids[source], output)
+                for name, source, output in step.inputs
+            )
+            uid = uids[inner.uid] = (
+                instance.uid
+                if inner.uid == subgraph.output.uid
+                else uuid5(instance.uid, inner.uid.hex)
+            )
+            block = Block(inner.type, uid)
+            block.config = inner.config
+            block.inputs = dict(inner.inputs)
+            block.operation, types[uid] = inner.type.infer(
+                {name: types[source].get(output, None) for name, source, output in step_inputs}
+            )
+            steps.append(PlanStep(block, step_inputs, inlined=True))
 
-            for uid in block.inputs.values():
-                if uid is None:
-                    continue
-                connection = self._connections[uid]
-                input_block = self._blocks[connection.source]
-                depth = max(depth, _find_predicessors(input_block, seen))
+        return steps
 
-            depths[block.uid] = depth
+    def _run_step(
+        self,
+        step: PlanStep,
+        profiler: Profiler | None,
+        needed: Collection[str] | None = None,
+        meter: Meter | None = None,
+    ) -> BlockComputation:
+        """
+        Compute one step of a plan, unless the block's last result is still
+        valid. Only the needed inputs (every input by default) are passed on.
+        Only blocks which are actually run count against the meter.
+        """
+        block = step.block
+        results = self._results
+        inputs = (
+            step.inputs
+            if needed is None
+            else tuple(port for port in step.inputs if port[0] in needed)
+        )
 
-            if depth == len(layers):
-                layers.append([])
-            layers[depth].append(block)
+        result = results.get(block.uid)
+        if (
+            result is not None
+            and block.uid not in self._dirty
+            and result.config == block.config
+            # Inlined blocks aren't in the graph so are never marked dirty, instead
+            # they're re-run whenever any of their inputs is a different value.
+            and not (
+                step.inlined
+                and any(
+                    result.inputs.get(name) is not results[source].outputs.get(output)
+                    for name, source, output in inputs
+                )
+            )
+        ):
+            return result
 
-            return depth + 1
+        # Config is edited in place so changes are only spotted here.
+        if not step.inlined or block.uid in self._blocks:
+            self.mark_dirty(block)
+        values: dict[str, OperationValue] = {
+            name: results[source].outputs[output] for name, source, output in inputs
+        }
+        if meter is not None:
+            meter.check()
+        if profiler is None:
+            result = results[block.uid] = block.compute(**values)
+        else:
+            result = results[block.uid] = profiler.compute(block, values)
+        self._dirty.discard(block.uid)
+        if meter is not None:
+            meter.spend(result.outputs)
+        return result
 
-        _find_predicessors(target, set())
+    def _compute_lazy(
+        self,
+        steps: dict[UUID, PlanStep],
+        targets: tuple[Block, ...],
+        profiler: Profiler | None,
+        meter: Meter | None = None,
+    ) -> dict[UUID, BlockComputation]:
+        """
+        Compute the targets on demand rather than sweeping the whole plan. Each
+        block asks for just the inputs it needs, so the inputs a lazy block
+        (like Choice) doesn't use are never computed. Uses an explicit stack so
+        long chains are fine.
+        """
+        done: dict[UUID, BlockComputation | Exception] = {}
+        for target in targets:
+            stack = [target.uid]
+            while stack:
+                uid = stack[-1]
+                if uid in done:
+                    stack.pop()
+                    continue
+
+                step = steps[uid]
+                ports = {name: (source, output) for name, source, output in step.inputs}
+                needed: Collection[str] = ports.keys()
+                lazy = step.block.type.lazy
+                if lazy is not None and all(name in ports for name in lazy.gates):
+                    pending = [ports[name][0] for name in lazy.gates if ports[name][0] not in done]
+                    if pending:
+                        stack.extend(pending)
+                        continue
+                    gates = {name: done[ports[name][0]] for name in lazy.gates}
+                    if not any(isinstance(gate, Exception) for gate in gates.values()):
+                        try:
+                            selected = lazy.select(
+                                **{
+                                    name: gate.outputs[ports[name][1]]  # type: ignore -- checked above
+                                    for name, gate in gates.items()
+                                }
+                            )
+                            needed = set(lazy.gates).union(
+                                name for name in selected if name in ports
+                            )
+                        except (TypeError, AttributeError, ValueError, KeyError):
+                            # Let the block itself fail with all of its inputs.
+                            pass
+
+                pending = [ports[name][0] for name in needed if ports[name][0] not in done]
+                if pending:
+                    stack.extend(pending)
+                    continue
+                stack.pop()
+
+                failures = [
+                    done[ports[name][0]]
+                    for name in needed
+                    if isinstance(done[ports[name][0]], Exception)
+                ]
+                if failures:
+                    done[uid] = failures[0]
+                    continue
+                result = self._run_step(step, profiler, needed, meter)
+                done[uid] = result if result.exception is None else result.exception
 
         computations: dict[UUID, BlockComputation] = {}
+        for target in targets:
+            result = done[target.uid]
+            if isinstance(result, Exception):
+                result = BlockComputation({}, target.config.copy(), {}, result)
+            computations[target.uid] = result
+        return computations
+
+    def compute(
+        self,
+        target: Block,
+        profiler: Profiler | None = None,
+        budget: Budget | None = None,
+    ) -> BlockComputation:
+        """
+        Run the cached execution plan of the target block (see `get_plan`).
+        Blocks whose inputs and config haven't changed since they were last
+        computed reuse their previous result, so only the dirty part of the
+        plan is actually re-run.
 
-        for layer in layers:
-            for block in layer:
-                inputs: dict[str, OperationValue] = {}
-                for name, uid in block.inputs.items():
-                    if uid is None:
-                        continue
-                    connection = self._connections[uid]
-                    computation = computations[connection.source]
-                    inputs[name] = computation.outputs[connection.output]
+        This can take any block in the graph so for debugging you can query
+        any block. Give a profiler to time every block which is run.
 
-                result: BlockComputation = block.compute(**inputs)
-                computations[block.uid] = result
+        If the plan has any lazy blocks it is run on demand instead, so their
+        unused inputs are skipped (see `_compute_lazy`).
+
+        Given a budget the computation stops with a BudgetExceeded (or
+        Cancelled) exception as soon as it runs out. Whatever was computed
+        before then is kept, so computing again picks up where it stopped.
+        """
+        meter = _meter.get() if budget is None else budget.start()
+        active = _meter.set(meter)
+        try:
+            lazy = self._get_lazy_steps((target,))
+            if lazy is not None:
+                return self._compute_lazy(lazy, (target,), profiler, meter)[target.uid]
+
+            for step in self.get_plan(target):
+                result = self._run_step(step, profiler, None, meter)
                 if result.exception is not None:
                     # early exit if we hit an exception (and so can't find target value)
-                    computations[target.uid] = BlockComputation(
-                        {}, target.config.copy(), {}, result.exception
-                    )
-                    break
+                    return BlockComputation({}, target.config.copy(), {}, result.exception)
+        except Interrupted as e:
+            return BlockComputation({}, target.config.copy(), {}, e)
+        finally:
+            _meter.reset(active)
+
+        return self._results[target.uid]
+
+    def evaluate(self, target: Block, budget: Budget | None = None) -> BlockComputation:
+        """
+        Compute the target block without keeping a record of anything else,
+        which is all grading needs. Unlike `compute` nothing is reused from or
+        stored for the next run, no BlockComputation is built for any block but
+        the target, and failures aren't printed. Every other block's outputs
+        are dropped as soon as the last block reading them has run.
 
-        return computations[target.uid]
+        The budget works the same as for `compute`.
+        """
+        lean = self._get_lean_plan(target)
+        slots: list[Mapping[str, OperationValue] | None] = [None] * len(lean.steps)
+        values: dict[str, OperationValue] = {}
+        meter = _meter.get() if budget is None else budget.start()
+        active = _meter.set(meter)
+        try:
+            if lean.lazy:
+                values = _run_lazy(lean.steps, slots, list(lean.uses), meter)
+            else:
+                for idx, (block, inputs) in enumerate(lean.steps):
+                    missing = lean.missing[idx]
+                    if missing is not None:
+                        raise TypeError(missing)
+                    values = {name: slots[source][output] for name, source, output in inputs}  # type: ignore -- sources come first
+                    if meter is not None:
+                        meter.check()
+                    slots[idx] = block.operation(**block.config, **values)
+                    if meter is not None:
+                        meter.spend(slots[idx])  # type: ignore -- just filled
+                    for slot in lean.free[idx]:
+                        slots[slot] = None
+        except (TypeError, AttributeError, ValueError, KeyError, Interrupted) as e:
+            return BlockComputation({}, target.config.copy(), {}, e)
+        finally:
+            _meter.reset(active)
+        return BlockComputation(values, target.config.copy(), slots[-1])  # type: ignore -- the target is always last
+
+    def compute_many(
+        self,
+        targets: Iterable[Block],
+        profiler: Profiler | None = None,
+        budget: Budget | None = None,
+    ) -> dict[UUID, BlockComputation]:
+        """
+        Compute several blocks in one pass over their union plan (see
+        `get_union_plan`), so any blocks they share are only run once. Returns
+        the computation of each target by its uid.
+
+        Unlike `compute` an exception doesn't stop the whole pass, only the
+        blocks downstream of the one which failed are skipped. Running out of
+        budget does stop it, failing every target.
+        """
+        targets = tuple(targets)
+        meter = _meter.get() if budget is None else budget.start()
+        active = _meter.set(meter)
+        failed: dict[UUID, Exception] = {}
+        try:
+            lazy = self._get_lazy_steps(targets)
+            if lazy is not None:
+                return self._compute_lazy(lazy, targets, profiler, meter)
+
+            for step in self.get_union_plan(targets):
+                block = step.block
+                if failed:
+                    upstream = [failed[source] for _, source, _ in step.inputs if source in failed]
+                    if upstream:
+                        failed[block.uid] = upstream[0]
+                        continue
+
+                result = self._run_step(step, profiler, None, meter)
+                if result.exception is not None:
+                    failed[block.uid] = result.exception
+        except Interrupted as e:
+            return {
+                target.uid: BlockComputation({}, target.config.copy(), {}, e)
+                for target in targets
+            }
+        finally:
+            _meter.reset(active)
+
+        return {
+            target.uid: (
+                BlockComputation({}, target.config.copy(), {}, failed[target.uid])
+                if target.uid in failed
+                else self._results[target.uid]
+            )
+            for target in targets
+        }
 
 
 def read_graph(path: Path, sandbox: bool = False) -> Graph:
     with open(path, "rb") as fp:
         raw_data = load(fp)
+    return _parse_graph(raw_data, sandbox)
+
+
+def loads_graph(data: str, sandbox: bool = False) -> Graph:
+    return _parse_graph(loads(data), sandbox)
 
+
+def _parse_graph(raw_data: dict[str, Any], sandbox: bool) -> Graph:
     config_table = raw_data["Config"]
     block_table = raw_data.get("Block", {})
     connection_table = raw_data.get("Connection", {})
 
     defined_types: dict[str, BlockType] = {}
-    for variable_data in block_table.get("Variable", ()):
+    # Graphs have always been written with "Variables", but were read as "Variable".
+    variable_table = block_table.get("Variables", block_table.get("Variable", ()))
+    defined_types.update(_parse_subgraphs(block_table))
+    for variable_data in variable_table:
         inputs = {name: STR_CAST[typ] for name, typ in variable_data["inputs"].items()}
         outputs = {
             name: STR_CAST[typ] for name, typ in variable_data["outputs"].items()
@@ -585,6 +2080,15 @@ def read_graph(path: Path, sandbox: bool = False) -> Graph:
 
 
 def write_graph(path: Path, graph: Graph) -> None:
+    with open(path, "w", encoding="utf-8") as fp:
+        dump(_build_document(graph), fp)
+
+
+def dumps_graph(graph: Graph) -> str:
+    return dumps(_build_document(graph))
+
+
+def _build_document(graph: Graph) -> TOMLDocument:
     toml = document()
 
     config_table = table()
@@ -609,7 +2113,7 @@ def write_graph(path: Path, graph: Graph) -> None:
 
         blocks.append(subtable)  # type: ignore -- unknownMemberType
 
-        if block.type.exclusive:
+        if block.type.exclusive and block.type.subgraph is None and block.type.loop is None:
             type_table = table()
             input_table = inline_table()
             input_table.update(  # type: ignore -- unknownMemberType
@@ -630,6 +2134,9 @@ def write_graph(path: Path, graph: Graph) -> None:
             type_table["outputs"] = output_table
             variables.append(type_table)  # type: ignore -- unknownMemberType
 
+    subgraphs = _build_subgraphs(graph.blocks)
+    if subgraphs:
+        block_table["SubGraphs"] = subgraphs
     block_table["Variables"] = variables
     block_table["Data"] = blocks
     toml["Block"] = block_table
@@ -645,5 +2152,52 @@ def write_graph(path: Path, graph: Graph) -> None:
     connection_table["Data"] = connections
     toml["Connection"] = connection_table
 
-    with open(path, "w", encoding="utf-8") as fp:
-        dump(toml, fp)
+    return toml
+
+
+def _build_subgraphs(blocks: Iterable[Block]) -> AoT:
+    """
+    Every subgraph and loop body used by the blocks, each written once no
+    matter how many blocks use it. The graph is stored as its own document.
+    """
+    subgraphs = aot()
+    written: set[str] = set()
+    for block in blocks:
+        subgraph = block.type.subgraph or block.type.loop
+        if subgraph is None or block.type.name in written:
+            continue
+        written.add(block.type.name)
+
+        subtable = table()
+        subtable["name"] = block.type.name
+        subtable["input"] = subgraph.input.uid.hex
+        subtable["output"] = subgraph.output.uid.hex
+        subtable["graph"] = dumps(_build_document(subgraph.graph))
+        if isinstance(subgraph, Loop):
+            subtable["loop"] = "repeat" if subgraph.condition is None else "while"
+            if subgraph.condition is not None:
+                subtable["condition"] = subgraph.condition
+            subtable["budget"] = subgraph.budget
+        subgraphs.append(subtable)  # type: ignore -- unknownMemberType
+    return subgraphs
+
+
+def _parse_subgraphs(block_table: dict[str, Any]) -> dict[str, BlockType]:
+    defined_types: dict[str, BlockType] = {}
+    for subgraph_data in block_table.get("SubGraphs", ()):
+        graph = loads_graph(subgraph_data["graph"], sandbox=True)
+        name = subgraph_data["name"]
+        input_block = graph.get_block(UUID(subgraph_data["input"]))
+        output_block = graph.get_block(UUID(subgraph_data["output"]))
+        if "loop" in subgraph_data:
+            defined_types[name] = define_loop(
+                name,
+                graph,
+                input_block,
+                output_block,
+                condition=subgraph_data.get("condition", None),
+                budget=subgraph_data.get("budget", LOOP_BUDGET),
+            )
+        else:
+            defined_types[name] = define_subgraph(name, graph, input_block, output_block)
+    return defined_types
@@ -0,0 +1,97 @@
+"""
+Compute the editor's output block off the main thread.
+
+Every time the player finishes an edit the editor wants the output block's
+values, and computing them in the middle of a frame stalls it for as long as
+the graph takes. Instead the graph is snapshotted (see `Graph.snapshot`) and
+the snapshot is computed on a worker thread while the player keeps editing the
+original. `LiveEvaluator.poll` never blocks, so it can be called every frame.
+
+Only the newest edit matters: submitting a new job cancels the one before
+it. A job which hasn't started never will, and one which is already running
+is stopped at the next block through its CancelToken. Either way its result
+is never shown.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import replace
+
+from .graph import Graph, Block, BlockComputation, Budget, CancelToken
+
+__all__ = ("LiveEvaluator",)
+
+
+class LiveEvaluator:
+    """
+    Computes one target block of a graph at a time on a single worker thread.
+    The thread is only started once the first job is submitted. Every job is
+    limited by the budget, if there is one.
+    """
+
+    def __init__(self, budget: Budget | None = None) -> None:
+        self.budget: Budget = budget or Budget()
+        self._executor: ThreadPoolExecutor | None = None
+        self._graph: Graph | None = None
+        self._snapshot: Graph | None = None
+        self._future: Future[BlockComputation] | None = None
+        self._token: CancelToken | None = None
+
+    @property
+    def pending(self) -> bool:
+        """Whether a job has been submitted whose result hasn't been polled yet."""
+        return self._future is not None
+
+    def submit(self, graph: Graph, target: Block) -> None:
+        """Start computing the target block as the graph is right now."""
+        self.cancel()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(1, thread_name_prefix="live")
+
+        snapshot = graph.snapshot()
+        self._graph = graph
+        self._snapshot = snapshot
+        self._token = CancelToken()
+        self._future = self._executor.submit(
+            snapshot.compute,
+            snapshot.get_block(target.uid),
+            None,
+            replace(self.budget, token=self._token),
+        )
+
+    def cancel(self) -> None:
+        """
+        Forget the current job. If it hasn't started it never will, otherwise
+        it stops before running its next block.
+        """
+        if self._future is not None:
+            self._future.cancel()
+        if self._token is not None:
+            self._token.cancel()
+        self._graph = self._snapshot = self._future = self._token = None
+
+    def poll(self) -> BlockComputation | None:
+        """
+        The computation of the newest job once it has finished, or None. Each
+        result is only returned once. Exceptions the computation let escape
+        are raised here, just as `Graph.compute` would have raised them.
+        """
+        future = self._future
+        if future is None or not future.done():
+            return None
+        graph, snapshot = self._graph, self._snapshot
+        self._graph = self._snapshot = self._future = self._token = None
+
+        result = future.result()
+        # Keep what the snapshot computed so the next job can skip it.
+        if graph is not None and snapshot is not None:
+            graph.adopt(snapshot)
+        return result
+
+    def close(self) -> None:
+        """Stop the worker thread, dropping any job which hasn't finished."""
+        self.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,137 @@
+"""
+Fold the constant parts of a graph ahead of time.
+
+Puzzle graphs are full of blocks which never change between test cases: the
+temporary Int/Float/String values on unconnected inputs, Pi, the puzzle's
+Constants, and any maths done only on those. `optimize` runs all of them once
+and keeps just the blocks which depend on the input block, so each evaluation
+only does the work that can actually change.
+
+Folding assumes only the config of the input blocks changes between
+evaluations. If any other block's config is edited the plan must be rebuilt,
+which is why the editor keeps using `Graph.compute` directly.
+
+If any lazy block (like Choice) is left to run the straight-line steps would
+run the inputs it skips, so `evaluate` hands those plans to `Graph.evaluate`.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Iterable
+from uuid import UUID
+
+from .graph import Graph, Block, BlockComputation, PlanStep, OperationValue, _feeding
+
+__all__ = ("OptimizedPlan", "optimize", "evaluate")
+
+
+@dataclass
+class OptimizedPlan:
+    """
+    The steps left to run for the target block once everything constant has
+    been folded. `constants` holds the folded computations the remaining steps
+    read from (and the target's own if it was folded).
+    """
+
+    graph: Graph
+    target: Block
+    steps: tuple[PlanStep, ...]
+    constants: dict[UUID, BlockComputation]
+    total: int
+    folded: int
+
+    @property
+    def lazy(self) -> bool:
+        """Whether any of the steps left to run has lazy inputs."""
+        return any(step.block.type.lazy is not None for step in self.steps)
+
+    @property
+    def dead(self) -> int:
+        """Blocks which the target doesn't depend on at all."""
+        return self.total - self.folded - len(self.steps)
+
+    @property
+    def eliminated(self) -> int:
+        return self.total - len(self.steps)
+
+    def report(self) -> str:
+        return (
+            f"{self.eliminated}/{self.total} blocks eliminated "
+            f"({self.folded} folded, {self.dead} unreachable), {len(self.steps)} left to run"
+        )
+
+
+def optimize(
+    graph: Graph, target: Block, inputs: Iterable[Block] | None = None
+) -> OptimizedPlan:
+    """
+    Fold every block in the target's plan which doesn't depend on one of the
+    input blocks (the graph's own input block by default).
+
+    A constant block which fails is left in the plan rather than folded, so the
+    failure is still reported when the plan is run.
+    """
+    if inputs is None:
+        inputs = () if graph.input_uid is None else (graph.get_block(graph.input_uid),)
+    variable = {block.uid for block in inputs}
+
+    plan = graph.get_plan(target)
+    # Inlined subgraphs put more steps in the plan than there are blocks, so
+    # count those and then the graph's blocks the plan doesn't reach.
+    planned = {step.block.uid for step in plan}
+    total = len(plan) + sum(1 for block in graph.blocks if block.uid not in planned)
+    if any(step.block.type.lazy is not None for step in plan):
+        # Lazy plans are run on demand, which never gets to the steps the target
+        # doesn't read from. Once the lazy blocks are folded nothing else would
+        # skip them.
+        feeding = _feeding(plan, target.uid)
+        plan = tuple(step for step in plan if step.block.uid in feeding)
+    results: dict[UUID, BlockComputation] = {}
+    steps: list[PlanStep] = []
+    for step in plan:
+        block = step.block
+        if block.uid in variable or any(source not in results for _, source, _ in step.inputs):
+            steps.append(step)
+            continue
+
+        try:
+            computation = block.compute(
+                **{name: results[source].outputs[output] for name, source, output in step.inputs}
+            )
+        except Exception:  # noqa: BLE001 -- what Block.compute lets escape is raised by the plan, if it runs the block at all
+            steps.append(step)
+            continue
+        if computation.exception is not None:
+            steps.append(step)
+            continue
+        results[block.uid] = computation
+
+    # Only keep the folded results something is still going to read.
+    needed = {source for step in steps for _, source, _ in step.inputs}
+    needed.add(target.uid)
+    constants = {uid: results[uid] for uid in needed if uid in results}
+
+    return OptimizedPlan(graph, target, tuple(steps), constants, total, len(results))
+
+
+def evaluate(plan: OptimizedPlan) -> BlockComputation:
+    """Run an optimized plan, returning the same BlockComputation `Graph.compute` would."""
+    target = plan.target
+    # Steps can be left beside a folded target when an inlined subgraph ignores
+    # some of its inputs, and they still have to run in case they fail.
+    if target.uid in plan.constants and not plan.steps:
+        return plan.constants[target.uid]
+    if plan.lazy:
+        return plan.graph.evaluate(target)
+
+    results = dict(plan.constants)
+    for step in plan.steps:
+        inputs: dict[str, OperationValue] = {
+            name: results[source].outputs[output] for name, source, output in step.inputs
+        }
+        result = results[step.block.uid] = step.block.compute(**inputs)
+        if result.exception is not None:
+            return BlockComputation({}, target.config.copy(), {}, result.exception)
+
+    return results[target.uid]
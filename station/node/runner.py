@@ -0,0 +1,417 @@
+"""
+Grade test cases in worker processes.
+
+The graph is serialised once, and the test cases are split into a few
+chunks per worker, each sent along with the graph. A worker only loads the
+graph the first time it sees it, going by a token made for each run rather
+than comparing the whole graph. Results come back as each chunk finishes,
+and `TestRun.poll` never blocks, so it can be called every frame without
+stalling the editor.
+
+Starting workers is slow, so the editor keeps one WorkerPool for as long as
+it is open and grades every run in it. Workers are always spawned rather
+than forked: a fork copies every lock as it is, and one held by another
+thread at the time (like the LiveEvaluator's) is never released in the child.
+
+Given a ResultCache any test case this exact graph has already been graded
+against is answered from the cache rather than sent to a worker.
+
+Given a Budget every test case is stopped once it runs out, failing with a
+BudgetExceeded exception rather than tying up its worker. Those failures are
+never cached, as a case which ran out of time might pass on a faster machine.
+
+This module is imported by the workers, so it must not import anything
+which needs a window (arcade, the gui, or the style resources).
+"""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from time import perf_counter
+from typing import Any, Callable, Sequence
+from uuid import UUID, uuid4
+
+from .graph import (
+    Graph,
+    Block,
+    BlockComputation,
+    Budget,
+    Interrupted,
+    TestCase,
+    OperationValue,
+    dumps_graph,
+    loads_graph,
+)
+from .compiler import compile_graph
+from .cache import Outcome, ResultCache, case_key, fingerprint
+from . import blocks  # noqa: F401 -- importing sets up the blocks
+
+__all__ = (
+    "TestResult",
+    "TestRun",
+    "WorkerPool",
+    "run_tests",
+    "cached_results",
+    "store_results",
+    "grade",
+)
+
+
+# -- WORKER --
+# Each worker process holds onto its own copy of the last graph it was sent.
+
+# The token for this copy of the graph, then the serialised graph, the input
+# and output block uids, and the budget.
+Task = tuple[UUID, str, UUID | None, UUID, Budget | None]
+# The index, inputs and expected outputs of a test case.
+Case = tuple[int, dict[str, OperationValue], dict[str, OperationValue]]
+
+_token: UUID | None = None
+_graph: Graph | None = None
+_input: Block | None = None
+_output: Block | None = None
+_budget: Budget | None = None
+
+
+def _initialise(
+    token: UUID, data: str, input_uid: UUID | None, output_uid: UUID, budget: Budget | None = None
+) -> None:
+    global _token, _graph, _input, _output, _budget
+    if token == _token:
+        return
+    _graph = loads_graph(data)
+    _input = None if input_uid is None else _graph.get_block(input_uid)
+    _output = _graph.get_block(output_uid)
+    _budget = budget
+    _token = token
+
+
+def _run_chunk(task: Task, cases: Sequence[Case]) -> tuple[TestResult, ...]:
+    _initialise(*task)
+    return tuple(_run_case(*case) for case in cases)
+
+
+def _run_case(
+    index: int, inputs: dict[str, OperationValue], outputs: dict[str, OperationValue]
+) -> TestResult:
+    start = perf_counter()
+    if _input is not None:
+        _input.config.update(inputs)
+    # Only the input block changes between cases, so everything else is folded.
+    variable = () if _input is None else (_input,)
+    try:
+        computation = compile_graph(_graph, _output, variable)(_budget)  # type: ignore -- set by _initialise
+    except Exception as exception:  # noqa: BLE001 -- anything the graph itself doesn't catch (like dividing by zero) fails the case rather than the rest of its chunk
+        return TestResult(
+            index, False, BlockComputation(inputs, {}, {}, exception), perf_counter() - start  # type: ignore -- reportArgumentType
+        )
+    passed = TestCase(inputs, dict(computation.outputs)) == TestCase(inputs, outputs)
+    return TestResult(index, passed, computation, perf_counter() - start)
+
+
+def grade(
+    data: str,
+    input_uid: UUID | None,
+    output_uid: UUID,
+    cases: Sequence[TestCase],
+    budget: Budget | None = None,
+) -> tuple[TestResult, ...]:
+    """
+    Load a serialised graph and grade it against every test case in this
+    process. Submitting this to a pool grades many graphs at once, one graph
+    per task, rather than one graph across the whole pool like `run_tests`.
+    The budget applies to each test case separately.
+    """
+    _initialise(uuid4(), data, input_uid, output_uid, budget)
+    return tuple(
+        _run_case(index, case.inputs, case.outputs) for index, case in enumerate(cases)
+    )
+
+
+# -- PARENT --
+
+
+class WorkerPool:
+    """
+    Worker processes which are kept around between test runs. They are only
+    started when the first task is submitted, and stop once the pool is closed.
+    If one dies they're all started again for the next task.
+    """
+
+    def __init__(self, max_workers: int | None = None) -> None:
+        self.max_workers: int | None = max_workers
+        self._executor: ProcessPoolExecutor | None = None
+
+    @property
+    def size(self) -> int:
+        """How many workers the pool runs once started."""
+        return self.max_workers or os.cpu_count() or 1
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any) -> Future[Any]:
+        if self._executor is not None:
+            try:
+                return self._executor.submit(fn, *args)
+            except BrokenProcessPool:
+                # A worker died, which breaks the whole executor, so start again.
+                self.close()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers, mp_context=get_context("spawn")
+        )
+        return self._executor.submit(fn, *args)
+
+    def close(self) -> None:
+        """Stop the workers, dropping any task which hasn't started."""
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+
+class TestResult:
+
+    def __init__(
+        self,
+        index: int,
+        passed: bool,
+        computation: BlockComputation,
+        duration: float = 0.0,
+        cached: bool = False,
+    ) -> None:
+        self.index: int = index
+        self.passed: bool = passed
+        self.computation: BlockComputation = computation
+        # Seconds spent grading the case in the worker.
+        self.duration: float = duration
+        # Whether the result came from a ResultCache rather than being graded.
+        self.cached: bool = cached
+
+
+class TestRun:
+    """
+    A set of test cases being graded by a pool of worker processes.
+    A pool the run started for itself is closed once every case has been
+    collected, a shared one is left running.
+    """
+
+    def __init__(
+        self,
+        cases: Sequence[TestCase],
+        futures: list[tuple[tuple[int, ...], Future[tuple[TestResult, ...]]]],
+        pool: WorkerPool | None,
+        cache: ResultCache | None = None,
+        key: str = "",
+    ) -> None:
+        self._cases: tuple[TestCase, ...] = tuple(cases)
+        # The indices of each chunk of cases, along with its results.
+        self._pending: list[tuple[tuple[int, ...], Future[tuple[TestResult, ...]]]] = futures
+        # Only set when the pool is the run's own.
+        self._pool: WorkerPool | None = pool
+        self._results: list[TestResult] = []
+
+        # Outcomes graded by the workers, written to the cache once the run ends.
+        self._cache: ResultCache | None = cache
+        self._key: str = key
+        self._fresh: dict[str, Outcome] = {}
+
+    @property
+    def cases(self) -> tuple[TestCase, ...]:
+        return self._cases
+
+    @property
+    def results(self) -> tuple[TestResult, ...]:
+        return tuple(self._results)
+
+    @property
+    def done(self) -> bool:
+        return not self._pending
+
+    @property
+    def passed(self) -> bool:
+        return self.done and all(result.passed for result in self._results)
+
+    def poll(self) -> list[TestResult]:
+        """
+        Collect every result which has finished since the last poll, and set
+        `complete` on its test case. Never blocks.
+        """
+        finished: list[TestResult] = []
+        pending: list[tuple[tuple[int, ...], Future[tuple[TestResult, ...]]]] = []
+        for indices, future in self._pending:
+            if not future.done():
+                pending.append((indices, future))
+                continue
+            exception = future.exception()
+            if exception is None:
+                results = future.result()
+            else:
+                # The chunk itself failed (like its worker dying), which fails
+                # its cases rather than the whole run. They're never cached, as
+                # they might well pass on another try.
+                results = tuple(
+                    TestResult(index, False, BlockComputation(self._cases[index].inputs, {}, {}, exception))  # type: ignore -- reportArgumentType
+                    for index in indices
+                )
+            for result in results:
+                case = self._cases[result.index]
+                if (
+                    self._cache is not None
+                    and exception is None
+                    and not result.cached
+                    and not isinstance(result.computation.exception, Interrupted)
+                ):
+                    computation = result.computation
+                    self._fresh[case_key(case.inputs)] = Outcome(
+                        dict(computation.outputs), computation.exception
+                    )
+                case.complete = result.passed
+                finished.append(result)
+
+        self._pending = pending
+        self._results.extend(finished)
+        if self.done:
+            self._close()
+        return finished
+
+    def wait(self) -> tuple[TestResult, ...]:
+        """Block until every test case has been graded."""
+        for _, future in self._pending:
+            future.exception()
+        self.poll()
+        return self.results
+
+    def cancel(self) -> None:
+        for _, future in self._pending:
+            future.cancel()
+        self._pending = []
+        self._close()
+
+    def _close(self) -> None:
+        if self._cache is not None and self._fresh:
+            self._cache.put(self._key, self._fresh)
+            self._fresh = {}
+        if self._pool is None:
+            return
+        self._pool.close()
+        self._pool = None
+
+
+def _resolve(
+    graph: Graph, input_block: Block | None, output_block: Block | None
+) -> tuple[Block | None, Block]:
+    input_uid = input_block.uid if input_block is not None else graph.input_uid
+    output_uid = output_block.uid if output_block is not None else graph.output_uid
+    if output_uid is None:
+        raise ValueError(f"Graph {graph.name} has no output block to test")
+    return None if input_uid is None else graph.get_block(input_uid), graph.get_block(output_uid)
+
+
+def _cache_key(graph: Graph, input_block: Block | None, output_block: Block) -> str:
+    return fingerprint(graph, output_block, () if input_block is None else (input_block,))
+
+
+def _cached(
+    key: str, cases: Sequence[TestCase], cache: ResultCache
+) -> dict[int, TestResult]:
+    outcomes = cache.get(key)
+    found: dict[int, TestResult] = {}
+    for index, case in enumerate(cases):
+        outcome = outcomes.get(case_key(case.inputs))
+        if outcome is None:
+            continue
+        passed = outcome.error is None and TestCase(case.inputs, outcome.outputs) == TestCase(
+            case.inputs, case.outputs
+        )
+        computation = BlockComputation(case.inputs, {}, outcome.outputs, outcome.error)
+        found[index] = TestResult(index, passed, computation, cached=True)
+    return found
+
+
+def cached_results(
+    graph: Graph,
+    cases: Sequence[TestCase],
+    cache: ResultCache,
+    input_block: Block | None = None,
+    output_block: Block | None = None,
+) -> tuple[TestResult, ...]:
+    """
+    The results of every test case this graph has already been graded
+    against, without grading anything. Sets `complete` on those test cases.
+    """
+    input_block, output_block = _resolve(graph, input_block, output_block)
+    found = _cached(_cache_key(graph, input_block, output_block), cases, cache)
+    for index, result in found.items():
+        cases[index].complete = result.passed
+    return tuple(found.values())
+
+
+def store_results(
+    graph: Graph,
+    cases: Sequence[TestCase],
+    results: Sequence[TestResult],
+    cache: ResultCache,
+    input_block: Block | None = None,
+    output_block: Block | None = None,
+) -> None:
+    """Store results graded some other way (like with `grade`) in the cache."""
+    input_block, output_block = _resolve(graph, input_block, output_block)
+    cache.put(
+        _cache_key(graph, input_block, output_block),
+        {
+            case_key(cases[result.index].inputs): Outcome(
+                dict(result.computation.outputs), result.computation.exception
+            )
+            for result in results
+            if not (result.cached or isinstance(result.computation.exception, Interrupted))
+        },
+    )
+
+
+def run_tests(
+    graph: Graph,
+    cases: Sequence[TestCase],
+    input_block: Block | None = None,
+    output_block: Block | None = None,
+    max_workers: int | None = None,
+    cache: ResultCache | None = None,
+    budget: Budget | None = None,
+    pool: WorkerPool | None = None,
+) -> TestRun:
+    """
+    Start grading every test case against the output block in a pool of
+    worker processes. The input and output blocks default to the graph's own.
+    Cases already in the cache finish straight away, and if every case is
+    cached no workers are started at all. The budget applies to each test
+    case separately, and can't hold a CancelToken as it's sent to the workers.
+
+    Without a pool the run starts one of `max_workers` workers just for itself.
+    """
+    input_block, output_block = _resolve(graph, input_block, output_block)
+    key = "" if cache is None else _cache_key(graph, input_block, output_block)
+    found = {} if cache is None else _cached(key, cases, cache)
+
+    workers = pool if pool is not None else WorkerPool(max_workers)
+    futures: list[tuple[tuple[int, ...], Future[tuple[TestResult, ...]]]] = []
+    if found:
+        done: Future[tuple[TestResult, ...]] = Future()
+        done.set_result(tuple(found.values()))
+        futures.append((tuple(found), done))
+
+    graded = [(index, case.inputs, case.outputs) for index, case in enumerate(cases) if index not in found]
+    if graded:
+        task: Task = (
+            uuid4(),
+            dumps_graph(graph),
+            None if input_block is None else input_block.uid,
+            output_block.uid,
+            budget,
+        )
+        # A few chunks per worker, so a slow chunk doesn't hold up the rest of the run.
+        size = -(-len(graded) // (workers.size * 4))
+        for start in range(0, len(graded), size):
+            chunk = graded[start:start + size]
+            futures.append((tuple(index for index, _, _ in chunk), workers.submit(_run_chunk, task, chunk)))
+    # A pool started just for this run is closed along with it.
+    return TestRun(cases, futures, None if pool is not None else workers, cache, key)
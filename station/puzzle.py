@@ -83,7 +83,12 @@ def load_puzzle(path: Path) -> Puzzle:
         const_types = {name: TYPE_CAST[type(value)] for name, value in const_data.items()}
         const_values = {name: const_types[name](value) for name, value in const_data.items()}
         const_type = BlockType(
-            "Constant", _variable, outputs=const_types.copy(), config=const_types.copy(), exclusive=True
+            "Constant",
+            _variable,
+            outputs=const_types.copy(),
+            config=const_types.copy(),
+            exclusive=True,
+            category="Values",
         )
     else:
         const_values = {}
@@ -171,6 +176,9 @@ class PuzzleCollection:
     def get_puzzle(self, name: str) -> Puzzle:
         return self._puzzles[name]
 
+    def get_puzzles(self) -> tuple[Puzzle, ...]:
+        return tuple(self._puzzles.values())
+
 
 with path(pzls, "puzzles.cfg") as pth:
     puzzles = PuzzleCollection(pth)
@@ -0,0 +1,223 @@
+"""
+Grade saved puzzle solutions without opening the game.
+
+    python -m station.verify saves/ --output report.json
+
+Every path can be a save (`.svd`), a single solution (`.blk`), or a directory
+of either. Solutions in a save are matched to their puzzle through the save's
+config, and loose solutions by their file name (which is how the game names
+them) or the title it writes into them. Sandbox graphs have no puzzle so they
+are skipped.
+
+Every solution is graded against each test case of its puzzle in one shared
+pool of worker processes, its cases split into chunks (see `run_tests`), so
+an error one case doesn't catch only fails that case. A JSON report of what passed, what failed, and how long
+it all took is written out. The exit code is 1 if anything didn't pass.
+
+With `--cache` solutions which were already graded against every one of
+their puzzle's test cases are reported from the cache instead. `--seconds`,
+`--steps` and `--memory` limit each test case, so one runaway solution fails
+rather than holding up the rest.
+"""
+
+from __future__ import annotations
+
+import json
+import zipfile
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from pathlib import Path
+from time import perf_counter
+from tomllib import load, loads
+from typing import TYPE_CHECKING, Any, Sequence
+
+from station.node.graph import Budget, loads_graph
+from station.node.cache import ResultCache
+from station.node.runner import TestResult, TestRun, WorkerPool, run_tests
+
+if TYPE_CHECKING:
+    from station.puzzle import Puzzle, PuzzleCollection
+
+__all__ = ("Solution", "find_solutions", "verify", "main")
+
+
+@dataclass
+class Solution:
+    source: str
+    puzzle: str | None
+    data: str
+
+
+def find_solutions(path: Path) -> list[Solution]:
+    """Find every puzzle solution in a save, a solution file, or a directory of either."""
+    if path.is_dir():
+        found: list[Solution] = []
+        for child in sorted(path.iterdir()):
+            if child.suffix in (".svd", ".blk"):
+                found.extend(find_solutions(child))
+        return found
+
+    if path.suffix == ".svd":
+        found = []
+        with zipfile.ZipFile(path, "r") as archive:
+            with archive.open("save.cfg", "r") as fp:
+                cfg = load(fp)
+            for table in ("Complete", "Incomplete"):
+                for name, item in cfg.get(table, {}).items():
+                    data = archive.read(item).decode("utf-8")
+                    found.append(Solution(f"{path}:{item}", name, data))
+        return found
+
+    return [Solution(str(path), None, path.read_text(encoding="utf-8"))]
+
+
+def _match(solution: Solution, puzzles: PuzzleCollection) -> Puzzle | None:
+    if solution.puzzle is not None:
+        try:
+            return puzzles.get_puzzle(solution.puzzle)
+        except KeyError:
+            return None
+
+    stem = Path(solution.source).stem
+    title = loads(solution.data).get("Config", {}).get("name", None)
+    for puzzle in puzzles.get_puzzles():
+        if puzzle.name == stem or puzzle.title == title:
+            return puzzle
+    return None
+
+
+def _case_report(result: TestResult) -> dict[str, Any]:
+    exception = result.computation.exception
+    return {
+        "index": result.index,
+        "passed": result.passed,
+        "duration": result.duration,
+        "error": None if exception is None else repr(exception),
+    }
+
+
+def _finish(report: dict[str, Any], results: Sequence[TestResult]) -> None:
+    report["cases"] = [_case_report(result) for result in results]
+    report["duration"] = sum(result.duration for result in results)
+    report["status"] = "passed" if all(result.passed for result in results) else "failed"
+
+
+def verify(
+    paths: Sequence[Path],
+    puzzles: PuzzleCollection,
+    max_workers: int | None = None,
+    cache: ResultCache | None = None,
+    budget: Budget | None = None,
+) -> dict[str, Any]:
+    """Grade every solution found in the paths, and build the report."""
+    start = perf_counter()
+    reports: list[dict[str, Any]] = []
+    pending: list[tuple[dict[str, Any], TestRun]] = []
+
+    pool = WorkerPool(max_workers)
+    try:
+        for path in paths:
+            for solution in find_solutions(path):
+                report: dict[str, Any] = {
+                    "source": solution.source,
+                    "puzzle": solution.puzzle,
+                    "status": "skipped",
+                    "error": None,
+                    "cached": False,
+                    "duration": 0.0,
+                    "cases": [],
+                }
+                reports.append(report)
+
+                puzzle = _match(solution, puzzles)
+                if puzzle is None:
+                    report["error"] = "no matching puzzle"
+                    continue
+                report["puzzle"] = puzzle.name
+
+                try:
+                    graph = loads_graph(solution.data)
+                    input_uid = output_uid = None
+                    for block in graph.blocks:
+                        if input_uid is None and block.type.name == puzzle.input_type.name:
+                            input_uid = block.uid
+                        if output_uid is None and block.type.name == puzzle.output_type.name:
+                            output_uid = block.uid
+                    if output_uid is None:
+                        raise ValueError("missing an output block")
+                except Exception as e:  # noqa: BLE001 -- any broken save is reported, not fatal
+                    report["status"] = "error"
+                    report["error"] = repr(e)
+                    continue
+
+                graph.input_uid, graph.output_uid = input_uid, output_uid
+                run = run_tests(graph, puzzle.tests, cache=cache, budget=budget, pool=pool)
+                pending.append((report, run))
+
+        for report, run in pending:
+            # Results come back as their chunks finish, so they're put back in order.
+            results = sorted(run.wait(), key=lambda result: result.index)
+            report["cached"] = all(result.cached for result in results)
+            _finish(report, results)
+    finally:
+        pool.close()
+
+    statuses = [report["status"] for report in reports]
+    return {
+        "puzzles": {
+            puzzle.name: {"title": puzzle.title, "tests": len(puzzle.tests)}
+            for puzzle in puzzles.get_puzzles()
+        },
+        "solutions": reports,
+        "summary": {
+            "solutions": len(reports),
+            "passed": statuses.count("passed"),
+            "failed": statuses.count("failed"),
+            "errors": statuses.count("error"),
+            "skipped": statuses.count("skipped"),
+            "duration": perf_counter() - start,
+        },
+    }
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = ArgumentParser(
+        prog="python -m station.verify",
+        description="Grade saved puzzle solutions without opening the game.",
+    )
+    parser.add_argument("paths", nargs="+", type=Path, help="saves, solutions, or directories of either")
+    parser.add_argument("--puzzles", type=Path, default=None, help="directory of .pzl files (defaults to the game's)")
+    parser.add_argument("--output", type=Path, default=Path("verify.json"), help="where to write the report")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--cache", type=Path, default=None, help="directory to cache results in between runs")
+    parser.add_argument("--seconds", type=float, default=None, help="most seconds each test case may take")
+    parser.add_argument("--steps", type=int, default=None, help="most blocks each test case may run")
+    parser.add_argument("--memory", type=int, default=None, help="most bytes of values each test case may produce")
+    args = parser.parse_args(argv)
+
+    # Imported here rather than at the top so the worker processes never load
+    # the puzzles (and the style resources they bring with them).
+    from station.puzzle import PuzzleCollection, puzzles
+
+    if args.puzzles is not None:
+        puzzles = PuzzleCollection(args.puzzles / "puzzles.cfg")
+
+    cache = None if args.cache is None else ResultCache(args.cache)
+    budget = None
+    if (args.seconds, args.steps, args.memory) != (None, None, None):
+        budget = Budget(args.steps, args.seconds, args.memory)
+    report = verify(args.paths, puzzles, args.workers, cache, budget)
+    with open(args.output, "w", encoding="utf-8") as fp:
+        json.dump(report, fp, indent=2)
+
+    summary = report["summary"]
+    print(
+        f"{summary['passed']}/{summary['solutions']} solutions passed "
+        f"({summary['failed']} failed, {summary['errors']} errors, {summary['skipped']} skipped) "
+        f"in {summary['duration']:.2f}s, report written to {args.output}"
+    )
+    return 0 if summary["passed"] == summary["solutions"] - summary["skipped"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
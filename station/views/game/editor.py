@@ -10,7 +10,8 @@ from arcade.future import background
 
 from resources import style, audio
 
-from station.node import graph
+from station.node import graph, runner
+from station.node.live import LiveEvaluator
 from station.controller import (
     GraphController,
     read_graph,
@@ -115,12 +116,20 @@ class Editor:
         self._pan_camera: bool = False
         self._hovered_block: gui.BlockElement | None = None
         self._results: gui.ResultsPanel | None = None
+        # The output block is computed on a worker thread, see `update`.
+        self._live: LiveEvaluator = LiveEvaluator()
         self._test_runner: gui.TestRunner | None = None
+        self._test_run: runner.TestRun | None = None
+        # Started on the first run of the tests and kept until the editor closes.
+        self._workers: runner.WorkerPool = runner.WorkerPool()
 
         if self._puzzle is not None:
             self._test_runner = gui.TestRunner(self._puzzle.tests)
             self._test_runner.update_position((300.0, 50.0))
             self._gui.add_element(self._test_runner)
+            # Show how the solution did last time without grading it again.
+            runner.cached_results(self._graph, self._puzzle.tests, context.results)
+            self._test_runner.check_test_output()
 
         # Drag Block
         self._selected_block: gui.BlockElement | None = None
@@ -223,18 +232,27 @@ class Editor:
             self._gui.remove_element(self._save_popup)
             self._save_popup = None
 
+        if self._graph.output_uid is None:
+            self._live.cancel()
+            if self._results is not None:
+                self._gui.remove_element(self._results)
+                self._results = None
+            return
+
+        # Replaces any older job still waiting. The last results stay up until
+        # the new ones are ready so the panel doesn't flicker between edits.
+        output = self._controller.get_block(self._graph.output_uid)
+        self._live.submit(self._graph, output.block)
+
+    def show_results(self, rslt: graph.BlockComputation) -> None:
         if self._results is not None:
             self._gui.remove_element(self._results)
             self._results = None
 
-        if self._graph.output_uid is None:
+        if self._graph.output_uid is None or not rslt.outputs:
             return
 
         output = self._controller.get_block(self._graph.output_uid)
-        rslt = self._graph.compute(output.block)
-        if not rslt.outputs:
-            return
-
         self._results = gui.ResultsPanel(rslt)
         self._results.update_position(
             (
@@ -306,11 +324,14 @@ class Editor:
         dx = style.format.padding if right else -style.format.padding
         dy = style.format.padding if top else -style.format.padding
 
-        self._block_popup = util.SelectionPopup(
-            tuple(
-                util.PopupAction(typ.name, self.create_new_block, typ, pos)
-                for typ in self._graph.available
-            ),
+        self._block_popup = util.SelectionPopup.grouped(
+            {
+                category: tuple(
+                    util.PopupAction(typ.name, self.create_new_block, typ, pos)
+                    for typ in types
+                )
+                for category, types in graph.categorise(self._graph.available).items()
+            },
             (pos[0] + dx, pos[1] + dy),
             top,
             right,
@@ -376,24 +397,19 @@ class Editor:
                     test.complete = case == test
                     self._test_runner.check_test_output()
                 elif self._test_runner.over_run_all(o_cursor):
-                    tests = self._test_runner.get_tests()
+                    if self._test_run is not None:
+                        self._test_run.cancel()
                     inp = self._controller.get_block(self._graph.input_uid)
                     out = self._controller.get_block(self._graph.output_uid)
-                    full_success = True
-                    for test in tests:
-                        inp.update_config(test.inputs)
-                        rslt = self._graph.compute(out.block)
-                        case = graph.TestCase(test.inputs, rslt.outputs)
-                        test.complete = case == test
-                        full_success = full_success and test.complete
-                        if not full_success:
-                            break
-
-                    self._test_runner.check_test_output()
-
-                    if full_success:
-                        context.complete_puzzle(self._puzzle, self._controller)
-                        return
+                    # Graded in worker processes, results are picked up in update.
+                    self._test_run = runner.run_tests(
+                        self._graph,
+                        self._test_runner.get_tests(),
+                        inp.block,
+                        out.block,
+                        cache=context.results,
+                        pool=self._workers,
+                    )
                 return
 
         # Find if we are hovering over a temp block
@@ -531,6 +547,9 @@ class Editor:
                 self.set_mode_none()
                 return
             connection = self._incomplete_connection._connection
+            if self._controller.graph.creates_cycle(connection.source, hovered_block.uid):
+                self.set_mode_none()
+                return
             connection.target = hovered_block.uid
             connection.input = name
 
@@ -792,7 +811,26 @@ class Editor:
     def save_graph_on_update(self, delta_time: float) -> None:
         self._save_popup.update()
 
+    def test_run_on_update(self, delta_time: float) -> None:
+        if self._test_run.poll():
+            self._test_runner.check_test_output()
+
+        if not self._test_run.done:
+            return
+
+        success = self._test_run.passed
+        self._test_run = None
+        if success:
+            context.complete_puzzle(self._puzzle, self._controller)
+
     def update(self, delta_time: float) -> None:
+        if self._test_run is not None:
+            self.test_run_on_update(delta_time)
+
+        rslt = self._live.poll()
+        if rslt is not None:
+            self.show_results(rslt)
+
         match self._mode:
             case EditorMode.CHANGE_CONFIG:
                 self.edit_config_on_update(delta_time)
@@ -814,6 +852,13 @@ class Editor:
         pos: Vec3 = self._overlay_camera.unproject(self.get_cursor_pos())
         return pos.x, pos.y
 
+    def close(self) -> None:
+        self._live.close()
+        if self._test_run is not None:
+            self._test_run.cancel()
+            self._test_run = None
+        self._workers.close()
+
     def create_new_block(
         self, typ: graph.BlockType, position: tuple[float, float]
     ) -> gui.BlockElement:
@@ -918,6 +963,7 @@ class EditorFrame(Frame):
             return
 
         closing_editor = self._editors.pop(name)
+        closing_editor.close()
         self._editor_tabs.rem_tab(self._editor_tabs.get_tab(name))
         if self._active_editor.name == name:
             self.select_editor(tuple(self._editors)[0])
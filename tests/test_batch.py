@@ -0,0 +1,46 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from station.node.graph import StrValue  # noqa: E402 -- after the skip
+from station.node.fuzz import Spec  # noqa: E402
+from station.node import batch, blocks  # noqa: E402
+
+
+def test_failed_row() -> None:
+    # Ord of an empty string raises an IndexError, which should only fail that row.
+    spec = Spec(
+        inputs={"char": StrValue("a")},
+        blocks=[(blocks.OrdBlock, {})],
+        wires={(0, "char"): (-1, "char")},
+        outputs={"code": (0, "code")},
+        name="ord",
+    )
+    graph, input_block, output_block = spec.build()
+    inputs = {"char": batch.Column.from_values([StrValue("a"), StrValue(""), StrValue("c")])}
+
+    result = batch.evaluate(graph, output_block, input_block, inputs, 3)
+    assert result.errors.tolist() == [False, True, False]
+    values = result.outputs["code"].values()
+    assert [values[0].value, values[2].value] == [97, 99]
+
+
+def test_escaping_error() -> None:
+    # A bad pattern raises re.error, which escapes the interpreter but still fails the case.
+    spec = Spec(
+        inputs={"string": StrValue("abc"), "pattern": StrValue("a")},
+        blocks=[(blocks.MatchBlock, {})],
+        wires={(0, "string"): (-1, "string"), (0, "pattern"): (-1, "pattern")},
+        outputs={"match": (0, "result")},
+        name="match",
+    )
+    graph, input_block, output_block = spec.build()
+    inputs = {
+        "string": batch.Column.from_values([StrValue("abc")] * 3),
+        "pattern": batch.Column.from_values([StrValue("a"), StrValue("("), StrValue("z")]),
+    }
+
+    result = batch.evaluate(graph, output_block, input_block, inputs, 3)
+    assert result.errors.tolist() == [False, True, False]
+    values = result.outputs["match"].values()
+    assert [values[0].value, values[2].value] == [True, False]
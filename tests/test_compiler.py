@@ -0,0 +1,36 @@
+from station.node.graph import Graph, Block, Connection, FloatValue, FloatBlock, define_subgraph
+from station.node.compiler import compile_graph
+from station.node.fuzz import Spec
+from station.node import blocks
+
+
+def _double() -> Graph:
+    spec = Spec(
+        inputs={"x": FloatValue(0.0)},
+        blocks=[(blocks.AddBlock, {})],
+        wires={(0, "a"): (-1, "x"), (0, "b"): (-1, "x")},
+        outputs={"y": (0, "result")},
+        name="double",
+    )
+    return spec.build()[0]
+
+
+def test_subgraph_target() -> None:
+    double = define_subgraph("Double", _double())
+    graph = Graph("chain", sandbox=True)
+    source = Block(FloatBlock, value=FloatValue(1.5))
+    graph.add_block(source)
+    previous, output = source, "value"
+    for _ in range(3):
+        block = Block(double)
+        graph.add_block(block)
+        graph.add_connection(Connection(previous.uid, output, block.uid, "x"))
+        previous, output = block, "y"
+
+    expected = graph.compute(previous)
+    compiled = compile_graph(graph, previous)()
+    assert compiled.exception is None
+    assert compiled.outputs["y"].value == expected.outputs["y"].value == 12.0
+    assert {name: value.value for name, value in compiled.inputs.items()} == {
+        name: value.value for name, value in expected.inputs.items()
+    }
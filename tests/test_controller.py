@@ -0,0 +1,50 @@
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+arcade = pytest.importorskip("arcade")
+
+from station.node.graph import Block, BlockType, Connection, IntValue, _variable  # noqa: E402 -- after the skip
+from station.node import blocks  # noqa: E402
+from station.gui.core import Gui  # noqa: E402
+from station.gui.graph import BlockElement  # noqa: E402
+from station.controller import GraphController, read_graph, write_graph  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def gui() -> Iterator[Gui]:
+    window = arcade.Window(visible=False)
+    yield Gui(arcade.Camera2D())
+    window.close()
+
+
+def test_round_trip(gui: Gui, tmp_path: Path) -> None:
+    input_type = BlockType(
+        "Input", _variable, outputs={"x": IntValue}, config={"x": IntValue}, exclusive=True
+    )
+    output_type = BlockType("Output", _variable, inputs={"y": IntValue}, exclusive=True)
+    input_block = Block(input_type, x=IntValue(3))
+    add_block = Block(blocks.AddBlock)
+    output_block = Block(output_type)
+
+    controller = GraphController(gui, "round trip", sandbox=True)
+    for block in (input_block, add_block, output_block):
+        controller.add_block(BlockElement(block), add_temp=False)
+    graph = controller.graph
+    graph.add_connection(Connection(input_block.uid, "x", add_block.uid, "a"))
+    graph.add_connection(Connection(input_block.uid, "x", add_block.uid, "b"))
+    graph.add_connection(Connection(add_block.uid, "result", output_block.uid, "y"))
+
+    path = tmp_path / "round_trip.blk"
+    write_graph(controller, path)
+    loaded = read_graph(path, gui, sandbox=True).graph
+
+    assert {block.uid: block.type.name for block in loaded.blocks} == {
+        block.uid: block.type.name for block in graph.blocks
+    }
+    assert loaded.get_block(input_block.uid).config["x"].value == 3
+    assert {
+        (c.source, c.output, c.target, c.input) for c in loaded.connections
+    } == {(c.source, c.output, c.target, c.input) for c in graph.connections}
+    assert loaded.compute(loaded.get_block(output_block.uid)).inputs["y"].value == 6